@@ -26,21 +26,114 @@ GEMINI_IMAGE_CONFIG = {
     "timeout": 120,
 }
 
+# 批量生成图片配置
+IMAGE_BATCH_CONFIG = {
+    "max_concurrency": 4,  # 同一批次同时进行的生成请求数
+    "max_images": 8,  # 单个批次最多生成的图片数
+}
+
+# 批量生成视频配置（提示词 × 参数矩阵，由提交调度器按速率提交给服务商）
+VIDEO_BATCH_CONFIG = {
+    "max_items": 24,  # 单个批次最多生成的视频数
+    "submits_per_minute": 6,  # 提交速率上限（所有 worker 共享）
+    "burst": 2,  # 允许连续提交的次数
+    "max_attempts": 3,  # 单个任务提交失败时的最大尝试次数
+    "retry_backoff_seconds": 10,  # 提交失败后暂停所有提交的时间，逐次翻倍
+    "heartbeat_seconds": 15,  # 调度器续约已领取任务、检查中断任务的间隔
+    "claim_lease_seconds": 60,  # 已领取任务超过该时间未续约视为领取的 worker 已退出
+}
+
+# 视频续写链配置（尾帧 → 下一段 → 拼接）
+CHAIN_CONFIG = {
+    "max_segments": 6,  # 单条续写链最多生成的段数
+}
+
 # 轮询配置
 POLL_CONFIG = {
     "max_attempts": 120,  # 最大轮询次数
     "interval_seconds": 5,  # 轮询间隔（秒）
 }
 
+# 视频帧提取配置
+FRAME_CONFIG = {
+    "process_workers": 2,  # 解码进程数（OpenCV 解码在进程池中执行，不阻塞事件循环）
+    "cache_max_bytes": 64 * 1024 * 1024,  # 帧缓存容量上限（LRU 淘汰）
+    "download_timeout": 30,  # 非本地视频的下载超时（秒）
+}
+
+# 缩略图配置（首次请求时生成并缓存到磁盘）
+THUMBNAIL_CONFIG = {
+    "widths": [256, 512, 1024],  # 固定宽度档位
+    "format": "webp",  # webp / jpeg
+    "quality": 80,
+    "cache_max_bytes": 1024 * 1024 * 1024,  # 缓存目录容量上限，超出时按最久未访问淘汰
+}
+
+# 图片上传配置
+UPLOAD_CONFIG = {
+    "max_bytes": 20 * 1024 * 1024,  # 单个上传文件大小上限，边接收边校验
+    "chunk_size": 1024 * 1024,  # 流式写盘的分块大小
+}
+
+# 参考图片预处理配置（提交服务商前缩放、去除元数据并重新编码，最大边长由各服务商类声明）
+REFERENCE_IMAGE_CONFIG = {
+    "jpeg_quality": 90,
+    "cache_max_bytes": 64 * 1024 * 1024,  # 预处理后 base64 的内存缓存上限（图生图连续编辑复用）
+    "remote_cache_entries": 512,  # 记录 ETag/Last-Modified 的远程图片数量上限
+    "fetch_timeout": 30,  # 远程图片下载超时（秒）
+}
+
+# 图床发布配置（上传接口先返回本地URL，后台发布到图床）
+PUBLISH_CONFIG = {
+    "max_attempts": 3,  # 发布失败重试次数
+    "retry_backoff_seconds": 2,  # 首次重试间隔，之后指数翻倍
+    "wait_timeout_seconds": 60,  # 图生视频等待发布完成的最长时间
+}
+
+# 签名媒体URL配置：后端直接向服务商提供参考图片，替代 GitHub 图床
+# base_url 为服务商可访问的本服务地址（本地测试可设为 http://127.0.0.1:8002），
+# base_url 和 secret 均配置时启用
+SIGNED_URL_CONFIG = {
+    "base_url": os.environ.get("MEDIA_PUBLIC_BASE_URL"),
+    "secret": os.environ.get("MEDIA_URL_SECRET"),  # 多 worker 需使用同一密钥
+    "expires_seconds": 6 * 3600,  # 签名有效期，需覆盖服务商排队+生成时间
+}
+
+# 媒体文件回收配置
+MEDIA_GC_CONFIG = {
+    "interval_seconds": 3600,  # 回收周期（秒）
+    "grace_seconds": 3600,  # 新文件保护期：刚上传/下载、尚未写入消息的文件不回收
+    "batch_size": 50,  # 每批删除的文件数
+    "batch_interval_seconds": 1.0,  # 批次间隔（秒），限制删除速率
+    "max_total_bytes": 20 * 1024 ** 3,  # uploads+downloads 总容量上限，超出时淘汰最久未访问的媒体；None 不限制
+}
+
+# Prometheus 指标配置
+METRICS_CONFIG = {
+    # 多 worker 时各进程把指标写入此目录，/metrics 汇总（production.py 启动时清空）
+    "multiproc_dir": os.path.join(os.path.dirname(os.path.dirname(__file__)), "metrics"),
+    "sample_interval_seconds": 15,  # 线程池、队列、进行中任务数的采样周期（秒）
+}
+
+# 请求耗时追踪配置
+TRACING_CONFIG = {
+    "slow_request_ms": 1000,  # 超过此耗时的请求打印分段耗时并记入慢请求记录
+    "slow_trace_buffer": 200,  # 每个 worker 保留的最近慢请求条数
+    "max_spans_per_trace": 100,  # 单个请求记录的分段明细上限（汇总不受限制）
+}
+
 # 服务器配置
 SERVER_CONFIG = {
     "host": "0.0.0.0",  # 生产环境绑定所有IP
     "port": 8002,
     "uploads_dir": os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads"),
     "downloads_dir": os.path.join(os.path.dirname(os.path.dirname(__file__)), "downloads"),
+    "derived_dir": os.path.join(os.path.dirname(os.path.dirname(__file__)), "derived"),  # 封面帧、尾帧等派生文件
+    "thumbnails_dir": os.path.join(os.path.dirname(os.path.dirname(__file__)), "thumbnails"),  # 缩略图缓存
 }
 
 # 数据库配置
 DATABASE_CONFIG = {
-    "url": "sqlite:///./video_gen.db",
+    "url": "sqlite:///./video_gen.db",  # 同步引擎：后台轮询线程使用
+    "async_url": "sqlite+aiosqlite:///./video_gen.db",  # 异步引擎：路由使用，不占用线程池
 }
@@ -1,7 +1,8 @@
 """
 数据库连接和会话管理
 """
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -14,6 +15,12 @@ engine = create_engine(
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 异步引擎（aiosqlite），数据库 I/O 不阻塞事件循环
+async_engine = create_async_engine(DATABASE_CONFIG["async_url"])
+
+# expire_on_commit=False：commit 后仍可直接读取属性，避免在事件循环里触发隐式加载
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 
@@ -26,7 +33,51 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """获取异步数据库会话"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def migrate_schema():
+    """
+    补齐已有表缺失的列和索引（create_all 不会修改已存在的表）
+
+    Returns:
+        新增的列，格式为 {"表名": ["列名", ...]}
+    """
+    inspector = inspect(engine)
+    added = {}
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}"))
+                added.setdefault(table.name, []).append(column.name)
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+    for table_name, columns in added.items():
+        print(f"[数据库] {table_name} 新增列: {', '.join(columns)}")
+    return added
+
+
 def init_db():
     """初始化数据库表"""
-    from models import Session, Message  # noqa
+    from models import Session, Message, MediaObject, RateLimit, VideoChain  # noqa
     Base.metadata.create_all(bind=engine)
+    added = migrate_schema()
+
+    # 新增的会话摘要列需要按现有消息回填
+    if "sessions" in added:
+        from services.session_summary import rebuild_all_session_summaries
+        db = SessionLocal()
+        try:
+            rebuild_all_session_summaries(db)
+            db.commit()
+        finally:
+            db.close()
@@ -4,12 +4,18 @@ FastAPI 主入口
 import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 
-from database import init_db
-from routes import sessions, generate, image
+from database import init_db, async_engine
+from services.frame_extractor import shutdown_frame_executor
+from services.reference_image import close_reference_client
+from services.submission_scheduler import start_submission_scheduler, stop_submission_scheduler
+from services.media_store import UploadSizeLimitMiddleware
+from services.tracing import TracingMiddleware
+from services.metrics import start_metrics_sampler, stop_metrics_sampler
+from routes import sessions, generate, image, admin, media, metrics
 from config import SERVER_CONFIG
 from tasks.task_recovery import start_recovery_daemon
+from tasks.media_gc import start_media_gc_daemon
 
 # 创建FastAPI应用
 app = FastAPI(
@@ -19,6 +25,8 @@ app = FastAPI(
 )
 
 # CORS配置（允许前端访问）
+# 在 CORS 内层，超限时的 413 响应同样带跨域头
+app.add_middleware(UploadSizeLimitMiddleware, paths=("/api/generate/upload-image",))
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -26,20 +34,24 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# 最后添加的中间件在最外层，追踪覆盖整个请求
+app.add_middleware(TracingMiddleware)
 
 # 注册路由
 app.include_router(sessions.router)
 app.include_router(generate.router)
 app.include_router(image.router)
+app.include_router(admin.router)
+app.include_router(media.router)
+app.include_router(media.files_router)
+app.include_router(metrics.router)
 
-# 静态文件服务（上传的图片和下载的视频）
+# 上传的图片和下载的视频由 media.files_router 提供（immutable 缓存 + Range）
 uploads_dir = SERVER_CONFIG["uploads_dir"]
 downloads_dir = SERVER_CONFIG["downloads_dir"]
 os.makedirs(uploads_dir, exist_ok=True)
 os.makedirs(downloads_dir, exist_ok=True)
 
-app.mount("/uploads", StaticFiles(directory=uploads_dir), name="uploads")
-app.mount("/downloads", StaticFiles(directory=downloads_dir), name="downloads")
 
 
 @app.on_event("startup")
@@ -48,14 +60,27 @@ def startup():
     init_db()
     # 启动任务恢复守护线程
     start_recovery_daemon()
+    # 启动媒体回收守护线程
+    start_media_gc_daemon()
+    # 启动批量任务提交调度器
+    start_submission_scheduler()
+    # 启动指标采样（线程池、队列、进行中任务数）
+    start_metrics_sampler()
 
 
 @app.on_event("shutdown")
-def shutdown():
+async def shutdown():
     """应用关闭时清理资源"""
     print("[关闭] 正在停止后台任务...")
     from tasks.task_recovery import stop_recovery_daemon
+    from tasks.media_gc import stop_media_gc_daemon
     stop_recovery_daemon()
+    stop_media_gc_daemon()
+    await stop_submission_scheduler()
+    await stop_metrics_sampler()
+    shutdown_frame_executor()
+    await close_reference_client()
+    await async_engine.dispose()
     print("[关闭] 清理完成")
 
 
@@ -2,7 +2,7 @@
 数据模型定义
 """
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Enum
+from sqlalchemy import Column, Integer, Float, String, Text, DateTime, ForeignKey, Enum
 from sqlalchemy.orm import relationship
 import enum
 
@@ -35,9 +35,18 @@ class Session(Base):
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(255), default="新会话")
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+    # 列表摘要（写消息时维护，避免会话列表逐个查询消息）
+    message_count = Column(Integer, default=0)
+    pending_count = Column(Integer, default=0)  # 未完成的生成任务数
+    last_message_preview = Column(String(100), nullable=True)
+    last_message_at = Column(DateTime, nullable=True)
+    last_media_url = Column(Text, nullable=True)  # 最近一条成功的图片/视频
+    last_media_type = Column(String(20), nullable=True)
 
     messages = relationship("Message", back_populates="session", cascade="all, delete-orphan")
+    chains = relationship("VideoChain", cascade="all, delete-orphan")
 
 
 class Message(Base):
@@ -45,7 +54,7 @@ class Message(Base):
     __tablename__ = "messages"
 
     id = Column(Integer, primary_key=True, index=True)
-    session_id = Column(Integer, ForeignKey("sessions.id"), nullable=False)
+    session_id = Column(Integer, ForeignKey("sessions.id"), nullable=False, index=True)
     role = Column(String(20), default=MessageRole.USER)
     content_type = Column(String(20), default=MessageContentType.TEXT)
     content = Column(Text)  # 文本内容或图片路径
@@ -57,12 +66,76 @@ class Message(Base):
     local_path = Column(Text, nullable=True)  # 本地下载路径
     error_message = Column(Text, nullable=True)  # 错误信息
     
+    # 下载后处理结果（封面帧、尾帧、视频元数据）
+    poster_url = Column(Text, nullable=True)
+    last_frame_url = Column(Text, nullable=True)
+    video_duration = Column(Float, nullable=True)  # 实际时长（秒）
+    video_fps = Column(Float, nullable=True)
+    video_width = Column(Integer, nullable=True)
+    video_height = Column(Integer, nullable=True)
+    video_bytes = Column(Integer, nullable=True)
+    
     # 生成参数
     prompt = Column(Text, nullable=True)
     reference_image = Column(Text, nullable=True)  # 参考图片URL
     aspect_ratio = Column(String(10), default="9:16")
     duration = Column(String(10), default="10")
     
-    created_at = Column(DateTime, default=datetime.utcnow)
+    # 批量生成的批次ID（单独生成时为空）
+    batch_id = Column(String(32), nullable=True, index=True)
+    # 调度器开始调用服务商提交接口的时间，拿到 task_id 或确认失败后清空；
+    # 重启后仍有值说明提交结果未知（服务商可能已接受任务）
+    submitting_since = Column(DateTime, nullable=True)
+    # 领取该任务的调度器 worker 及其最近一次心跳，租约过期说明该 worker 已退出
+    claimed_by = Column(String(64), nullable=True)
+    claimed_at = Column(DateTime, nullable=True)
+    
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+    # 生成任务的阶段时间（UTC，由 services/task_timeline.py 在字段变化时记录）
+    provider = Column(String(50), nullable=True)  # 提交到的中转商
+    submitted_at = Column(DateTime, nullable=True)  # 中转商接受任务（拿到 task_id）
+    first_processing_at = Column(DateTime, nullable=True)  # 首次轮询到生成中
+    provider_completed_at = Column(DateTime, nullable=True)  # 轮询到生成成功
+    downloaded_at = Column(DateTime, nullable=True)  # 视频下载到本地
+    failed_at = Column(DateTime, nullable=True)
 
     session = relationship("Session", back_populates="messages")
+
+
+class VideoChain(Base):
+    """视频续写链的运行状态（各段为 batch_id 等于链ID的消息）"""
+    __tablename__ = "video_chains"
+
+    id = Column(String(32), primary_key=True)
+    session_id = Column(Integer, ForeignKey("sessions.id"), nullable=False, index=True)
+    status = Column(String(20), default="running")  # running / stitching / completed / failed / interrupted
+    total_segments = Column(Integer, nullable=False)
+    current_segment = Column(Integer, default=0)
+    output_message_id = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+    # 推进该链的 worker 及其最近一次心跳，租约过期说明该 worker 已退出、链已中断
+    claimed_by = Column(String(64), nullable=True)
+    claimed_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class MediaObject(Base):
+    """媒体文件表（内容寻址：文件名由 SHA-256 决定，相同内容只存一份）"""
+    __tablename__ = "media_objects"
+
+    sha256 = Column(String(64), primary_key=True)
+    url = Column(Text, nullable=False)  # 本地访问URL，如 /uploads/<sha256>.png
+    size = Column(Integer)
+    public_url = Column(Text, nullable=True)  # 图床公网URL
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class RateLimit(Base):
+    """跨 worker 共享的令牌桶状态（时间为 Unix 时间戳）"""
+    __tablename__ = "rate_limits"
+
+    name = Column(String(50), primary_key=True)
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False)
+    paused_until = Column(Float, nullable=False, default=0.0)
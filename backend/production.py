@@ -1,17 +1,25 @@
 """生产环境启动脚本"""
 import os
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
 
-from database import init_db
-from routes import sessions, generate, image
+from database import init_db, async_engine
+from services.frame_extractor import shutdown_frame_executor
+from services.reference_image import close_reference_client
+from services.static_assets import IndexPage, asset_response, precompress_assets
+from services.submission_scheduler import start_submission_scheduler, stop_submission_scheduler
+from services.media_store import UploadSizeLimitMiddleware
+from services.tracing import TracingMiddleware
+from services.metrics import enable_multiprocess_metrics, start_metrics_sampler, stop_metrics_sampler
+from routes import sessions, generate, image, admin, media, metrics
 from config import SERVER_CONFIG
 from tasks.task_recovery import start_recovery_daemon, stop_recovery_daemon
+from tasks.media_gc import start_media_gc_daemon, stop_media_gc_daemon
 
 app = FastAPI(title="AI视频生成")
 
+# 在 CORS 内层，超限时的 413 响应同样带跨域头
+app.add_middleware(UploadSizeLimitMiddleware, paths=("/api/generate/upload-image",))
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -19,10 +27,16 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# 最后添加的中间件在最外层，追踪覆盖整个请求
+app.add_middleware(TracingMiddleware)
 
 app.include_router(sessions.router)
 app.include_router(generate.router)
 app.include_router(image.router)
+app.include_router(admin.router)
+app.include_router(media.router)
+app.include_router(media.files_router)
+app.include_router(metrics.router)
 
 uploads_dir = SERVER_CONFIG["uploads_dir"]
 downloads_dir = SERVER_CONFIG["downloads_dir"]
@@ -31,27 +45,48 @@ frontend_dist = os.path.join(os.path.dirname(os.path.dirname(__file__)), "fronte
 os.makedirs(uploads_dir, exist_ok=True)
 os.makedirs(downloads_dir, exist_ok=True)
 
-app.mount("/uploads", StaticFiles(directory=uploads_dir), name="uploads")
-app.mount("/downloads", StaticFiles(directory=downloads_dir), name="downloads")
-app.mount("/assets", StaticFiles(directory=os.path.join(frontend_dist, "assets")), name="assets")
+assets_dir = os.path.join(frontend_dist, "assets")
+index_page = IndexPage(os.path.join(frontend_dist, "index.html"))
 
 @app.on_event("startup")
 def startup():
     init_db()
+    # 构建脚本已预压缩时这里只做检查
+    if os.path.isdir(frontend_dist):
+        precompress_assets(frontend_dist)
     start_recovery_daemon()
+    start_media_gc_daemon()
+    start_submission_scheduler()
+    start_metrics_sampler()
 
 @app.on_event("shutdown")
-def shutdown():
+async def shutdown():
     stop_recovery_daemon()
+    stop_media_gc_daemon()
+    await stop_submission_scheduler()
+    await stop_metrics_sampler()
+    shutdown_frame_executor()
+    await close_reference_client()
+    await async_engine.dispose()
 
 @app.get("/api/health")
 def health_check():
     return {"status": "ok"}
 
+@app.api_route("/assets/{path:path}", methods=["GET", "HEAD"])
+def serve_asset(path: str, request: Request):
+    """带内容哈希的构建产物：immutable 缓存 + 预压缩"""
+    try:
+        return asset_response(request, assets_dir, path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="文件不存在")
+
 @app.get("/{full_path:path}")
-async def serve_frontend(full_path: str):
-    return FileResponse(os.path.join(frontend_dist, "index.html"))
+def serve_frontend(full_path: str, request: Request):
+    return index_page.response(request)
 
 if __name__ == "__main__":
     import uvicorn
+    # 多 worker 共享指标目录，必须在启动 worker 之前设置
+    enable_multiprocess_metrics()
     uvicorn.run("production:app", host="0.0.0.0", port=SERVER_CONFIG["port"], workers=2)
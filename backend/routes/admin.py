@@ -0,0 +1,65 @@
+"""
+运维管理路由
+"""
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import get_async_db
+from tasks.media_gc import run_media_gc, get_last_report
+from services.media_processing import faststart_existing_downloads
+from services.tracing import get_slow_traces
+from services.task_timeline import parse_group_by, task_latency_report
+from config import TRACING_CONFIG
+
+router = APIRouter(prefix="/api/admin", tags=["admin"])
+
+
+@router.get("/media-gc")
+def get_media_gc_report():
+    """查看最近一次媒体回收报告"""
+    return {"report": get_last_report()}
+
+
+@router.post("/media-gc")
+async def trigger_media_gc():
+    """立即执行一次媒体回收，返回回收的字节数等统计"""
+    report = await run_in_threadpool(run_media_gc)
+    return {"report": report}
+
+
+@router.post("/faststart")
+async def trigger_faststart():
+    """把早期下载、moov 位于末尾的视频改写为新的 faststart 文件并更新消息引用，返回改写统计"""
+    report = await run_in_threadpool(faststart_existing_downloads)
+    return {"report": report}
+
+
+@router.get("/slow-requests")
+def get_slow_requests(limit: Optional[int] = Query(None, ge=1)):
+    """最近超过耗时阈值的请求及其分段耗时（每个 worker 各自记录，新的在前）"""
+    return {
+        "threshold_ms": TRACING_CONFIG["slow_request_ms"],
+        "traces": get_slow_traces(limit),
+    }
+
+
+@router.get("/task-latency")
+async def get_task_latency(
+    hours: float = Query(24 * 7, gt=0),
+    group_by: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    生成任务各阶段耗时的 p50/p90/p99（秒），用于设置超时和容量规划
+
+    group_by 为逗号分隔的分组维度（provider、aspect_ratio、duration、mode），
+    默认按全部维度分组，传空字符串只看总体
+    """
+    try:
+        dimensions = parse_group_by(group_by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await task_latency_report(db, hours, dimensions)
@@ -2,22 +2,61 @@
 视频生成路由
 """
 import os
+import base64
 import requests
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, UploadFile, File
-from sqlalchemy.orm import Session as DBSession
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, UploadFile, File, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from database import get_db
-from models import Session, Message, MessageRole, MessageContentType, TaskStatus
+from database import get_async_db
+from models import Session, Message, MessageRole, MessageContentType, TaskStatus, MediaObject, VideoChain
 from schemas import (
     TextToVideoRequest, 
     ImageToVideoRequest, 
     GenerateResponse, 
-    TaskStatusResponse
+    TaskStatusFieldsResponse,
+    VideoBatchRequest,
+    VideoBatchResponse,
+    VideoBatchItem,
+    VideoBatchProgress,
+    VideoChainRequest,
+    VideoChainResponse,
+    VideoChainProgress,
+    TASK_STATUS_COLUMNS,
+    parse_fields,
 )
 from services.provider_factory import get_provider
 from services.base_provider import TaskState
-from config import SERVER_CONFIG, POLL_CONFIG
+from services.session_summary import refresh_session_summary, refresh_session_summary_async
+from services.media_store import (
+    stream_upload_to_store,
+    MediaTooLargeError,
+    local_path_of,
+    find_media,
+    register_media,
+)
+from services import image_host, url_signer
+from services.publisher import schedule_reference_preparation, resolve_public_url
+from services.reference_image import prepare_reference_url, reference_file_name
+from services.submission_scheduler import enqueue_submissions
+from services.video_chain import start_chain, chain_status
+from services.json_response import json_response
+from services.metrics import PollTracker
+from services.frame_extractor import (
+    extract_last_frame_png,
+    extract_last_frame_image,
+    resolve_video_identity,
+    frame_etag,
+    FRAME_FORMATS,
+)
+from services.video_download import download_video
+from services.media_processing import process_downloaded_video
+from config import SERVER_CONFIG, POLL_CONFIG, VIDEO_BATCH_CONFIG, CHAIN_CONFIG
 import time
+import uuid
+from itertools import product
 
 router = APIRouter(prefix="/api/generate", tags=["generate"])
 
@@ -28,74 +67,75 @@ def poll_and_update_task(message_id: int, task_id: str):
     
     provider = get_provider()
     db = SessionLocal()
+    polling = PollTracker("poller")
     
     try:
         for _ in range(POLL_CONFIG["max_attempts"]):
             time.sleep(POLL_CONFIG["interval_seconds"])
             
             result = provider.query_task(task_id)
+            polling.poll()
             message = db.query(Message).filter(Message.id == message_id).first()
             
             if not message:
                 break
             
             if result.state == TaskState.SUCCESS:
+                polling.outcome = "success"
                 message.status = TaskStatus.SUCCESS
                 message.video_url = result.video_url
                 
                 # 下载视频到本地
                 if result.video_url:
                     try:
-                        downloads_dir = SERVER_CONFIG["downloads_dir"]
-                        os.makedirs(downloads_dir, exist_ok=True)
-                        
-                        video_filename = f"{task_id}.mp4"
-                        local_path = os.path.join(downloads_dir, video_filename)
-                        
-                        response = requests.get(result.video_url, timeout=120)
-                        response.raise_for_status()
-                        
-                        with open(local_path, "wb") as f:
-                            f.write(response.content)
-                        
-                        message.local_path = video_filename
+                        message.local_path = download_video(result.video_url, task_id)
                     except Exception as e:
                         print(f"下载视频失败: {e}")
                 
+                refresh_session_summary(db, message.session_id)
                 db.commit()
+                # 下载完成后生成封面帧、尾帧和元数据
+                if message.local_path:
+                    process_downloaded_video(message_id)
                 break
                 
             elif result.state == TaskState.FAILED:
+                polling.outcome = "failed"
                 message.status = TaskStatus.FAILED
                 message.error_message = result.error_message
+                refresh_session_summary(db, message.session_id)
                 db.commit()
                 break
                 
             elif result.state == TaskState.PROCESSING:
                 message.status = TaskStatus.PROCESSING
+                refresh_session_summary(db, message.session_id)
                 db.commit()
                 
             # QUEUED状态继续轮询
             
     except Exception as e:
+        polling.outcome = "error"
         message = db.query(Message).filter(Message.id == message_id).first()
         if message:
             message.status = TaskStatus.FAILED
             message.error_message = str(e)
+            refresh_session_summary(db, message.session_id)
             db.commit()
     finally:
+        polling.finish()
         db.close()
 
 
 @router.post("/text-to-video", response_model=GenerateResponse)
-def text_to_video(
+async def text_to_video(
     data: TextToVideoRequest,
     background_tasks: BackgroundTasks,
-    db: DBSession = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """文生视频"""
     # 验证会话存在
-    session = db.query(Session).filter(Session.id == data.session_id).first()
+    session = await db.get(Session, data.session_id)
     if not session:
         raise HTTPException(status_code=404, detail="会话不存在")
     
@@ -111,7 +151,7 @@ def text_to_video(
         content=data.prompt,
     )
     db.add(user_message)
-    db.flush()
+    await db.flush()
     
     # 创建AI响应消息（视频）
     ai_message = Message(
@@ -124,19 +164,23 @@ def text_to_video(
         status=TaskStatus.PENDING,
     )
     db.add(ai_message)
-    db.flush()
+    await refresh_session_summary_async(db, data.session_id)
+    # 先提交消息再调用服务商，避免网络请求期间一直持有 SQLite 写锁
+    await db.commit()
     
-    # 提交生成任务
+    # 提交生成任务（服务商 SDK 为同步请求，放到线程池执行）
     try:
         provider = get_provider()
-        task_id = provider.submit_task(
+        task_id = await run_in_threadpool(
+            provider.submit_task,
             prompt=data.prompt,
             aspect_ratio=data.aspect_ratio,
             duration=data.duration,
         )
         ai_message.task_id = task_id
         ai_message.status = TaskStatus.QUEUED
-        db.commit()
+        await refresh_session_summary_async(db, data.session_id)
+        await db.commit()
         
         # 启动后台轮询
         background_tasks.add_task(poll_and_update_task, ai_message.id, task_id)
@@ -150,19 +194,20 @@ def text_to_video(
     except Exception as e:
         ai_message.status = TaskStatus.FAILED
         ai_message.error_message = str(e)
-        db.commit()
+        await refresh_session_summary_async(db, data.session_id)
+        await db.commit()
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/image-to-video", response_model=GenerateResponse)
-def image_to_video(
+async def image_to_video(
     data: ImageToVideoRequest,
     background_tasks: BackgroundTasks,
-    db: DBSession = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """图生视频"""
     # 验证会话存在
-    session = db.query(Session).filter(Session.id == data.session_id).first()
+    session = await db.get(Session, data.session_id)
     if not session:
         raise HTTPException(status_code=404, detail="会话不存在")
     
@@ -179,7 +224,7 @@ def image_to_video(
         reference_image=data.image_url,
     )
     db.add(user_message)
-    db.flush()
+    await db.flush()
     
     # 创建AI响应消息（视频）
     ai_message = Message(
@@ -193,20 +238,29 @@ def image_to_video(
         status=TaskStatus.PENDING,
     )
     db.add(ai_message)
-    db.flush()
+    await refresh_session_summary_async(db, data.session_id)
+    # 先提交消息再调用服务商，避免网络请求期间一直持有 SQLite 写锁
+    await db.commit()
     
-    # 提交生成任务
+    # 提交生成任务（服务商 SDK 为同步请求，放到线程池执行）
     try:
         provider = get_provider()
-        task_id = provider.submit_task(
+        # 缩放、去除元数据后再提交，减小服务商拉取的图片体积
+        image_url = await prepare_reference_url(db, data.image_url, provider.max_reference_image_side)
+        if provider.requires_public_image_url:
+            # 本地上传的图片需等待后台发布到图床
+            image_url = await resolve_public_url(db, image_url)
+        task_id = await run_in_threadpool(
+            provider.submit_task,
             prompt=data.prompt,
-            image_url=data.image_url,
+            image_url=image_url,
             aspect_ratio=data.aspect_ratio,
             duration=data.duration,
         )
         ai_message.task_id = task_id
         ai_message.status = TaskStatus.QUEUED
-        db.commit()
+        await refresh_session_summary_async(db, data.session_id)
+        await db.commit()
         
         # 启动后台轮询
         background_tasks.add_task(poll_and_update_task, ai_message.id, task_id)
@@ -220,144 +274,313 @@ def image_to_video(
     except Exception as e:
         ai_message.status = TaskStatus.FAILED
         ai_message.error_message = str(e)
-        db.commit()
+        await refresh_session_summary_async(db, data.session_id)
+        await db.commit()
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get("/status/{message_id}", response_model=TaskStatusResponse)
-def get_task_status(message_id: int, db: DBSession = Depends(get_db)):
-    """查询消息/任务状态"""
-    message = db.query(Message).filter(Message.id == message_id).first()
-    if not message:
-        raise HTTPException(status_code=404, detail="消息不存在")
-    
-    return TaskStatusResponse(
+@router.post("/batch", response_model=VideoBatchResponse)
+async def create_video_batch(data: VideoBatchRequest, db: AsyncSession = Depends(get_async_db)):
+    """
+    批量生成视频（提示词 × 比例 × 时长）
+
+    所有消息在一个事务内写入，随后由提交调度器按速率限制逐个提交，接口立即返回批次ID
+    """
+    combinations = list(product(data.prompts, data.aspect_ratios, data.durations))
+    if len(combinations) > VIDEO_BATCH_CONFIG["max_items"]:
+        raise HTTPException(
+            status_code=400,
+            detail=f"单个批次最多生成 {VIDEO_BATCH_CONFIG['max_items']} 个视频，当前为 {len(combinations)} 个",
+        )
+
+    session = await db.get(Session, data.session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="会话不存在")
+    if session.title == "新会话":
+        prompt = data.prompts[0]
+        session.title = prompt[:20] + ("..." if len(prompt) > 20 else "")
+
+    batch_id = uuid.uuid4().hex
+    content_type = MessageContentType.IMAGE if data.image_url else MessageContentType.TEXT
+    ai_messages = []
+    # 每条提示词一条用户消息，其后是该提示词的各个参数组合
+    for prompt in dict.fromkeys(data.prompts):
+        db.add(Message(
+            session_id=data.session_id,
+            role=MessageRole.USER,
+            content_type=content_type,
+            content=prompt,
+            reference_image=data.image_url,
+            batch_id=batch_id,
+        ))
+        for _, aspect_ratio, duration in (c for c in combinations if c[0] == prompt):
+            ai_message = Message(
+                session_id=data.session_id,
+                role=MessageRole.ASSISTANT,
+                content_type=MessageContentType.VIDEO,
+                prompt=prompt,
+                reference_image=data.image_url,
+                aspect_ratio=aspect_ratio,
+                duration=duration,
+                status=TaskStatus.PENDING,
+                batch_id=batch_id,
+            )
+            db.add(ai_message)
+            ai_messages.append(ai_message)
+    await refresh_session_summary_async(db, data.session_id)
+    await db.commit()
+
+    message_ids = [message.id for message in ai_messages]
+    enqueue_submissions(message_ids)
+    print(f"[批量生成] 批次 {batch_id}：{len(message_ids)} 个视频已加入提交队列")
+    return VideoBatchResponse(batch_id=batch_id, total=len(message_ids), message_ids=message_ids)
+
+
+@router.get("/batch/{batch_id}", response_model=VideoBatchProgress)
+async def get_video_batch(batch_id: str, db: AsyncSession = Depends(get_async_db)):
+    """查询批次的汇总进度"""
+    result = await db.execute(
+        select(Message)
+        .where(Message.batch_id == batch_id, Message.role == MessageRole.ASSISTANT)
+        .order_by(Message.id)
+    )
+    messages = result.scalars().all()
+    if not messages:
+        raise HTTPException(status_code=404, detail="批次不存在")
+
+    counts = {status: 0 for status in TaskStatus}
+    for message in messages:
+        counts[TaskStatus(message.status)] += 1
+    return VideoBatchProgress(
+        batch_id=batch_id,
+        total=len(messages),
+        pending=counts[TaskStatus.PENDING],
+        queued=counts[TaskStatus.QUEUED],
+        processing=counts[TaskStatus.PROCESSING],
+        success=counts[TaskStatus.SUCCESS],
+        failed=counts[TaskStatus.FAILED],
+        done=counts[TaskStatus.SUCCESS] + counts[TaskStatus.FAILED] == len(messages),
+        items=[_batch_item(message) for message in messages],
+    )
+
+
+def _batch_item(message: Message) -> VideoBatchItem:
+    return VideoBatchItem(
         message_id=message.id,
         status=message.status,
+        prompt=message.prompt,
+        aspect_ratio=message.aspect_ratio,
+        duration=message.duration,
+        task_id=message.task_id,
         video_url=message.video_url,
         error_message=message.error_message,
     )
 
 
+@router.post("/chain", response_model=VideoChainResponse)
+async def create_video_chain(data: VideoChainRequest, db: AsyncSession = Depends(get_async_db)):
+    """
+    从视频尾帧续写
+
+    后台依次"提取上一段尾帧 → 提交下一段 → 等待完成"，全部完成后拼接为一个视频，接口立即返回链ID
+    """
+    if len(data.prompts) > CHAIN_CONFIG["max_segments"]:
+        raise HTTPException(
+            status_code=400,
+            detail=f"单条续写链最多生成 {CHAIN_CONFIG['max_segments']} 段，当前为 {len(data.prompts)} 段",
+        )
+    source = await db.get(Message, data.source_message_id)
+    if (
+        not source
+        or source.session_id != data.session_id
+        or source.content_type != MessageContentType.VIDEO
+    ):
+        raise HTTPException(status_code=404, detail="起始视频不存在")
+    if source.status != TaskStatus.SUCCESS or not source.video_url:
+        raise HTTPException(status_code=400, detail="起始视频尚未生成完成")
+
+    chain_id = await start_chain(
+        db,
+        data.session_id,
+        source.video_url,
+        data.prompts,
+        data.aspect_ratio,
+        data.duration,
+        data.include_source,
+    )
+    print(f"[续写链] {chain_id}：从消息 {source.id} 续写 {len(data.prompts)} 段")
+    return VideoChainResponse(chain_id=chain_id, segments=len(data.prompts))
+
+
+@router.get("/chain/{chain_id}", response_model=VideoChainProgress)
+async def get_video_chain(chain_id: str, db: AsyncSession = Depends(get_async_db)):
+    """查询续写链进度：各段状态 + 拼接结果"""
+    result = await db.execute(
+        select(Message)
+        .where(Message.batch_id == chain_id, Message.role == MessageRole.ASSISTANT)
+        .order_by(Message.id)
+    )
+    messages = result.scalars().all()
+    chain = await db.get(VideoChain, chain_id)
+    if not messages and chain is None:
+        raise HTTPException(status_code=404, detail="续写链不存在")
+
+    # 拼接结果没有任务ID，其余为各段生成消息
+    segments = [message for message in messages if message.task_id or message.status != TaskStatus.SUCCESS]
+    output = next((message for message in messages if message not in segments), None)
+    if chain is not None:
+        state = {
+            "status": chain_status(chain),
+            "total_segments": chain.total_segments,
+            "current_segment": chain.current_segment,
+            "output_message_id": chain.output_message_id,
+            "output_url": output.video_url if output else None,
+            "error": chain.error,
+        }
+    else:
+        # video_chains 表之前创建的链没有状态记录，按消息推断
+        state = {
+            "status": "completed" if output else "interrupted",
+            "total_segments": len(segments),
+            "current_segment": len(segments),
+            "output_message_id": output.id if output else None,
+            "output_url": output.video_url if output else None,
+            "error": None,
+        }
+    return VideoChainProgress(
+        chain_id=chain_id,
+        segments=[_batch_item(message) for message in segments],
+        **state,
+    )
+
+
+@router.get("/status/{message_id}", response_model=None, responses={200: {"model": TaskStatusFieldsResponse}})
+async def get_task_status(
+    message_id: int,
+    request: Request,
+    fields: Optional[str] = Query(None, description="只返回这些字段（逗号分隔），如 status；message_id 总是返回"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """查询消息/任务状态（只读取需要的列）"""
+    try:
+        selected = parse_fields(fields, list(TASK_STATUS_COLUMNS), "message_id")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    result = await db.execute(
+        select(*(Message.__table__.c[TASK_STATUS_COLUMNS[name]] for name in selected))
+        .where(Message.id == message_id)
+    )
+    row = result.mappings().first()
+    if not row:
+        raise HTTPException(status_code=404, detail="消息不存在")
+    return await json_response(request, {name: row[TASK_STATUS_COLUMNS[name]] for name in selected})
+
+
 @router.post("/upload-image")
-async def upload_image(file: UploadFile = File(...)):
+async def upload_image(file: UploadFile = File(...), db: AsyncSession = Depends(get_async_db)):
     """上传图片（用于图生视频）- 同时上传到图床获取公网URL"""
-    import uuid
     print(f"[上传图片] 收到文件: {file.filename}")
     
-    uploads_dir = SERVER_CONFIG["uploads_dir"]
-    os.makedirs(uploads_dir, exist_ok=True)
-    
-    # 生成唯一文件名
+    # 分块写盘，边写边计算内容哈希并校验大小
     ext = os.path.splitext(file.filename)[1] or ".jpg"
-    filename = f"{uuid.uuid4()}{ext}"
-    filepath = os.path.join(uploads_dir, filename)
-    
-    # 读取文件内容
-    content = await file.read()
-    
-    # 保存到本地（用于预览）
-    with open(filepath, "wb") as f:
-        f.write(content)
-    print(f"[上传图片] 已保存到本地: {filepath}")
-    
-    # 上传到GitHub图床获取公网URL
-    public_url = None
-    import base64
-    
-    # GitHub 图床配置（从 credentials.py 读取）
     try:
-        from credentials import GITHUB_TOKEN, GITHUB_REPO
-    except ImportError:
-        GITHUB_TOKEN = ""
-        GITHUB_REPO = "hezawei/image-bed"
+        sha256, filename, filepath, size = await stream_upload_to_store(file, SERVER_CONFIG["uploads_dir"], ext)
+    except MediaTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     
-    if GITHUB_TOKEN:
-        try:
-            img_base64 = base64.b64encode(content).decode('utf-8')
-            github_api = f"https://api.github.com/repos/{GITHUB_REPO}/contents/images/{filename}"
-            
-            response = requests.put(
-                github_api,
-                headers={
-                    "Authorization": f"token {GITHUB_TOKEN}",
-                    "Accept": "application/vnd.github.v3+json"
-                },
-                json={
-                    "message": f"Upload {filename}",
-                    "content": img_base64
-                },
-                timeout=15
-            )
-            
-            if response.status_code in [200, 201]:
-                # 构造 raw 链接
-                public_url = f"https://raw.githubusercontent.com/{GITHUB_REPO}/main/images/{filename}"
-                print(f"GitHub上传成功: {public_url}")
-            else:
-                print(f"GitHub上传失败: {response.status_code} - {response.text[:200]}")
-        except Exception as e:
-            print(f"GitHub上传失败: {e}")
+    # 相同内容已上传过：直接复用本地文件和图床链接
+    media = await find_media(db, sha256)
+    if media and local_path_of(media.url) != filepath:
+        # 内容相同但扩展名不同，丢弃本次写入的副本
+        os.remove(filepath)
+    if media:
+        print(f"[上传图片] 内容已存在，复用: {media.url}")
+        filepath = local_path_of(media.url)
     else:
-        print("[警告] 未配置 GITHUB_TOKEN，图生视频功能不可用")
-        print("请创建 GitHub Token: https://github.com/settings/tokens")
+        print(f"[上传图片] 已保存到本地: {filepath} ({size} 字节)")
+        media = await register_media(db, sha256, f"/uploads/{filename}")
+    
+    # 提交给服务商的是预处理后的图片：预处理和发布到GitHub图床都在后台进行，不阻塞本次响应，
+    # 图生视频时按需等待结果；启用签名URL时直接由后端提供图片
+    max_side = get_provider().max_reference_image_side
+    reference_url = f"/uploads/{reference_file_name(sha256, max_side)}"
+    result = await db.execute(select(MediaObject.public_url).where(MediaObject.url == reference_url))
+    published_url = result.scalar()
+    public_url = published_url
+    publish_pending = False
+    if url_signer.is_enabled():
+        public_url = url_signer.sign_media_url(reference_url)
+    elif not public_url and image_host.is_configured():
+        publish_pending = True
+    if not published_url:
+        schedule_reference_preparation(media.url, max_side)
     
     # 返回本地预览URL和公网URL
     return {
-        "filename": filename, 
-        "url": f"/uploads/{filename}",  # 本地预览用
-        "public_url": public_url  # 传给API用
+        "filename": os.path.basename(media.url),
+        "url": media.url,  # 本地预览用
+        "public_url": public_url,  # 已发布过的相同内容直接复用
+        "publish_pending": publish_pending,  # 为 True 时可直接把 url 传给图生视频，服务端会等待发布完成
     }
 
 
 @router.get("/extract-frame")
-async def extract_last_frame(video_url: str):
-    """提取视频最后一帧，返回 base64 图片"""
-    import cv2
-    import numpy as np
-    import base64
-    import tempfile
-    
+async def extract_last_frame(video_url: str, db: AsyncSession = Depends(get_async_db)):
+    """提取视频最后一帧，返回 base64 图片（兼容旧版前端，新代码请用 /extract-frame/image）"""
     print(f"[提取尾帧] URL: {video_url}")
     
     try:
-        # 下载视频到临时文件
-        response = requests.get(video_url, timeout=30)
-        response.raise_for_status()
-        
-        with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as tmp:
-            tmp.write(response.content)
-            tmp_path = tmp.name
-        
-        # 用 OpenCV 读取视频
-        cap = cv2.VideoCapture(tmp_path)
-        if not cap.isOpened():
-            raise HTTPException(status_code=500, detail="无法打开视频")
-        
-        # 跳转到最后一帧
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        cap.set(cv2.CAP_PROP_POS_FRAMES, max(0, total_frames - 1))
-        
-        ret, frame = cap.read()
-        cap.release()
-        
-        # 删除临时文件
-        os.unlink(tmp_path)
-        
-        if not ret:
-            raise HTTPException(status_code=500, detail="无法读取帧")
-        
-        # 转换为 PNG 并编码为 base64
-        _, buffer = cv2.imencode('.png', frame)
-        img_base64 = base64.b64encode(buffer).decode('utf-8')
-        
-        print(f"[提取尾帧] 成功，图片大小: {len(img_base64)} 字符")
-        
-        return {"image": f"data:image/png;base64,{img_base64}"}
+        png = await extract_last_frame_png(db, video_url)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="视频文件不存在")
+    except requests.RequestException as e:
+        print(f"[提取尾帧] 下载失败: {e}")
+        raise HTTPException(status_code=500, detail=f"下载视频失败: {e}")
+    except Exception as e:
+        print(f"[提取尾帧] 处理失败: {e}")
+        raise HTTPException(status_code=500, detail=f"处理失败: {e}")
+    
+    img_base64 = base64.b64encode(png).decode('utf-8')
+    print(f"[提取尾帧] 成功，图片大小: {len(img_base64)} 字符")
+    return {"image": f"data:image/png;base64,{img_base64}"}
+
+
+@router.get("/extract-frame/image")
+async def extract_last_frame_image_binary(
+    request: Request,
+    video_url: str,
+    format: str = Query("auto", pattern="^(auto|png|jpeg|webp)$"),
+    max_size: Optional[int] = Query(None, ge=16, le=4096),
+    quality: int = Query(85, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    提取视频最后一帧，直接返回图片二进制
+
+    format=auto 时按 Accept 头选择 WebP，否则 JPEG；max_size 限制最长边像素。
+    响应带 ETag 和长期缓存头，浏览器可直接用作 <img> 地址
+    """
+    fmt = format
+    if fmt == "auto":
+        fmt = "webp" if "image/webp" in request.headers.get("accept", "") else "jpeg"
+    
+    try:
+        _, video_key = await resolve_video_identity(db, video_url)
+        etag = frame_etag(video_key, fmt, max_size, quality)
+        headers = {"etag": etag, "cache-control": "public, max-age=31536000, immutable"}
+        if format == "auto":
+            headers["vary"] = "Accept"
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
         
+        image = await extract_last_frame_image(db, video_url, fmt, max_size, quality)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="视频文件不存在")
     except requests.RequestException as e:
         print(f"[提取尾帧] 下载失败: {e}")
         raise HTTPException(status_code=500, detail=f"下载视频失败: {e}")
     except Exception as e:
         print(f"[提取尾帧] 处理失败: {e}")
         raise HTTPException(status_code=500, detail=f"处理失败: {e}")
+    
+    return Response(content=image, media_type=FRAME_FORMATS[fmt][1], headers=headers)
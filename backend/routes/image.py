@@ -1,18 +1,22 @@
 """
 图片生成路由
 """
-import os
-import uuid
-import base64
+import asyncio
+import json
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlalchemy.orm import Session as DBSession
-from pydantic import BaseModel
-from typing import Optional
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import BaseModel, Field
+from typing import Optional, List
 
-from database import get_db
+from database import get_async_db, AsyncSessionLocal
 from models import Session, Message, MessageRole, MessageContentType, TaskStatus
-from config import SERVER_CONFIG
+from config import SERVER_CONFIG, IMAGE_BATCH_CONFIG
 from services.gemini_image_provider import get_image_provider
+from services.session_summary import refresh_session_summary_async
+from services.media_store import write_base64_media_file, register_media
+from services.reference_image import REFERENCE_MIME_TYPE, ReferenceImageError, load_reference_image_base64
 
 router = APIRouter(prefix="/api/image", tags=["图片生成"])
 
@@ -30,19 +34,54 @@ class ImageToImageRequest(BaseModel):
     reference_image: str  # base64 或 URL
 
 
+class ImageBatchRequest(BaseModel):
+    """批量生成请求：同一提示词生成 count 张变体，或按 prompts 每条生成一张"""
+    session_id: int
+    prompt: Optional[str] = None
+    prompts: Optional[List[str]] = None
+    count: int = Field(default=4, ge=1)
+    reference_image: Optional[str] = None  # base64 或 URL，所有图片共用
+
+
 class ImageGenerateResponse(BaseModel):
     """图片生成响应"""
     message_id: int
     image_url: str
 
 
+def save_generated_image(image_base64: str) -> tuple:
+    """
+    把生成的图片（base64 或 data URL）分段解码写入 downloads 目录，按内容哈希命名
+
+    Returns:
+        (访问URL, 本地路径, SHA-256)
+    """
+    sha256, filename, filepath, _ = write_base64_media_file(SERVER_CONFIG["downloads_dir"], image_base64, ".png")
+    return f"/downloads/{filename}", filepath, sha256
+
+
+async def load_reference_image(db: AsyncSession, reference_image: str, max_side: int) -> str:
+    """
+    加载参考图片并预处理（缩放、去除元数据、重新编码为 JPEG），返回 base64
+
+    Raises:
+        HTTPException: 图片不存在、无法下载或无法解码
+    """
+    try:
+        return await load_reference_image_base64(db, reference_image, max_side)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="参考图片不存在")
+    except ReferenceImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.post("/text-to-image", response_model=ImageGenerateResponse)
-async def text_to_image(request: TextToImageRequest, db: DBSession = Depends(get_db)):
+async def text_to_image(request: TextToImageRequest, db: AsyncSession = Depends(get_async_db)):
     """文生图"""
     print(f"[文生图] session={request.session_id}, prompt={request.prompt[:30]}...")
     
     # 检查会话
-    session = db.query(Session).filter(Session.id == request.session_id).first()
+    session = await db.get(Session, request.session_id)
     if not session:
         raise HTTPException(status_code=404, detail="会话不存在")
     
@@ -55,23 +94,17 @@ async def text_to_image(request: TextToImageRequest, db: DBSession = Depends(get
         status=TaskStatus.SUCCESS,
     )
     db.add(user_message)
-    db.commit()
+    await refresh_session_summary_async(db, request.session_id)
+    await db.commit()
     
     # 调用图片生成服务
     try:
         provider = get_image_provider()
-        result = provider.generate_image(prompt=request.prompt)
+        result = await run_in_threadpool(provider.generate_image, prompt=request.prompt)
         
         # 保存图片到本地
-        filename = f"{uuid.uuid4()}.png"
-        filepath = os.path.join(SERVER_CONFIG["downloads_dir"], filename)
-        os.makedirs(SERVER_CONFIG["downloads_dir"], exist_ok=True)
-        
-        img_bytes = base64.b64decode(result["image_base64"])
-        with open(filepath, "wb") as f:
-            f.write(img_bytes)
-        
-        image_url = f"/downloads/{filename}"
+        image_url, filepath, sha256 = await run_in_threadpool(save_generated_image, result.pop("image_base64"))
+        await register_media(db, sha256, image_url)
         
         # 创建AI响应消息
         ai_message = Message(
@@ -85,12 +118,13 @@ async def text_to_image(request: TextToImageRequest, db: DBSession = Depends(get
             local_path=filepath,
         )
         db.add(ai_message)
-        db.commit()
+        await refresh_session_summary_async(db, request.session_id)
+        await db.commit()
         
         # 更新会话标题
         if session.title == "新会话":
             session.title = request.prompt[:20] + "..." if len(request.prompt) > 20 else request.prompt
-            db.commit()
+            await db.commit()
         
         print(f"[文生图] 成功，image_url={image_url}")
         return ImageGenerateResponse(message_id=ai_message.id, image_url=image_url)
@@ -107,37 +141,26 @@ async def text_to_image(request: TextToImageRequest, db: DBSession = Depends(get
             error_message=str(e),
         )
         db.add(ai_message)
-        db.commit()
+        await refresh_session_summary_async(db, request.session_id)
+        await db.commit()
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/image-to-image", response_model=ImageGenerateResponse)
-async def image_to_image(request: ImageToImageRequest, db: DBSession = Depends(get_db)):
+async def image_to_image(request: ImageToImageRequest, db: AsyncSession = Depends(get_async_db)):
     """图生图"""
     print(f"[图生图] session={request.session_id}, prompt={request.prompt[:30]}...")
     
     # 检查会话
-    session = db.query(Session).filter(Session.id == request.session_id).first()
+    session = await db.get(Session, request.session_id)
     if not session:
         raise HTTPException(status_code=404, detail="会话不存在")
     
-    # 处理参考图片
-    reference_image_base64 = request.reference_image
-    if request.reference_image.startswith("http") or request.reference_image.startswith("/"):
-        # URL 形式，需要下载并转换
-        import requests
-        if request.reference_image.startswith("/"):
-            # 本地路径
-            local_path = os.path.join(os.path.dirname(SERVER_CONFIG["uploads_dir"]), request.reference_image.lstrip("/"))
-            with open(local_path, "rb") as f:
-                reference_image_base64 = base64.b64encode(f.read()).decode()
-        else:
-            # 远程URL
-            resp = requests.get(request.reference_image, timeout=30)
-            reference_image_base64 = base64.b64encode(resp.content).decode()
-    elif request.reference_image.startswith("data:"):
-        # data URL 形式
-        reference_image_base64 = request.reference_image.split(",")[1]
+    # 处理参考图片（缩放到服务商可用的分辨率后再提交）
+    provider = get_image_provider()
+    reference_image_base64 = await load_reference_image(
+        db, request.reference_image, provider.max_reference_image_side
+    )
     
     # 创建用户消息
     user_message = Message(
@@ -149,26 +172,21 @@ async def image_to_image(request: ImageToImageRequest, db: DBSession = Depends(g
         status=TaskStatus.SUCCESS,
     )
     db.add(user_message)
-    db.commit()
+    await refresh_session_summary_async(db, request.session_id)
+    await db.commit()
     
     # 调用图片生成服务
     try:
-        provider = get_image_provider()
-        result = provider.generate_image(
+        result = await run_in_threadpool(
+            provider.generate_image,
             prompt=request.prompt,
             reference_image_base64=reference_image_base64,
+            reference_image_mime_type=REFERENCE_MIME_TYPE,
         )
         
         # 保存图片到本地
-        filename = f"{uuid.uuid4()}.png"
-        filepath = os.path.join(SERVER_CONFIG["downloads_dir"], filename)
-        os.makedirs(SERVER_CONFIG["downloads_dir"], exist_ok=True)
-        
-        img_bytes = base64.b64decode(result["image_base64"])
-        with open(filepath, "wb") as f:
-            f.write(img_bytes)
-        
-        image_url = f"/downloads/{filename}"
+        image_url, filepath, sha256 = await run_in_threadpool(save_generated_image, result.pop("image_base64"))
+        await register_media(db, sha256, image_url)
         
         # 创建AI响应消息
         ai_message = Message(
@@ -182,12 +200,13 @@ async def image_to_image(request: ImageToImageRequest, db: DBSession = Depends(g
             local_path=filepath,
         )
         db.add(ai_message)
-        db.commit()
+        await refresh_session_summary_async(db, request.session_id)
+        await db.commit()
         
         # 更新会话标题
         if session.title == "新会话":
             session.title = request.prompt[:20] + "..." if len(request.prompt) > 20 else request.prompt
-            db.commit()
+            await db.commit()
         
         print(f"[图生图] 成功，image_url={image_url}")
         return ImageGenerateResponse(message_id=ai_message.id, image_url=image_url)
@@ -203,5 +222,156 @@ async def image_to_image(request: ImageToImageRequest, db: DBSession = Depends(g
             error_message=str(e),
         )
         db.add(ai_message)
-        db.commit()
+        await refresh_session_summary_async(db, request.session_id)
+        await db.commit()
         raise HTTPException(status_code=500, detail=str(e))
+
+
+# 进行中的批次（持有引用，避免任务在客户端断开后被回收）
+_batch_tasks = set()
+
+
+def _ndjson(event: dict) -> str:
+    return json.dumps(event, ensure_ascii=False) + "\n"
+
+
+async def _generate_one(semaphore: asyncio.Semaphore, index: int, prompt: str, reference_image_base64: Optional[str]):
+    """在并发上限内生成一张图片并写盘，返回 (序号, 提示词, 结果或异常)"""
+    async with semaphore:
+        try:
+            provider = get_image_provider()
+            result = await run_in_threadpool(
+                provider.generate_image,
+                prompt=prompt,
+                reference_image_base64=reference_image_base64,
+                reference_image_mime_type=REFERENCE_MIME_TYPE,
+            )
+            image_url, filepath, sha256 = await run_in_threadpool(save_generated_image, result.pop("image_base64"))
+            return index, prompt, {"image_url": image_url, "filepath": filepath, "sha256": sha256, "content": result.get("content", "")}
+        except Exception as e:
+            return index, prompt, e
+
+
+async def _run_batch(session_id: int, prompts: List[str], reference_image_base64: Optional[str], queue: asyncio.Queue):
+    """
+    并发生成一批图片，每完成一张就写入一条消息并推送事件；
+    客户端断开不影响批次继续执行和落库
+    """
+    semaphore = asyncio.Semaphore(IMAGE_BATCH_CONFIG["max_concurrency"])
+    jobs = [
+        asyncio.create_task(_generate_one(semaphore, index, prompt, reference_image_base64))
+        for index, prompt in enumerate(prompts)
+    ]
+    succeeded = failed = 0
+    try:
+        async with AsyncSessionLocal() as db:
+            # 按完成顺序处理，数据库写入在本协程内串行进行
+            for job in asyncio.as_completed(jobs):
+                index, prompt, outcome = await job
+                if isinstance(outcome, Exception):
+                    print(f"[批量生图] 第 {index + 1} 张失败: {outcome}")
+                    message = Message(
+                        session_id=session_id,
+                        role=MessageRole.ASSISTANT,
+                        content_type=MessageContentType.IMAGE,
+                        prompt=prompt,
+                        status=TaskStatus.FAILED,
+                        error_message=str(outcome),
+                    )
+                else:
+                    await register_media(db, outcome["sha256"], outcome["image_url"])
+                    message = Message(
+                        session_id=session_id,
+                        role=MessageRole.ASSISTANT,
+                        content_type=MessageContentType.IMAGE,
+                        content=outcome["content"],
+                        prompt=prompt,
+                        status=TaskStatus.SUCCESS,
+                        video_url=outcome["image_url"],
+                        local_path=outcome["filepath"],
+                    )
+                db.add(message)
+                await refresh_session_summary_async(db, session_id)
+                await db.commit()
+
+                event = {"type": "result", "index": index, "message_id": message.id, "status": message.status}
+                if isinstance(outcome, Exception):
+                    failed += 1
+                    event["error"] = str(outcome)
+                else:
+                    succeeded += 1
+                    event["image_url"] = outcome["image_url"]
+                await queue.put(event)
+    except Exception as e:
+        print(f"[批量生图] 批次出错: {e}")
+        await queue.put({"type": "error", "detail": str(e)})
+    finally:
+        print(f"[批量生图] 完成，成功 {succeeded} 张，失败 {failed} 张")
+        await queue.put({"type": "done", "succeeded": succeeded, "failed": failed})
+
+
+@router.post("/batch")
+async def generate_image_batch(request: ImageBatchRequest, db: AsyncSession = Depends(get_async_db)):
+    """
+    批量生成图片（同一提示词的多张变体，或多条提示词）
+
+    在并发上限内同时请求，每完成一张立即返回一行 JSON（NDJSON）：
+    {"type": "batch", ...} 开头，随后每张图片一行 {"type": "result", ...}，最后 {"type": "done", ...}
+    """
+    if request.prompts:
+        prompts = request.prompts
+    elif request.prompt:
+        prompts = [request.prompt] * request.count
+    else:
+        raise HTTPException(status_code=400, detail="需要提供 prompt 或 prompts")
+    if len(prompts) > IMAGE_BATCH_CONFIG["max_images"]:
+        raise HTTPException(status_code=400, detail=f"单个批次最多生成 {IMAGE_BATCH_CONFIG['max_images']} 张图片")
+    print(f"[批量生图] session={request.session_id}, {len(prompts)} 张")
+
+    session = await db.get(Session, request.session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="会话不存在")
+
+    provider = get_image_provider()
+    reference_image_base64 = None
+    if request.reference_image:
+        reference_image_base64 = await load_reference_image(
+            db, request.reference_image, provider.max_reference_image_side
+        )
+
+    # 每条不同的提示词对应一条用户消息
+    user_messages = []
+    for prompt in dict.fromkeys(prompts):
+        user_message = Message(
+            session_id=request.session_id,
+            role=MessageRole.USER,
+            content_type=MessageContentType.IMAGE if request.reference_image else MessageContentType.TEXT,
+            content=prompt,
+            reference_image=request.reference_image[:200] if request.reference_image else None,
+            status=TaskStatus.SUCCESS,
+        )
+        db.add(user_message)
+        user_messages.append(user_message)
+    if session.title == "新会话":
+        session.title = prompts[0][:20] + "..." if len(prompts[0]) > 20 else prompts[0]
+    await refresh_session_summary_async(db, request.session_id)
+    await db.commit()
+
+    queue = asyncio.Queue()
+    task = asyncio.create_task(_run_batch(request.session_id, prompts, reference_image_base64, queue))
+    _batch_tasks.add(task)
+    task.add_done_callback(_batch_tasks.discard)
+
+    async def stream():
+        yield _ndjson({
+            "type": "batch",
+            "count": len(prompts),
+            "user_message_ids": [message.id for message in user_messages],
+        })
+        while True:
+            event = await queue.get()
+            yield _ndjson(event)
+            if event["type"] == "done":
+                break
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
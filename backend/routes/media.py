@@ -0,0 +1,96 @@
+"""
+媒体文件路由
+"""
+import os
+from fastapi import APIRouter, HTTPException, Request
+
+from config import SERVER_CONFIG, THUMBNAIL_CONFIG
+from services.media_store import local_path_of
+from services.media_response import IMMUTABLE_CACHE_CONTROL, media_file_response
+from services.thumbnails import THUMBNAIL_KINDS, get_thumbnail, thumbnail_etag, thumbnail_media_type
+from services.url_signer import verify_signature
+
+router = APIRouter(prefix="/api/media", tags=["media"])
+# 上传图片 / 生成结果：/uploads/<文件名>、/downloads/<文件名>
+files_router = APIRouter(tags=["media"])
+
+
+@router.api_route("/signed/{kind}/{filename}", methods=["GET", "HEAD"])
+def get_signed_media(kind: str, filename: str, expires: int, sig: str, request: Request):
+    """通过签名URL访问上传/生成的媒体文件（供视频服务商拉取参考图片）"""
+    if kind not in ("uploads", "downloads") or os.path.basename(filename) != filename:
+        raise HTTPException(status_code=404, detail="文件不存在")
+    local_url = f"/{kind}/{filename}"
+    if not verify_signature(local_url, expires, sig):
+        raise HTTPException(status_code=403, detail="签名无效或已过期")
+
+    path = local_path_of(local_url)
+    if not path or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="文件不存在")
+    return media_file_response(request, path, cache_control="private, max-age=3600")
+
+
+@router.api_route("/derived/{filename}", methods=["GET", "HEAD"])
+def get_derived_media(filename: str, request: Request):
+    """视频后处理生成的封面帧、尾帧（文件名由视频任务ID决定，内容不变，可长期缓存）"""
+    if os.path.basename(filename) != filename:
+        raise HTTPException(status_code=404, detail="文件不存在")
+    path = os.path.join(SERVER_CONFIG["derived_dir"], filename)
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="文件不存在")
+    return media_file_response(request, path, cache_control=IMMUTABLE_CACHE_CONTROL)
+
+
+@router.api_route("/thumb/{width}/{kind}/{filename}", methods=["GET", "HEAD"])
+async def get_thumbnail_media(width: int, kind: str, filename: str, request: Request):
+    """上传/生成图片的缩略图（首次访问时生成；原图内容寻址，缩略图可长期缓存）"""
+    if (
+        width not in THUMBNAIL_CONFIG["widths"]
+        or kind not in THUMBNAIL_KINDS
+        or os.path.basename(filename) != filename
+    ):
+        raise HTTPException(status_code=404, detail="文件不存在")
+    try:
+        path = await get_thumbnail(kind, filename, width)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="文件不存在")
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"缩略图生成失败: {str(e)}")
+    return media_file_response(
+        request,
+        path,
+        cache_control=IMMUTABLE_CACHE_CONTROL,
+        media_type=thumbnail_media_type(),
+        etag=thumbnail_etag(filename, width),
+    )
+
+
+def _serve_media_file(kind: str, filename: str, request: Request):
+    """
+    上传和生成的媒体文件按内容哈希、任务ID或 UUID 唯一命名，写入时先写临时文件再原子改名，
+    同一URL的内容永不改变，可按 immutable 长期缓存；视频拖动进度时返回 206 分段
+    """
+    # 拒绝路径穿越，以及写入中的临时文件（.xxx.tmp / .part）
+    if (
+        os.path.basename(filename) != filename
+        or filename.startswith(".")
+        or filename.endswith((".tmp", ".part"))
+    ):
+        raise HTTPException(status_code=404, detail="文件不存在")
+    path = local_path_of(f"/{kind}/{filename}")
+    try:
+        return media_file_response(request, path, cache_control=IMMUTABLE_CACHE_CONTROL)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="文件不存在")
+
+
+@files_router.api_route("/uploads/{filename}", methods=["GET", "HEAD"])
+def get_upload(filename: str, request: Request):
+    """上传的图片"""
+    return _serve_media_file("uploads", filename, request)
+
+
+@files_router.api_route("/downloads/{filename}", methods=["GET", "HEAD"])
+def get_download(filename: str, request: Request):
+    """生成的视频和图片"""
+    return _serve_media_file("downloads", filename, request)
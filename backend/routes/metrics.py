@@ -0,0 +1,15 @@
+"""
+Prometheus 指标路由
+"""
+from fastapi import APIRouter, Response
+
+from services.metrics import render_metrics
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics")
+def get_metrics():
+    """Prometheus 抓取入口（多 worker 时汇总所有 worker）"""
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
@@ -1,97 +1,125 @@
 """
 会话管理路由
 """
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session as DBSession
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from database import get_db
+from database import get_async_db
 from models import Session, Message
-from schemas import SessionCreate, SessionResponse, MessageResponse
+from schemas import (
+    SessionCreate,
+    SessionResponse,
+    MessageFieldsResponse,
+    SESSION_COLUMNS,
+    MESSAGE_FIELDS,
+    parse_fields,
+    message_columns_for,
+    message_row_to_dict,
+)
+from services.json_response import json_response
+from services.session_summary import refresh_session_summary_async
 
 router = APIRouter(prefix="/api/sessions", tags=["sessions"])
 
 
+async def get_session_or_404(db: AsyncSession, session_id: int) -> Session:
+    """按ID获取会话，不存在时返回404"""
+    session = await db.get(Session, session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="会话不存在")
+    return session
+
+
 @router.get("", response_model=List[SessionResponse])
-def get_sessions(db: DBSession = Depends(get_db)):
-    """获取所有会话列表"""
-    sessions = db.query(Session).order_by(Session.updated_at.desc()).all()
-    return sessions
+async def get_sessions(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """获取所有会话列表（摘要列已冗余在 sessions 表，单次查询）"""
+    result = await db.execute(
+        select(*(Session.__table__.c[name] for name in SESSION_COLUMNS)).order_by(Session.updated_at.desc())
+    )
+    return await json_response(request, [dict(row) for row in result.mappings()])
 
 
 @router.post("", response_model=SessionResponse)
-def create_session(data: SessionCreate, db: DBSession = Depends(get_db)):
+async def create_session(data: SessionCreate, db: AsyncSession = Depends(get_async_db)):
     """创建新会话"""
     session = Session(title=data.title)
     db.add(session)
-    db.commit()
-    db.refresh(session)
+    await db.commit()
+    await db.refresh(session)
     return session
 
 
 @router.get("/{session_id}", response_model=SessionResponse)
-def get_session(session_id: int, db: DBSession = Depends(get_db)):
+async def get_session(session_id: int, db: AsyncSession = Depends(get_async_db)):
     """获取单个会话"""
-    session = db.query(Session).filter(Session.id == session_id).first()
-    if not session:
-        raise HTTPException(status_code=404, detail="会话不存在")
-    return session
+    return await get_session_or_404(db, session_id)
 
 
 @router.put("/{session_id}", response_model=SessionResponse)
-def update_session(session_id: int, data: SessionCreate, db: DBSession = Depends(get_db)):
+async def update_session(session_id: int, data: SessionCreate, db: AsyncSession = Depends(get_async_db)):
     """更新会话标题"""
-    session = db.query(Session).filter(Session.id == session_id).first()
-    if not session:
-        raise HTTPException(status_code=404, detail="会话不存在")
+    session = await get_session_or_404(db, session_id)
     session.title = data.title
-    db.commit()
-    db.refresh(session)
+    await db.commit()
+    await db.refresh(session)
     return session
 
 
 @router.delete("/{session_id}")
-def delete_session(session_id: int, db: DBSession = Depends(get_db)):
+async def delete_session(session_id: int, db: AsyncSession = Depends(get_async_db)):
     """删除会话"""
-    session = db.query(Session).filter(Session.id == session_id).first()
-    if not session:
-        raise HTTPException(status_code=404, detail="会话不存在")
-    db.delete(session)
-    db.commit()
+    session = await get_session_or_404(db, session_id)
+    await db.delete(session)
+    await db.commit()
     return {"message": "删除成功"}
 
 
-@router.get("/{session_id}/messages", response_model=List[MessageResponse])
-def get_session_messages(session_id: int, db: DBSession = Depends(get_db)):
-    """获取会话的所有消息"""
-    session = db.query(Session).filter(Session.id == session_id).first()
-    if not session:
-        raise HTTPException(status_code=404, detail="会话不存在")
-    messages = db.query(Message).filter(Message.session_id == session_id).order_by(Message.created_at).all()
-    return messages
+@router.get("/{session_id}/messages", response_model=None, responses={200: {"model": List[MessageFieldsResponse]}})
+async def get_session_messages(
+    session_id: int,
+    request: Request,
+    fields: Optional[str] = Query(None, description="只返回这些字段（逗号分隔），如 id,status,video_url；id 总是返回"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """获取会话的所有消息（按列查询，不构造 ORM 对象；指定 fields 时只读取需要的列）"""
+    try:
+        selected = parse_fields(fields, MESSAGE_FIELDS, "id")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await get_session_or_404(db, session_id)
+    result = await db.execute(
+        select(*(Message.__table__.c[name] for name in message_columns_for(selected)))
+        .where(Message.session_id == session_id)
+        .order_by(Message.created_at)
+    )
+    return await json_response(request, [message_row_to_dict(row, selected) for row in result.mappings()])
 
 
 @router.delete("/{session_id}/messages/{message_id}/and-after")
-def delete_message_and_after(session_id: int, message_id: int, db: DBSession = Depends(get_db)):
+async def delete_message_and_after(session_id: int, message_id: int, db: AsyncSession = Depends(get_async_db)):
     """删除指定消息及之后的所有消息（用于编辑重发）"""
-    session = db.query(Session).filter(Session.id == session_id).first()
-    if not session:
-        raise HTTPException(status_code=404, detail="会话不存在")
-    
+    await get_session_or_404(db, session_id)
+
     # 找到目标消息
-    target_message = db.query(Message).filter(
-        Message.id == message_id,
-        Message.session_id == session_id
-    ).first()
+    result = await db.execute(
+        select(Message).where(Message.id == message_id, Message.session_id == session_id)
+    )
+    target_message = result.scalars().first()
     if not target_message:
         raise HTTPException(status_code=404, detail="消息不存在")
-    
+
     # 删除该消息及之后的所有消息
-    deleted_count = db.query(Message).filter(
-        Message.session_id == session_id,
-        Message.created_at >= target_message.created_at
-    ).delete()
-    
-    db.commit()
+    result = await db.execute(
+        delete(Message).where(
+            Message.session_id == session_id,
+            Message.created_at >= target_message.created_at
+        )
+    )
+    deleted_count = result.rowcount
+    await refresh_session_summary_async(db, session_id)
+
+    await db.commit()
     print(f"[回滚] 删除了 {deleted_count} 条消息")
     return {"deleted_count": deleted_count}
@@ -2,8 +2,10 @@
 Pydantic schemas for API request/response
 """
 from datetime import datetime
-from typing import Optional, List
-from pydantic import BaseModel
+from typing import Optional, List, Dict
+from pydantic import BaseModel, Field, computed_field, create_model
+
+from services.thumbnails import thumbnail_urls
 
 
 # Session schemas
@@ -16,6 +18,12 @@ class SessionResponse(BaseModel):
     title: str
     created_at: datetime
     updated_at: datetime
+    message_count: int = 0
+    pending_count: int = 0
+    last_message_preview: Optional[str] = None
+    last_message_at: Optional[datetime] = None
+    last_media_url: Optional[str] = None
+    last_media_type: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -38,11 +46,89 @@ class MessageResponse(BaseModel):
     aspect_ratio: str
     duration: str
     created_at: datetime
+    poster_url: Optional[str] = None
+    last_frame_url: Optional[str] = None
+    video_duration: Optional[float] = None
+    video_fps: Optional[float] = None
+    video_width: Optional[int] = None
+    video_height: Optional[int] = None
+    video_bytes: Optional[int] = None
+    batch_id: Optional[str] = None
+
+    @computed_field
+    @property
+    def image_variants(self) -> Optional[Dict[str, str]]:
+        """生成图片的缩略图URL（按宽度档位）"""
+        return thumbnail_urls(self.video_url)
+
+    @computed_field
+    @property
+    def reference_image_variants(self) -> Optional[Dict[str, str]]:
+        """参考图片的缩略图URL（按宽度档位）"""
+        return thumbnail_urls(self.reference_image)
 
     class Config:
         from_attributes = True
 
 
+# 列表接口按列查询、直接序列化（见 services/json_response.py），字段与响应模型保持一致
+SESSION_COLUMNS = list(SessionResponse.model_fields)
+MESSAGE_COLUMNS = list(MessageResponse.model_fields)
+# 计算字段 -> 依赖的列
+MESSAGE_COMPUTED_FIELDS = {"image_variants": "video_url", "reference_image_variants": "reference_image"}
+MESSAGE_FIELDS = MESSAGE_COLUMNS + list(MESSAGE_COMPUTED_FIELDS)
+
+
+def partial_model(model, name: str, key: str):
+    """
+    fields= 接口的文档模型：主键字段 key 必有，其余字段可能缺失（只返回请求的字段）
+
+    这些接口直接返回序列化结果，模型只用于 OpenAPI 文档
+    """
+    fields = {
+        field: (info.annotation, ... if field == key else None)
+        for field, info in model.model_fields.items()
+    }
+    fields.update({
+        field: (info.return_type, None)
+        for field, info in model.model_computed_fields.items()
+    })
+    return create_model(
+        name,
+        __doc__=f"{model.__name__} 的字段子集：未指定 fields= 时返回全部字段，否则只返回请求的字段（{key} 总是返回）",
+        **fields,
+    )
+
+
+def parse_fields(fields: Optional[str], available: List[str], key: str) -> List[str]:
+    """
+    解析 fields= 参数（逗号分隔的字段名），为空时返回全部字段；主键字段 key 总是包含
+
+    Raises:
+        ValueError: 包含未知字段
+    """
+    if not fields:
+        return list(available)
+    requested = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in requested if name not in available]
+    if unknown:
+        raise ValueError(f"未知字段: {', '.join(unknown)}")
+    return [key] + [name for name in dict.fromkeys(requested) if name != key]
+
+
+def message_columns_for(fields: List[str]) -> List[str]:
+    """输出这些字段需要查询的列（计算字段换成其依赖的列）"""
+    return list(dict.fromkeys(MESSAGE_COMPUTED_FIELDS.get(name, name) for name in fields))
+
+
+def message_row_to_dict(row, fields: List[str] = MESSAGE_FIELDS) -> dict:
+    """查询行 -> 与 MessageResponse 序列化结果相同的字典（只含 fields 中的字段）"""
+    return {
+        name: thumbnail_urls(row[MESSAGE_COMPUTED_FIELDS[name]]) if name in MESSAGE_COMPUTED_FIELDS else row[name]
+        for name in fields
+    }
+
+
 # Generate request schemas
 class TextToVideoRequest(BaseModel):
     session_id: int
@@ -59,6 +145,72 @@ class ImageToVideoRequest(BaseModel):
     duration: str = "10"
 
 
+class VideoBatchRequest(BaseModel):
+    """批量生成视频：prompts × aspect_ratios × durations 的每个组合生成一个视频"""
+    session_id: int
+    prompts: List[str] = Field(min_length=1)
+    aspect_ratios: List[str] = Field(default=["9:16"], min_length=1)
+    durations: List[str] = Field(default=["10"], min_length=1)
+    image_url: Optional[str] = None  # 参考图片URL，所有组合共用
+
+
+class VideoBatchResponse(BaseModel):
+    batch_id: str
+    total: int
+    message_ids: List[int]
+
+
+class VideoBatchItem(BaseModel):
+    message_id: int
+    status: str
+    prompt: Optional[str]
+    aspect_ratio: str
+    duration: str
+    task_id: Optional[str]
+    video_url: Optional[str]
+    error_message: Optional[str]
+
+
+class VideoBatchProgress(BaseModel):
+    """批次汇总进度"""
+    batch_id: str
+    total: int
+    pending: int
+    queued: int
+    processing: int
+    success: int
+    failed: int
+    done: bool
+    items: List[VideoBatchItem]
+
+
+class VideoChainRequest(BaseModel):
+    """视频续写链：从已生成的视频尾帧开始，按提示词依次生成后续片段并拼接"""
+    session_id: int
+    source_message_id: int  # 起始视频所在的助手消息
+    prompts: List[str] = Field(min_length=1)  # 每段一个提示词
+    aspect_ratio: str = "9:16"
+    duration: str = "10"
+    include_source: bool = True  # 拼接结果是否包含起始视频
+
+
+class VideoChainResponse(BaseModel):
+    chain_id: str
+    segments: int
+
+
+class VideoChainProgress(BaseModel):
+    """续写链进度"""
+    chain_id: str
+    status: str  # running / stitching / completed / failed / interrupted
+    total_segments: int
+    current_segment: int
+    segments: List[VideoBatchItem]
+    output_message_id: Optional[int] = None
+    output_url: Optional[str] = None
+    error: Optional[str] = None
+
+
 class GenerateResponse(BaseModel):
     message_id: int
     task_id: str
@@ -70,3 +222,11 @@ class TaskStatusResponse(BaseModel):
     status: str
     video_url: Optional[str]
     error_message: Optional[str]
+
+
+# 状态接口字段 -> Message 列
+TASK_STATUS_COLUMNS = {"message_id": "id", "status": "status", "video_url": "video_url", "error_message": "error_message"}
+
+
+MessageFieldsResponse = partial_model(MessageResponse, "MessageFieldsResponse", "id")
+TaskStatusFieldsResponse = partial_model(TaskStatusResponse, "TaskStatusFieldsResponse", "message_id")
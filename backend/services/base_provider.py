@@ -2,11 +2,15 @@
 视频生成服务抽象基类
 不同的中转商只需继承此类并实现具体方法
 """
+import functools
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
 from enum import Enum
 from typing import Optional
 
+from services.metrics import observe_provider_request
+from services.tracing import span
+
 
 class TaskState(Enum):
     """任务状态枚举"""
@@ -35,6 +39,19 @@ class BaseVideoProvider(ABC):
     4. 在get_provider()中注册
     """
 
+    # 图生视频时服务商是否需要可公网访问的图片URL（需要时会先等待图片发布到图床）
+    requires_public_image_url = True
+    # 参考图片最长边上限（像素），超过的图片提交前会被缩小
+    max_reference_image_side = 2048
+
+    def __init_subclass__(cls, **kwargs):
+        """子类实现的 submit_task / query_task 自动记录耗时和错误（Prometheus 指标）"""
+        super().__init_subclass__(**kwargs)
+        for operation in ("submit_task", "query_task"):
+            method = cls.__dict__.get(operation)
+            if method is not None:
+                setattr(cls, operation, _instrumented(method, cls.__name__, operation))
+
     @abstractmethod
     def submit_task(
         self,
@@ -73,3 +90,11 @@ class BaseVideoProvider(ABC):
             TaskResult对象，包含状态和结果
         """
         pass
+
+
+def _instrumented(method, provider: str, operation: str):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        with observe_provider_request(provider, operation), span("provider", f"{provider}.{operation}"):
+            return method(*args, **kwargs)
+    return wrapper
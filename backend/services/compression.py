@@ -0,0 +1,53 @@
+"""
+HTTP 内容编码协商与压缩（gzip / brotli）
+brotli 为可选依赖，未安装时只使用 gzip
+"""
+import gzip
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 按优先级排列
+ENCODINGS = ("br", "gzip")
+
+
+def available_encodings() -> list:
+    return [encoding for encoding in ENCODINGS if encoding != "br" or brotli is not None]
+
+
+def compress(data: bytes, encoding: str, level: str = "max") -> bytes:
+    """
+    Args:
+        level: max（预压缩，只做一次）/ fast（每个请求动态压缩）。
+            fast 的参数按 4 MB 消息列表实测选取：br 质量 1 约 7 ms、gzip 级别 4 约 33 ms，
+            体积都在原始的 8%~9%，更高级别体积只小 10%~20%，耗时却翻几倍
+    """
+    if encoding == "br":
+        return brotli.compress(data, quality=11 if level == "max" else 1)
+    # mtime=0：相同输入得到相同输出，ETag 稳定
+    return gzip.compress(data, compresslevel=9 if level == "max" else 4, mtime=0)
+
+
+def choose_encoding(accept_encoding: Optional[str], available) -> Optional[str]:
+    """按 Accept-Encoding 选择编码（q=0 表示拒绝），按 available 的顺序优先"""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    wildcard = accepted.get("*", 0.0)
+    for encoding in available:
+        if accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return None
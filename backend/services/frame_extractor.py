@@ -0,0 +1,312 @@
+"""
+视频尾帧提取
+已下载到本地的视频直接从磁盘解码，只有找不到本地文件时才下载；
+解码在进程池中执行，结果按视频标识缓存（LRU），
+"从尾帧继续"的链式生成再次提取同一视频时无需重新解码
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import FRAME_CONFIG, SERVER_CONFIG
+from models import Message
+from services.media_store import local_path_of
+from services.metrics import FRAME_EXTRACTION_SECONDS
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class FrameExtractionError(Exception):
+    """无法从视频中提取帧"""
+
+
+def read_last_frame(cap):
+    """定位到最后一帧读取；帧数元数据不准时向前回退几帧"""
+    import cv2
+
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    for back in range(1, 6):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, max(0, total_frames - back))
+        ret, frame = cap.read()
+        if ret:
+            return frame
+        if total_frames - back <= 0:
+            break
+    return None
+
+
+def decode_last_frame_png(source: str, is_remote: bool, timeout: int) -> bytes:
+    """
+    解码视频最后一帧并编码为 PNG（在子进程中执行）
+
+    Args:
+        source: 本地文件路径，或 is_remote 时的视频URL
+        is_remote: 是否需要先下载
+        timeout: 下载超时（秒）
+    """
+    import cv2
+    import requests
+
+    tmp_path = None
+    try:
+        if is_remote:
+            # 分块下载到临时文件，不在内存中保存整个视频
+            with requests.get(source, timeout=timeout, stream=True) as response:
+                response.raise_for_status()
+                with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as tmp:
+                    tmp_path = tmp.name
+                    for chunk in response.iter_content(chunk_size=1024 * 1024):
+                        tmp.write(chunk)
+            path = tmp_path
+        else:
+            path = source
+
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            raise FrameExtractionError("无法打开视频")
+        try:
+            frame = read_last_frame(cap)
+        finally:
+            cap.release()
+        if frame is None:
+            raise FrameExtractionError("无法读取帧")
+
+        ok, buffer = cv2.imencode('.png', frame)
+        if not ok:
+            raise FrameExtractionError("帧编码失败")
+        return buffer.tobytes()
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+FRAME_FORMATS = {
+    "png": (".png", "image/png"),
+    "jpeg": (".jpg", "image/jpeg"),
+    "webp": (".webp", "image/webp"),
+}
+
+
+def transcode_frame(png: bytes, fmt: str, max_size: Optional[int], quality: int) -> bytes:
+    """把 PNG 帧缩放到最长边不超过 max_size 并转码（在子进程中执行）"""
+    import cv2
+    import numpy as np
+
+    frame = cv2.imdecode(np.frombuffer(png, np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        raise FrameExtractionError("帧解码失败")
+    height, width = frame.shape[:2]
+    if max_size and max(height, width) > max_size:
+        scale = max_size / max(height, width)
+        frame = cv2.resize(
+            frame,
+            (max(1, round(width * scale)), max(1, round(height * scale))),
+            interpolation=cv2.INTER_AREA,
+        )
+
+    params = {
+        "jpeg": [cv2.IMWRITE_JPEG_QUALITY, quality],
+        "webp": [cv2.IMWRITE_WEBP_QUALITY, quality],
+    }.get(fmt, [])
+    ok, buffer = cv2.imencode(FRAME_FORMATS[fmt][0], frame, params)
+    if not ok:
+        raise FrameExtractionError("帧编码失败")
+    return buffer.tobytes()
+
+
+class FrameCache:
+    """按字节数限制容量的 LRU 缓存"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._items[key] = value
+            self._size += len(value)
+            while self._size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted)
+
+
+_frame_cache = FrameCache(FRAME_CONFIG["cache_max_bytes"])
+# 同一视频的并发提取只解码一次
+_inflight = {}
+
+
+def get_frame_executor() -> ProcessPoolExecutor:
+    """解码进程池（按需创建，视频后处理也复用）"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=FRAME_CONFIG["process_workers"])
+        return _executor
+
+
+def shutdown_frame_executor():
+    """关闭解码进程池"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+async def resolve_local_video(db: AsyncSession, video_url: str) -> Optional[str]:
+    """
+    找到视频对应的本地文件
+
+    支持 /downloads/xxx.mp4 本地URL，以及已下载到本地的远程 video_url
+    """
+    path = local_path_of(video_url)
+    if path and os.path.isfile(path):
+        return path
+    result = await db.execute(
+        select(Message.local_path).where(
+            Message.video_url == video_url,
+            Message.local_path.isnot(None),
+        ).limit(1)
+    )
+    local_path = result.scalar()
+    if local_path:
+        path = os.path.join(SERVER_CONFIG["downloads_dir"], os.path.basename(local_path))
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _video_identity(local_path: Optional[str], video_url: str) -> str:
+    """缓存键：本地文件用路径+大小+修改时间，远程视频用URL"""
+    if local_path:
+        stat = os.stat(local_path)
+        return f"file:{local_path}:{stat.st_size}:{stat.st_mtime_ns}"
+    return f"url:{video_url}"
+
+
+async def resolve_video_identity(db: AsyncSession, video_url: str) -> tuple:
+    """
+    Returns:
+        (本地文件路径或 None, 视频标识)
+
+    Raises:
+        FileNotFoundError: 本地URL对应的文件不存在
+    """
+    local_path = await resolve_local_video(db, video_url)
+    if local_path is None and local_path_of(video_url):
+        raise FileNotFoundError(video_url)
+    return local_path, _video_identity(local_path, video_url)
+
+
+def frame_etag(video_key: str, fmt: str, max_size: Optional[int], quality: int) -> str:
+    """尾帧图片的 ETag：由视频标识和输出参数决定"""
+    digest = hashlib.sha256(f"{video_key}|{fmt}|{max_size}|{quality}".encode()).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+async def extract_last_frame_image(
+    db: AsyncSession,
+    video_url: str,
+    fmt: str,
+    max_size: Optional[int],
+    quality: int,
+) -> bytes:
+    """
+    提取尾帧并按指定格式/尺寸输出，转码结果同样进入 LRU 缓存
+
+    Args:
+        fmt: png / jpeg / webp
+        max_size: 最长边像素上限，None 表示原尺寸
+        quality: JPEG/WebP 质量（1-100）
+    """
+    png = await extract_last_frame_png(db, video_url)
+    if fmt == "png" and not max_size:
+        return png
+
+    _, video_key = await resolve_video_identity(db, video_url)
+    key = f"{video_key}|{fmt}|{max_size}|{quality}"
+    cached = _frame_cache.get(key)
+    if cached is not None:
+        return cached
+
+    loop = asyncio.get_running_loop()
+    image = await loop.run_in_executor(get_frame_executor(), transcode_frame, png, fmt, max_size, quality)
+    _frame_cache.put(key, image)
+    return image
+
+
+async def extract_last_frame_png(db: AsyncSession, video_url: str) -> bytes:
+    """
+    提取视频最后一帧（PNG 字节），命中缓存时直接返回
+
+    Raises:
+        FileNotFoundError: 本地URL对应的文件不存在
+        FrameExtractionError: 视频无法打开或读取
+        requests.RequestException: 远程视频下载失败
+    """
+    started = time.perf_counter()
+    local_path, key = await resolve_video_identity(db, video_url)
+
+    cached = _frame_cache.get(key)
+    if cached is not None:
+        FRAME_EXTRACTION_SECONDS.labels(source="cache").observe(time.perf_counter() - started)
+        return cached
+
+    # 下载后处理已生成尾帧时直接读取，无需解码
+    if local_path:
+        from services.media_processing import last_frame_path_for
+        stored = last_frame_path_for(local_path)
+        if os.path.isfile(stored):
+            png = await run_in_threadpool(_read_file, stored)
+            _frame_cache.put(key, png)
+            FRAME_EXTRACTION_SECONDS.labels(source="stored").observe(time.perf_counter() - started)
+            return png
+
+    future = _inflight.get(key)
+    if future is None:
+        loop = asyncio.get_running_loop()
+        source = local_path or video_url
+        future = loop.run_in_executor(
+            get_frame_executor(),
+            decode_last_frame_png,
+            source,
+            local_path is None,
+            FRAME_CONFIG["download_timeout"],
+        )
+        _inflight[key] = future
+        future.add_done_callback(lambda _: _inflight.pop(key, None))
+
+    png = await asyncio.shield(future)
+    _frame_cache.put(key, png)
+    FRAME_EXTRACTION_SECONDS.labels(source="decode").observe(time.perf_counter() - started)
+    return png
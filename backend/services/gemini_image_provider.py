@@ -9,11 +9,15 @@ from typing import Optional
 from openai import OpenAI
 
 from config import GEMINI_IMAGE_CONFIG
+from services.tracing import span
 
 
 class GeminiImageProvider:
     """Gemini 图片生成服务"""
 
+    # 参考图片最长边上限（像素），更大的图片不会提升生成效果，只会增大请求体
+    max_reference_image_side = 1536
+
     def __init__(self):
         self.api_key = GEMINI_IMAGE_CONFIG["api_key"]
         self.base_url = GEMINI_IMAGE_CONFIG["base_url"]
@@ -47,6 +51,7 @@ class GeminiImageProvider:
         self,
         prompt: str,
         reference_image_base64: Optional[str] = None,
+        reference_image_mime_type: str = "image/png",
     ) -> dict:
         """
         生成图片
@@ -54,9 +59,10 @@ class GeminiImageProvider:
         Args:
             prompt: 生成提示词
             reference_image_base64: 参考图片的 base64 编码（图生图时使用）
+            reference_image_mime_type: 参考图片的 MIME 类型
             
         Returns:
-            {"image_base64": "...", "content": "..."}
+            {"image_base64": "...", "content": "..."}，image_base64 为 base64 或 data URL
         """
         print(f"[Gemini图片] 开始生成，提示词: {prompt[:50]}...")
         
@@ -69,7 +75,7 @@ class GeminiImageProvider:
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:image/png;base64,{reference_image_base64}"
+                            "url": f"data:{reference_image_mime_type};base64,{reference_image_base64}"
                         }
                     },
                     {
@@ -83,43 +89,38 @@ class GeminiImageProvider:
             messages = [{"role": "user", "content": prompt}]
         
         try:
-            completion = self.client.chat.completions.create(
-                model=self.model,
-                extra_headers={
-                    "HTTP-Referer": "http://115.120.15.8:8002",
-                    "X-Title": "AI Video Generator",
-                },
-                messages=messages,
-                stream=False,
-            )
+            with span("provider", "GeminiImageProvider.generate_image"):
+                completion = self.client.chat.completions.create(
+                    model=self.model,
+                    extra_headers={
+                        "HTTP-Referer": "http://115.120.15.8:8002",
+                        "X-Title": "AI Video Generator",
+                    },
+                    messages=messages,
+                    stream=False,
+                )
         except Exception as e:
             print(f"[Gemini图片] 请求失败: {e}")
             raise Exception(f"图片生成请求失败: {e}")
         
-        # 解析响应
-        msg_dict = completion.choices[0].message.model_dump()
-        images = msg_dict.get("images", [])
-        content = msg_dict.get("content", "")
+        # 解析响应：直接读取字段，不对整条消息 model_dump（会深拷贝多 MB 的图片数据）
+        message = completion.choices[0].message
+        images = (message.model_extra or {}).get("images") or []
+        content = message.content or ""
         
         if not images:
             print(f"[Gemini图片] 响应中没有图片，内容: {content[:100]}")
             raise Exception("生成失败：响应中没有图片")
         
-        # 提取图片数据
+        # 提取图片数据（data URL，保持原样交给调用方分段解码，不再切片复制）
         image_data = images[0].get("image_url", {}).get("url", "")
         if not image_data:
             raise Exception("生成失败：图片数据为空")
         
-        # 分离 base64 数据
-        if "," in image_data:
-            _, b64_data = image_data.split(",", 1)
-        else:
-            b64_data = image_data
-        
-        print(f"[Gemini图片] 生成成功，数据大小: {len(b64_data) / 1024:.1f} KB")
+        print(f"[Gemini图片] 生成成功，数据大小: {len(image_data) / 1024:.1f} KB")
         
         return {
-            "image_base64": b64_data,
+            "image_base64": image_data,
             "content": content,
         }
 
@@ -0,0 +1,125 @@
+"""
+GitHub 图床
+视频服务商只能拉取公网图片，图生视频前需要把本地上传的图片发布到图床
+"""
+import base64
+import json
+import os
+from typing import Optional
+
+import requests
+
+from services.tracing import span
+
+# GitHub 图床配置（从 credentials.py 读取）
+try:
+    from credentials import GITHUB_TOKEN, GITHUB_REPO
+except ImportError:
+    GITHUB_TOKEN = ""
+    GITHUB_REPO = "hezawei/image-bed"
+
+
+def is_configured() -> bool:
+    """是否配置了图床 Token"""
+    return bool(GITHUB_TOKEN)
+
+
+def public_url_of(filename: str) -> str:
+    """图床上文件的 raw 链接"""
+    return f"https://raw.githubusercontent.com/{GITHUB_REPO}/main/images/{filename}"
+
+
+class _Base64JsonBody:
+    """
+    流式生成 GitHub contents API 的 JSON 请求体
+
+    按 3 字节整数倍分块读取文件并编码为 base64，内存中只保留一个分块；
+    实现 __len__ 使 requests 以 Content-Length 发送而不是一次性拼出整个请求体
+    """
+
+    CHUNK_SIZE = 3 * 256 * 1024
+
+    def __init__(self, message: str, filepath: str):
+        self._prefix = json.dumps({"message": message})[:-1].encode() + b', "content": "'
+        self._suffix = b'"}'
+        self._file = open(filepath, "rb")
+        file_size = os.path.getsize(filepath)
+        self._length = len(self._prefix) + 4 * ((file_size + 2) // 3) + len(self._suffix)
+        self._buffer = self._prefix
+        self._offset = 0
+        self._done = False
+
+    def __len__(self):
+        return self._length
+
+    def _refill(self):
+        chunk = self._file.read(self.CHUNK_SIZE)
+        if chunk:
+            self._buffer = base64.b64encode(chunk)
+        else:
+            self._buffer = self._suffix
+            self._done = True
+            self._file.close()
+        self._offset = 0
+
+    def read(self, size: int = -1) -> bytes:
+        """每次最多返回当前分块的剩余部分，读完返回空字节串"""
+        if self._offset >= len(self._buffer):
+            if self._done:
+                return b""
+            self._refill()
+        end = len(self._buffer) if size < 0 else self._offset + size
+        data = self._buffer[self._offset:end]
+        self._offset += len(data)
+        return data
+
+    def close(self):
+        self._file.close()
+
+
+def publish_image(filename: str, filepath: str) -> Optional[str]:
+    """
+    上传图片到 GitHub 图床
+
+    Args:
+        filename: 图床上的文件名（内容寻址，同名即同内容）
+        filepath: 本地文件路径，请求体从磁盘流式编码
+
+    Returns:
+        公网URL，失败返回 None
+    """
+    if not GITHUB_TOKEN:
+        print("[警告] 未配置 GITHUB_TOKEN，图生视频功能不可用")
+        print("请创建 GitHub Token: https://github.com/settings/tokens")
+        return None
+
+    body = None
+    try:
+        body = _Base64JsonBody(f"Upload {filename}", filepath)
+        github_api = f"https://api.github.com/repos/{GITHUB_REPO}/contents/images/{filename}"
+
+        with span("image_host", filename):
+            response = requests.put(
+                github_api,
+                headers={
+                    "Authorization": f"token {GITHUB_TOKEN}",
+                    "Accept": "application/vnd.github.v3+json",
+                    "Content-Type": "application/json",
+                },
+                data=body,
+                timeout=15
+            )
+
+        # 422 且要求提供 sha 表示同名文件已存在；文件名由内容哈希决定，已存在即内容相同
+        already_exists = response.status_code == 422 and "sha" in response.text
+        if response.status_code in [200, 201] or already_exists:
+            public_url = public_url_of(filename)
+            print(f"GitHub上传成功: {public_url}")
+            return public_url
+        print(f"GitHub上传失败: {response.status_code} - {response.text[:200]}")
+    except Exception as e:
+        print(f"GitHub上传失败: {e}")
+    finally:
+        if body:
+            body.close()
+    return None
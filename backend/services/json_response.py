@@ -0,0 +1,33 @@
+"""
+列表接口的快速 JSON 响应
+跳过 Pydantic 逐对象校验和默认编码器，查询行直接转为 dict 后用 orjson 序列化；
+响应较大且客户端支持时按 Accept-Encoding 压缩（br / gzip）
+"""
+import orjson
+from fastapi import Request, Response
+from fastapi.concurrency import run_in_threadpool
+
+from services.compression import available_encodings, choose_encoding, compress
+
+# 小于此大小不压缩（压缩收益不抵开销）
+COMPRESS_MIN_BYTES = 1024
+# 大于此大小在线程池中压缩，不阻塞事件循环
+THREADPOOL_COMPRESS_BYTES = 256 * 1024
+
+
+async def json_response(request: Request, content) -> Response:
+    """
+    Args:
+        content: 只含 dict/list/str/数字/datetime 的数据（datetime 输出与 Pydantic 相同的 ISO 格式）
+    """
+    body = orjson.dumps(content)
+    headers = {"vary": "Accept-Encoding"}
+    if len(body) >= COMPRESS_MIN_BYTES:
+        encoding = choose_encoding(request.headers.get("accept-encoding"), available_encodings())
+        if encoding:
+            if len(body) >= THREADPOOL_COMPRESS_BYTES:
+                body = await run_in_threadpool(compress, body, encoding, "fast")
+            else:
+                body = compress(body, encoding, "fast")
+            headers["content-encoding"] = encoding
+    return Response(body, media_type="application/json", headers=headers)
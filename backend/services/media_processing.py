@@ -0,0 +1,184 @@
+"""
+视频下载后处理
+视频下载完成后立即生成封面帧、尾帧（faststart 改写在下载时、改名为最终文件名之前完成），
+并探测时长、帧率、分辨率和文件大小写回 Message，
+之后的预览、提取尾帧、续写都直接使用这些结果，不再临时解码
+"""
+import os
+
+from config import SERVER_CONFIG
+from database import SessionLocal
+from models import Message
+from services.frame_extractor import get_frame_executor, read_last_frame
+from services.media_store import file_name_of
+from services.mp4 import faststart_mp4
+from services.session_summary import refresh_session_summary
+
+DERIVED_URL_PREFIX = "/api/media/derived/"
+
+POSTER_JPEG_QUALITY = 85
+PROCESS_TIMEOUT_SECONDS = 120
+
+
+def derived_file_names(video_filename: str) -> tuple:
+    """视频对应的 (封面帧文件名, 尾帧文件名)"""
+    stem = os.path.splitext(os.path.basename(video_filename))[0]
+    return f"{stem}.poster.jpg", f"{stem}.last.png"
+
+
+def last_frame_path_for(video_path: str) -> str:
+    """视频对应的尾帧文件路径（可能尚未生成）"""
+    return os.path.join(SERVER_CONFIG["derived_dir"], derived_file_names(video_path)[1])
+
+
+def _write_image(path: str, ext: str, frame, params=None):
+    import cv2
+
+    ok, buffer = cv2.imencode(ext, frame, params or [])
+    if not ok:
+        raise Exception(f"图片编码失败: {path}")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(buffer.tobytes())
+    os.replace(tmp_path, path)
+
+
+def analyze_video(video_path: str, poster_path: str, last_frame_path: str) -> dict:
+    """
+    生成封面帧（JPEG）和尾帧（PNG，续写时作为参考图需无损），返回视频元数据（在子进程中执行）
+    """
+    import cv2
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise Exception("无法打开视频")
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+        ret, first_frame = cap.read()
+        if ret:
+            _write_image(poster_path, ".jpg", first_frame, [cv2.IMWRITE_JPEG_QUALITY, POSTER_JPEG_QUALITY])
+        last_frame = read_last_frame(cap)
+        if last_frame is not None:
+            _write_image(last_frame_path, ".png", last_frame)
+    finally:
+        cap.release()
+
+    return {
+        "has_poster": bool(ret),
+        "has_last_frame": last_frame is not None,
+        "duration": round(frame_count / fps, 3) if fps else None,
+        "fps": round(fps, 3) if fps else None,
+        "width": width or None,
+        "height": height or None,
+        "bytes": os.path.getsize(video_path),
+    }
+
+
+def process_downloaded_video(message_id: int):
+    """
+    对已下载的视频做后处理并写回数据库（在轮询线程中调用，解码在进程池中执行）
+    """
+    db = SessionLocal()
+    try:
+        message = db.query(Message).filter(Message.id == message_id).first()
+        if not message or not message.local_path:
+            return
+
+        video_filename = os.path.basename(message.local_path)
+        video_path = os.path.join(SERVER_CONFIG["downloads_dir"], video_filename)
+        derived_dir = SERVER_CONFIG["derived_dir"]
+        os.makedirs(derived_dir, exist_ok=True)
+        poster_name, last_frame_name = derived_file_names(video_filename)
+
+        future = get_frame_executor().submit(
+            analyze_video,
+            video_path,
+            os.path.join(derived_dir, poster_name),
+            os.path.join(derived_dir, last_frame_name),
+        )
+        info = future.result(timeout=PROCESS_TIMEOUT_SECONDS)
+
+        message.poster_url = f"{DERIVED_URL_PREFIX}{poster_name}" if info["has_poster"] else None
+        message.last_frame_url = f"{DERIVED_URL_PREFIX}{last_frame_name}" if info["has_last_frame"] else None
+        message.video_duration = info["duration"]
+        message.video_fps = info["fps"]
+        message.video_width = info["width"]
+        message.video_height = info["height"]
+        message.video_bytes = info["bytes"]
+        db.commit()
+        print(f"[后处理] 消息 {message_id}: {info['width']}x{info['height']} {info['duration']}s {info['bytes']} 字节")
+    except Exception as e:
+        print(f"[后处理] 消息 {message_id} 处理失败: {e}")
+    finally:
+        db.close()
+
+
+FASTSTART_SUFFIX = ".fs.mp4"
+
+
+def _point_messages_to(db, old_name: str, new_name: str) -> int:
+    """把引用旧文件的消息（local_path / 本地 video_url）改为新文件，返回更新的消息数"""
+    old_url, new_url = f"/downloads/{old_name}", f"/downloads/{new_name}"
+    messages = db.query(Message).filter(
+        (Message.local_path.like(f"%{old_name}")) | (Message.video_url == old_url)
+    ).all()
+    session_ids = set()
+    for message in messages:
+        if file_name_of(message.local_path) == old_name:
+            message.local_path = new_name
+            session_ids.add(message.session_id)
+        if message.video_url == old_url:
+            message.video_url = new_url
+            session_ids.add(message.session_id)
+    for session_id in session_ids:
+        refresh_session_summary(db, session_id)
+    db.commit()
+    return len(messages)
+
+
+def faststart_existing_downloads() -> dict:
+    """
+    把早期下载、moov 位于末尾的视频改写为 faststart（新下载的视频在下载时已改写）
+
+    /downloads/ 下的URL按 immutable 缓存，不能原地改写：结果写到 <原文件名>.fs.mp4，
+    引用的消息改指向新文件，旧文件不再被引用，过了保护期由媒体回收删除
+
+    Returns:
+        {"checked": 检查的文件数, "rewritten": 改写的文件数, "failed": 失败的文件数}
+    """
+    downloads_dir = SERVER_CONFIG["downloads_dir"]
+    report = {"checked": 0, "rewritten": 0, "failed": 0}
+    if not os.path.isdir(downloads_dir):
+        return report
+    executor = get_frame_executor()
+    db = SessionLocal()
+    try:
+        for name in sorted(os.listdir(downloads_dir)):
+            if not name.endswith(".mp4") or name.endswith(FASTSTART_SUFFIX):
+                continue
+            report["checked"] += 1
+            new_name = name[:-len(".mp4")] + FASTSTART_SUFFIX
+            if os.path.exists(os.path.join(downloads_dir, new_name)):
+                # 已改写过，旧文件等待回收
+                _point_messages_to(db, name, new_name)
+                continue
+            try:
+                rewritten = executor.submit(
+                    faststart_mp4,
+                    os.path.join(downloads_dir, name),
+                    os.path.join(downloads_dir, new_name),
+                ).result(timeout=PROCESS_TIMEOUT_SECONDS)
+                if rewritten:
+                    _point_messages_to(db, name, new_name)
+                    report["rewritten"] += 1
+            except Exception as e:
+                db.rollback()
+                print(f"[后处理] {name} faststart 改写失败: {e}")
+                report["failed"] += 1
+    finally:
+        db.close()
+    return report
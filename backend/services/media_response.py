@@ -0,0 +1,71 @@
+"""
+媒体文件响应
+在 FileResponse（已支持 Range/If-Range 分段响应）的基础上补充：
+强 ETag（内容寻址文件用 SHA-256，其他文件用大小+修改时间）和 If-None-Match 条件请求。
+服务器支持 ASGI pathsend 扩展时由服务器直接发送文件（sendfile），否则按大块读取
+"""
+import os
+import re
+from typing import Optional
+
+from fastapi import Request, Response
+from fastapi.responses import FileResponse
+
+_SHA256_NAME = re.compile(r"^[0-9a-f]{64}$")
+
+# 唯一命名、内容不变的媒体文件
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class MediaFileResponse(FileResponse):
+    """视频文件较大，用更大的读块减少事件循环往返（未启用 pathsend 时生效）"""
+    chunk_size = 1024 * 1024
+
+
+def strong_etag_of(path: str) -> Optional[str]:
+    """内容寻址文件（文件名即 SHA-256）的强 ETag，其他文件返回 None"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if _SHA256_NAME.match(stem):
+        return f'"{stem}"'
+    return None
+
+
+def file_etag(path: str, stat: os.stat_result) -> str:
+    """强 ETag：内容寻址文件取 SHA-256，其他文件取大小和纳秒级修改时间（文件只会整体替换）"""
+    return strong_etag_of(path) or f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+def media_file_response(
+    request: Request,
+    path: str,
+    cache_control: str,
+    media_type: Optional[str] = None,
+    etag: Optional[str] = None,
+    headers: Optional[dict] = None,
+) -> Response:
+    """
+    返回媒体文件，支持 ETag 协商缓存和 Range 分段请求
+
+    Args:
+        request: 当前请求（读取 If-None-Match）
+        path: 文件路径（调用方需确认文件存在且在允许的目录内）
+        cache_control: Cache-Control 响应头
+        media_type: 为空时按扩展名推断
+        etag: 调用方已知的强 ETag，为空时按文件推断
+        headers: 额外的响应头（如 Content-Encoding、Vary）
+
+    Raises:
+        FileNotFoundError: 文件在检查之后被删除
+    """
+    stat = os.stat(path)
+    etag = etag or file_etag(path, stat)
+    headers = {**(headers or {}), "cache-control": cache_control, "accept-ranges": "bytes", "etag": etag}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return MediaFileResponse(path, media_type=media_type, headers=headers, stat_result=stat)
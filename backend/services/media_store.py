@@ -0,0 +1,312 @@
+"""
+内容寻址媒体存储
+文件以内容的 SHA-256 命名，相同内容只落盘、只发布一次。
+是否仍被使用由 Message 表的引用计数决定（见 reference_counts），
+引用为 0 的文件由 tasks/media_gc.py 回收
+"""
+import binascii
+import hashlib
+import os
+import time
+import uuid
+from collections import Counter
+from typing import Optional, Union
+from urllib.parse import urlparse
+
+import aiofiles
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import IntegrityError
+from starlette.datastructures import Headers
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import SERVER_CONFIG, UPLOAD_CONFIG
+from models import Message, MediaObject
+
+# 本地访问URL前缀 -> 存储目录
+MEDIA_ROOTS = {
+    "/uploads/": "uploads_dir",
+    "/downloads/": "downloads_dir",
+    "/api/media/derived/": "derived_dir",
+}
+
+
+def content_hash(data: bytes) -> str:
+    """计算内容的 SHA-256"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def media_filename(sha256: str, ext: str) -> str:
+    """内容寻址文件名"""
+    return f"{sha256}{ext.lower()}"
+
+
+def file_name_of(value: Optional[str]) -> Optional[str]:
+    """从本地路径 / 本地URL / 图床URL 中取出文件名（图床文件名与本地文件名一致）"""
+    if not value or value.startswith("data:"):
+        return None
+    return os.path.basename(urlparse(value).path) or None
+
+
+def local_path_of(url: str) -> Optional[str]:
+    """把 /uploads/xxx、/downloads/xxx 形式的本地URL转换为磁盘路径"""
+    for prefix, dir_key in MEDIA_ROOTS.items():
+        if url.startswith(prefix):
+            return os.path.join(SERVER_CONFIG[dir_key], os.path.basename(url))
+    return None
+
+
+def write_media_file(directory: str, filename: str, data: bytes) -> str:
+    """
+    写入媒体文件，已存在则跳过
+
+    先写临时文件再原子替换，并发写入相同内容时不会产生半截文件
+    """
+    os.makedirs(directory, exist_ok=True)
+    filepath = os.path.join(directory, filename)
+    if os.path.exists(filepath):
+        return filepath
+    tmp_path = os.path.join(directory, f".write-{uuid.uuid4().hex}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, filepath)
+    return filepath
+
+
+# 每次读取的 base64 字符数
+_BASE64_CHUNK_CHARS = 4 * 256 * 1024
+_BASE64_WHITESPACE = b" \t\r\n\v\f"
+
+
+def _iter_base64_chunks(data: Union[str, memoryview], start: int):
+    """
+    按段切片并去掉空白（MIME 换行的 base64 很常见），每段只解码 4 的倍数个字符，
+    余下的字符拼到下一段开头，保证各段可独立解码
+    """
+    carry = b""
+    for offset in range(start, len(data), _BASE64_CHUNK_CHARS):
+        piece = data[offset:offset + _BASE64_CHUNK_CHARS]
+        piece = piece.encode("ascii", "replace") if isinstance(piece, str) else piece.tobytes()
+        piece = carry + piece.translate(None, _BASE64_WHITESPACE)
+        usable = len(piece) - len(piece) % 4
+        carry = piece[usable:]
+        if usable:
+            yield binascii.a2b_base64(piece[:usable])
+    if carry:
+        yield binascii.a2b_base64(carry)  # 长度不是 4 的倍数的残段：无效 base64，抛出 binascii.Error
+
+
+def write_base64_media_file(directory: str, data: Union[str, bytes, memoryview], ext: str) -> tuple:
+    """
+    把 base64（或 data URL）分段解码直接写入媒体目录，边写边计算 SHA-256
+
+    不生成完整的解码结果，也不切出去掉 data URL 前缀的副本：
+    str 按段切片，bytes 通过 memoryview 切片，额外内存只有一个分段；允许夹带空白和换行
+
+    Returns:
+        (SHA-256, 文件名, 文件路径, 字节数)
+
+    Raises:
+        binascii.Error: base64 无效
+    """
+    if not isinstance(data, str):
+        data = memoryview(data)
+    head = data[:256] if isinstance(data, str) else data[:256].tobytes().decode("ascii", "replace")
+    start = 0
+    if head.startswith("data:"):
+        start = head.find(",") + 1
+        if start == 0:
+            raise binascii.Error("data URL 缺少 base64 数据")
+
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, f".decode-{uuid.uuid4().hex}.tmp")
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in _iter_base64_chunks(data, start):
+                hasher.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+
+        sha256 = hasher.hexdigest()
+        filename = media_filename(sha256, ext)
+        filepath = os.path.join(directory, filename)
+        if os.path.exists(filepath):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, filepath)
+        return sha256, filename, filepath, size
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class MediaTooLargeError(Exception):
+    """上传文件超过大小上限"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        super().__init__(f"文件超过大小上限 {max_bytes // 1024 // 1024} MB")
+
+
+# 表单边界、字段头等随文件一起上传的额外字节
+_MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadSizeLimitMiddleware:
+    """
+    上传接口的请求体大小限制（纯 ASGI 中间件）
+
+    表单在进入路由函数之前就会被完整接收并落到临时文件，stream_upload_to_store 的校验只是兜底；
+    这里按 Content-Length 在接收前直接拒绝，未声明长度时边接收边计数，超限即中止
+    """
+
+    def __init__(self, app, paths: tuple):
+        self.app = app
+        self.paths = set(paths)
+        self.max_body_bytes = UPLOAD_CONFIG["max_bytes"] + _MULTIPART_OVERHEAD_BYTES
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        detail = str(MediaTooLargeError(UPLOAD_CONFIG["max_bytes"]))
+        content_length = Headers(scope=scope).get("content-length", "")
+        if content_length.isdigit() and int(content_length) > self.max_body_bytes:
+            await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_bytes:
+                    # 表单解析中抛出的 HTTPException 由 FastAPI 原样转为响应
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+async def stream_upload_to_store(upload: UploadFile, directory: str, ext: str) -> tuple:
+    """
+    把上传文件分块写入媒体目录，边写边计算 SHA-256 并校验大小
+
+    内存占用只有一个分块；写完后按内容哈希重命名，相同内容已存在时丢弃本次写入
+
+    Returns:
+        (SHA-256, 文件名, 文件路径, 字节数)
+
+    Raises:
+        MediaTooLargeError: 超过 UPLOAD_CONFIG["max_bytes"]
+    """
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, f".upload-{uuid.uuid4().hex}.tmp")
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(tmp_path, "wb") as f:
+            while True:
+                chunk = await upload.read(UPLOAD_CONFIG["chunk_size"])
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > UPLOAD_CONFIG["max_bytes"]:
+                    raise MediaTooLargeError(UPLOAD_CONFIG["max_bytes"])
+                hasher.update(chunk)
+                await f.write(chunk)
+
+        sha256 = hasher.hexdigest()
+        filename = media_filename(sha256, ext)
+        filepath = os.path.join(directory, filename)
+        if os.path.exists(filepath):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, filepath)
+        return sha256, filename, filepath, size
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def touch_media(path: str):
+    """刷新文件的访问/修改时间"""
+    now = time.time()
+    os.utime(path, (now, now))
+
+
+async def find_media(db: AsyncSession, sha256: str) -> Optional[MediaObject]:
+    """
+    按内容哈希查找已存储的媒体
+
+    文件已被回收的记录会被清理并返回 None；命中时刷新文件时间，
+    避免刚被复用的文件在消息写入前被回收
+    """
+    media = await db.get(MediaObject, sha256)
+    if not media:
+        return None
+    path = local_path_of(media.url)
+    if not path or not os.path.exists(path):
+        await db.delete(media)
+        await db.commit()
+        return None
+    touch_media(path)
+    return media
+
+
+async def register_media(db: AsyncSession, sha256: str, url: str, public_url: Optional[str] = None) -> MediaObject:
+    """登记新存储的媒体（已登记则返回原记录）"""
+    media = await db.get(MediaObject, sha256)
+    if media:
+        return media
+    path = local_path_of(url)
+    media = MediaObject(
+        sha256=sha256,
+        url=url,
+        size=os.path.getsize(path) if path and os.path.exists(path) else None,
+        public_url=public_url,
+    )
+    db.add(media)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # 并发上传了相同内容，以先登记的为准
+        await db.rollback()
+        media = await db.get(MediaObject, sha256)
+    return media
+
+
+def reference_counts(db) -> Counter:
+    """统计每个媒体文件名被多少条消息引用（同步会话）"""
+    counts = Counter()
+    rows = db.query(
+        Message.local_path,
+        Message.video_url,
+        Message.reference_image,
+        Message.poster_url,
+        Message.last_frame_url,
+    ).all()
+    for row in rows:
+        # 同一条消息的多个字段指向同一文件时只计一次
+        for name in {file_name_of(value) for value in row}:
+            if name:
+                counts[name] += 1
+    return counts
+
+
+def forget_media_files(db, filenames: list):
+    """文件被删除后移除对应的媒体记录（同步会话）"""
+    if not filenames:
+        return
+    # 媒体记录的 URL 是 MEDIA_ROOTS 前缀 + 文件名
+    urls = [prefix + name for name in set(filenames) for prefix in MEDIA_ROOTS]
+    for start in range(0, len(urls), 500):  # SQLite 单条语句的参数个数有上限
+        db.query(MediaObject).filter(MediaObject.url.in_(urls[start:start + 500])).delete(synchronize_session=False)
+    db.commit()
@@ -0,0 +1,260 @@
+"""
+Prometheus 指标
+多 worker（production.py）时使用 prometheus_client 的多进程模式：
+主进程启动 worker 前设置 PROMETHEUS_MULTIPROC_DIR（见 enable_multiprocess_metrics），
+各 worker 把指标写入该目录，任一 worker 的 /metrics 都返回所有 worker 的汇总
+"""
+import asyncio
+import os
+import shutil
+import threading
+import time
+from calendar import timegm
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session as OrmSession
+
+from config import METRICS_CONFIG
+from models import Message, TaskStatus
+
+_MULTIPROC_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+PROVIDER_REQUEST_SECONDS = Histogram(
+    "videogen_provider_request_seconds",
+    "服务商接口耗时（outcome=error 的计数即错误数）",
+    ["provider", "operation", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+TASK_POLLS = Counter("videogen_task_polls_total", "任务状态查询次数", ["source"])
+TASK_POLLS_PER_TASK = Histogram(
+    "videogen_task_polls_per_task",
+    "单个任务轮询结束前的查询次数",
+    ["outcome"],
+    buckets=(1, 2, 5, 10, 20, 40, 60, 90, 120),
+)
+TASK_STATE_SECONDS = Histogram(
+    "videogen_task_state_seconds",
+    "任务在各状态停留的时间",
+    ["state"],
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200),
+)
+TASKS_IN_FLIGHT = Gauge(
+    "videogen_tasks_in_flight", "未完成的视频任务数（按状态）", ["status"], multiprocess_mode="mostrecent"
+)
+POLLING_TASKS = Gauge("videogen_polling_tasks", "正在轮询的任务数（轮询线程）", multiprocess_mode="livesum")
+DOWNLOAD_BYTES = Counter("videogen_download_bytes_total", "下载的视频字节数")
+DOWNLOAD_SECONDS = Histogram(
+    "videogen_download_seconds", "视频下载耗时", ["outcome"], buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+)
+DOWNLOAD_THROUGHPUT = Histogram(
+    "videogen_download_throughput_bytes_per_second",
+    "单个视频的下载速度",
+    buckets=tuple(kb * 1024 for kb in (64, 256, 512, 1024, 2048, 4096, 8192, 16384, 65536)),
+)
+FRAME_EXTRACTION_SECONDS = Histogram(
+    "videogen_frame_extraction_seconds",
+    "尾帧提取耗时（source：cache 内存缓存 / stored 后处理结果 / decode 解码视频）",
+    ["source"],
+    buckets=LATENCY_BUCKETS,
+)
+DB_COMMIT_SECONDS = Histogram(
+    "videogen_db_commit_seconds",
+    "数据库提交耗时（含 flush）",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+THREADPOOL_BUSY = Gauge("videogen_threadpool_busy_threads", "线程池中正在执行的任务数", multiprocess_mode="livesum")
+THREADPOOL_WAITING = Gauge("videogen_threadpool_waiting_tasks", "等待线程池的任务数", multiprocess_mode="livesum")
+SUBMISSION_QUEUE_DEPTH = Gauge(
+    "videogen_submission_queue_depth", "批量任务提交队列中等待的任务数", multiprocess_mode="livesum"
+)
+
+
+# ---------- 状态停留时间 ----------
+
+# 消息ID -> (状态, 进入时间)；只记录本进程内观察到的状态变化
+_state_since = OrderedDict()
+_state_lock = threading.Lock()
+_STATE_TRACK_LIMIT = 10000
+
+
+def _utc_timestamp(value) -> float:
+    """created_at 是 UTC 的 naive 时间（datetime.utcnow）"""
+    return timegm(value.timetuple()) + value.microsecond / 1e6
+
+
+def _on_status_change(message, value, oldvalue, initiator):
+    """Message.status 被赋新值时记录旧状态的停留时间（新建消息没有 id，不记录）"""
+    if message.id is None or value == oldvalue:
+        return
+    now = time.time()
+    with _state_lock:
+        entered = _state_since.pop(message.id, None)
+        _state_since[message.id] = (value, now)
+        while len(_state_since) > _STATE_TRACK_LIMIT:
+            _state_since.popitem(last=False)
+    if entered and entered[0] == oldvalue:
+        started = entered[1]
+    elif oldvalue == TaskStatus.PENDING and message.created_at:
+        started = _utc_timestamp(message.created_at)
+    else:
+        return
+    TASK_STATE_SECONDS.labels(state=TaskStatus(oldvalue).value).observe(max(0.0, now - started))
+
+
+event.listen(Message.status, "set", _on_status_change, active_history=True)
+
+
+# ---------- 数据库提交耗时 ----------
+
+@event.listens_for(OrmSession, "before_commit")
+def _before_commit(session):
+    session.info["commit_started"] = time.perf_counter()
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _after_commit(session):
+    started = session.info.pop("commit_started", None)
+    if started is not None:
+        DB_COMMIT_SECONDS.observe(time.perf_counter() - started)
+
+
+# ---------- 埋点工具 ----------
+
+@contextmanager
+def observe_provider_request(provider: str, operation: str):
+    """记录一次服务商接口调用的耗时和结果"""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        PROVIDER_REQUEST_SECONDS.labels(provider=provider, operation=operation, outcome=outcome).observe(
+            time.perf_counter() - started
+        )
+
+
+class PollTracker:
+    """
+    一个任务从开始轮询到结束：查询次数和结束原因，轮询期间计入进行中的轮询数
+
+    用法：polling = PollTracker("poller") ... polling.poll() ... polling.outcome = "success" ... polling.finish()
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self.polls = 0
+        self.outcome = "timeout"
+        POLLING_TASKS.inc()
+
+    def poll(self):
+        self.polls += 1
+        TASK_POLLS.labels(source=self.source).inc()
+
+    def finish(self):
+        POLLING_TASKS.dec()
+        TASK_POLLS_PER_TASK.labels(outcome=self.outcome).observe(self.polls)
+
+
+def observe_download(size: int, seconds: float):
+    DOWNLOAD_BYTES.inc(size)
+    DOWNLOAD_SECONDS.labels(outcome="ok").observe(seconds)
+    if seconds > 0:
+        DOWNLOAD_THROUGHPUT.observe(size / seconds)
+
+
+# ---------- 周期采样 ----------
+
+_sampler = None
+
+
+async def _sample_once():
+    import anyio.to_thread
+    from database import AsyncSessionLocal
+    from services.submission_scheduler import queue_size
+
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    THREADPOOL_BUSY.set(limiter.borrowed_tokens)
+    THREADPOOL_WAITING.set(limiter.statistics().tasks_waiting)
+    SUBMISSION_QUEUE_DEPTH.set(queue_size())
+
+    in_flight = (TaskStatus.PENDING, TaskStatus.QUEUED, TaskStatus.PROCESSING)
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Message.status, func.count())
+            .where(Message.task_id.isnot(None), Message.status.in_(in_flight))
+            .group_by(Message.status)
+        )
+        counts = dict(result.all())
+    for status in in_flight:
+        TASKS_IN_FLIGHT.labels(status=status.value).set(counts.get(status, 0))
+
+
+async def _sampler_loop():
+    while True:
+        try:
+            await _sample_once()
+        except Exception as e:
+            print(f"[指标] 采样失败: {e}")
+        await asyncio.sleep(METRICS_CONFIG["sample_interval_seconds"])
+
+
+def start_metrics_sampler():
+    """启动线程池/队列/进行中任务数的周期采样（需在事件循环线程中调用）"""
+    global _sampler
+    _sampler = asyncio.get_running_loop().create_task(_sampler_loop())
+
+
+async def stop_metrics_sampler():
+    """停止采样；多进程模式下标记本进程退出，livesum 类指标不再计入"""
+    global _sampler
+    if _sampler is not None:
+        _sampler.cancel()
+        try:
+            await _sampler
+        except asyncio.CancelledError:
+            pass
+        _sampler = None
+    if os.environ.get(_MULTIPROC_ENV):
+        multiprocess.mark_process_dead(os.getpid())
+
+
+# ---------- 输出 ----------
+
+def enable_multiprocess_metrics():
+    """
+    开启多进程模式并清空上次运行留下的指标文件
+
+    只能在主进程启动 worker 之前调用（worker 继承环境变量，导入本模块时即写入该目录）
+    """
+    directory = METRICS_CONFIG["multiproc_dir"]
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory, exist_ok=True)
+    os.environ[_MULTIPROC_ENV] = directory
+
+
+def render_metrics() -> tuple:
+    """
+    Returns:
+        (响应体, Content-Type)；多进程模式下汇总所有 worker
+    """
+    if os.environ.get(_MULTIPROC_ENV):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,678 @@
+"""
+MP4（ISO BMFF）容器处理
+纯 Python 实现，只改写容器结构、不重新编码：按段拼接多个视频、把 moov 移到文件开头（faststart）。
+moov 始终写在文件开头，mdat 按块流式复制，内存占用只与样本表大小有关
+"""
+import os
+import struct
+from typing import List, Optional
+
+_COPY_CHUNK_BYTES = 1024 * 1024
+
+
+class Mp4Error(Exception):
+    """文件不是可处理的 MP4"""
+
+
+# ---------- box 读写 ----------
+
+def read_top_level_boxes(f) -> list:
+    """
+    扫描顶层 box（只读头部）
+
+    Returns:
+        [(类型, 起始偏移, 头部长度, 总长度), ...]
+    """
+    f.seek(0, os.SEEK_END)
+    file_size = f.tell()
+    boxes = []
+    offset = 0
+    while offset + 8 <= file_size:
+        f.seek(offset)
+        header = f.read(16)
+        size, box_type = struct.unpack(">I4s", header[:8])
+        header_size = 8
+        if size == 1:
+            size = struct.unpack(">Q", header[8:16])[0]
+            header_size = 16
+        elif size == 0:
+            size = file_size - offset
+        if size < header_size or offset + size > file_size:
+            raise Mp4Error(f"box {box_type!r} 长度无效")
+        boxes.append((box_type, offset, header_size, size))
+        offset += size
+    return boxes
+
+
+def parse_boxes(data: bytes, start: int = 0, end: Optional[int] = None) -> list:
+    """
+    解析内存中的一层 box
+
+    Returns:
+        [(类型, box 起始, 内容起始, box 结束), ...]
+    """
+    end = len(data) if end is None else end
+    boxes = []
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, offset)
+        payload = offset + 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, offset + 8)[0]
+            payload = offset + 16
+        elif size == 0:
+            size = end - offset
+        if size < payload - offset or offset + size > end:
+            raise Mp4Error(f"box {box_type!r} 长度无效")
+        boxes.append((box_type, offset, payload, offset + size))
+        offset += size
+    return boxes
+
+
+def find_box(data: bytes, path: List[bytes], start: int = 0, end: Optional[int] = None) -> Optional[tuple]:
+    """按路径查找第一个匹配的 box，如 [b"mdia", b"minf", b"stbl"]"""
+    for box in parse_boxes(data, start, end):
+        if box[0] == path[0]:
+            if len(path) == 1:
+                return box
+            return find_box(data, path[1:], box[2], box[3])
+    return None
+
+
+def box(box_type: bytes, payload: bytes) -> bytes:
+    size = 8 + len(payload)
+    if size > 0xFFFFFFFF:
+        return struct.pack(">I4sQ", 1, box_type, size + 8) + payload
+    return struct.pack(">I4s", size, box_type) + payload
+
+
+def full_box(box_type: bytes, version: int, flags: int, payload: bytes) -> bytes:
+    return box(box_type, struct.pack(">I", (version << 24) | flags) + payload)
+
+
+# ---------- 样本表 ----------
+
+def _read_u32_table(data: bytes, box_range: tuple, fields: int) -> list:
+    """读取 FullBox 的 entry_count + 定长表项（每项 fields 个 u32）"""
+    _, _, payload, _ = box_range
+    count = struct.unpack_from(">I", data, payload + 4)[0]
+    values = struct.unpack_from(f">{count * fields}I", data, payload + 8)
+    return [values[i:i + fields] for i in range(0, len(values), fields)]
+
+
+class Track:
+    """一条轨道的样本表（已展开为逐样本列表）"""
+
+    def __init__(self, moov: bytes, trak: tuple):
+        self.raw_tkhd = self._child(moov, trak, [b"tkhd"])
+        mdia = find_box(moov, [b"mdia"], trak[2], trak[3])
+        mdhd = find_box(moov, [b"mdhd"], mdia[2], mdia[3])
+        hdlr = find_box(moov, [b"hdlr"], mdia[2], mdia[3])
+        minf = find_box(moov, [b"minf"], mdia[2], mdia[3])
+        stbl = find_box(moov, [b"stbl"], minf[2], minf[3])
+        if not (mdhd and hdlr and stbl):
+            raise Mp4Error("轨道结构不完整")
+
+        self.handler = moov[hdlr[2] + 8:hdlr[2] + 12]
+        self.raw_hdlr = moov[hdlr[1]:hdlr[3]]
+        self.raw_mdhd = moov[mdhd[1]:mdhd[3]]
+        if moov[mdhd[2]] == 1:
+            self.timescale = struct.unpack_from(">I", moov, mdhd[2] + 20)[0]
+        else:
+            self.timescale = struct.unpack_from(">I", moov, mdhd[2] + 12)[0]
+        # 媒体头（vmhd/smhd）和 dinf 原样保留
+        self.raw_media_header = b"".join(
+            moov[b[1]:b[3]] for b in parse_boxes(moov, minf[2], minf[3]) if b[0] not in (b"stbl",)
+        )
+
+        # 编辑列表：只取第一个非空片段的起始媒体时间（编码器延迟 / AAC 预填充）
+        self.media_time = 0
+        elst = find_box(moov, [b"edts", b"elst"], trak[2], trak[3])
+        if elst:
+            version = moov[elst[2]]
+            count = struct.unpack_from(">I", moov, elst[2] + 4)[0]
+            offset = elst[2] + 8
+            for _ in range(count):
+                if version == 1:
+                    _, media_time = struct.unpack_from(">Qq", moov, offset)
+                    offset += 20
+                else:
+                    _, media_time = struct.unpack_from(">Ii", moov, offset)
+                    offset += 12
+                if media_time >= 0:
+                    self.media_time = media_time
+                    break
+
+        tables = {b[0]: b for b in parse_boxes(moov, stbl[2], stbl[3])}
+        stsd = tables.get(b"stsd")
+        if not stsd:
+            raise Mp4Error("缺少 stsd")
+        self.sample_entries = [moov[b[1]:b[3]] for b in parse_boxes(moov, stsd[2] + 8, stsd[3])]
+
+        # 逐样本：大小
+        stsz = tables.get(b"stsz")
+        if not stsz:
+            raise Mp4Error("缺少 stsz")
+        sample_size, count = struct.unpack_from(">II", moov, stsz[2] + 4)
+        if sample_size:
+            self.sizes = [sample_size] * count
+        else:
+            self.sizes = list(struct.unpack_from(f">{count}I", moov, stsz[2] + 12))
+
+        # 时长
+        self.durations = []
+        for sample_count, delta in _read_u32_table(moov, tables[b"stts"], 2):
+            self.durations.extend([delta] * sample_count)
+
+        # 合成时间偏移（B 帧）
+        self.cts_offsets = None
+        ctts = tables.get(b"ctts")
+        if ctts:
+            signed = moov[ctts[2]] == 1
+            self.cts_offsets = []
+            for sample_count, offset in _read_u32_table(moov, ctts, 2):
+                if signed and offset >= 0x80000000:
+                    offset -= 0x100000000
+                self.cts_offsets.extend([offset] * sample_count)
+
+        # 关键帧（没有 stss 表示全部为关键帧）
+        stss = tables.get(b"stss")
+        self.sync_samples = None
+        if stss:
+            self.sync_samples = {row[0] - 1 for row in _read_u32_table(moov, stss, 1)}
+
+        # 块偏移
+        if b"stco" in tables:
+            self.chunk_offsets = [row[0] for row in _read_u32_table(moov, tables[b"stco"], 1)]
+        elif b"co64" in tables:
+            co64 = tables[b"co64"]
+            count = struct.unpack_from(">I", moov, co64[2] + 4)[0]
+            self.chunk_offsets = list(struct.unpack_from(f">{count}Q", moov, co64[2] + 8))
+        else:
+            raise Mp4Error("缺少块偏移表")
+
+        # 块 -> (样本数, 样本描述序号)
+        stsc = _read_u32_table(moov, tables[b"stsc"], 3)
+        self.chunks = []
+        for i, (first_chunk, samples_per_chunk, description_index) in enumerate(stsc):
+            last_chunk = stsc[i + 1][0] - 1 if i + 1 < len(stsc) else len(self.chunk_offsets)
+            for _ in range(first_chunk, last_chunk + 1):
+                self.chunks.append((samples_per_chunk, description_index))
+        if len(self.chunks) != len(self.chunk_offsets) or sum(c[0] for c in self.chunks) != len(self.sizes):
+            raise Mp4Error("样本表不一致")
+        if len(self.durations) != len(self.sizes):
+            raise Mp4Error("样本时长表不一致")
+
+    @staticmethod
+    def _child(moov: bytes, parent: tuple, path: List[bytes]) -> bytes:
+        found = find_box(moov, path, parent[2], parent[3])
+        if not found:
+            raise Mp4Error(f"缺少 {path[-1]!r}")
+        return moov[found[1]:found[3]]
+
+    @property
+    def media_duration(self) -> int:
+        return sum(self.durations)
+
+    @property
+    def presentation_duration(self) -> int:
+        """实际播放时长（媒体时间刻度）：合成时间的终点减去编辑列表的起始偏移"""
+        return composition_end(self.durations, self.cts_offsets) - self.media_time
+
+
+def composition_end(durations: list, cts_offsets: Optional[list]) -> int:
+    """最后一个样本显示结束的时间"""
+    if cts_offsets is None:
+        return sum(durations)
+    end = decode_time = 0
+    for duration, offset in zip(durations, cts_offsets):
+        end = max(end, decode_time + offset + duration)
+        decode_time += duration
+    return end
+
+
+class Movie:
+    """一个 MP4 文件的 moov 信息"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            top = read_top_level_boxes(f)
+            types = [b[0] for b in top]
+            if b"moov" not in types or b"mdat" not in types:
+                raise Mp4Error("缺少 moov 或 mdat")
+            if b"moof" in types:
+                raise Mp4Error("不支持分片 MP4")
+            self.top_level = top
+            ftyp = next((b for b in top if b[0] == b"ftyp"), None)
+            self.raw_ftyp = b""
+            if ftyp:
+                f.seek(ftyp[1])
+                self.raw_ftyp = f.read(ftyp[3])
+            moov = next(b for b in top if b[0] == b"moov")
+            f.seek(moov[1])
+            self.moov = f.read(moov[3])
+
+        mvhd = find_box(self.moov, [b"mvhd"], 8)
+        if not mvhd:
+            raise Mp4Error("缺少 mvhd")
+        self.raw_mvhd = self.moov[mvhd[1]:mvhd[3]]
+        self.timescale = struct.unpack_from(">I", self.moov, mvhd[2] + (20 if self.moov[mvhd[2]] == 1 else 12))[0]
+        self.tracks = [
+            Track(self.moov, b) for b in parse_boxes(self.moov, 8) if b[0] == b"trak"
+        ]
+
+    def track(self, handler: bytes) -> Optional[Track]:
+        return next((t for t in self.tracks if t.handler == handler), None)
+
+
+# ---------- 写 moov ----------
+
+def _set_duration(raw: bytes, duration: int, v1_offset: int, v0_offset: int) -> bytes:
+    """改写 mvhd/tkhd/mdhd 的 duration 字段（offset 相对内容起始，不含 version/flags）"""
+    header = 16 if struct.unpack_from(">I", raw)[0] == 1 else 8
+    version = raw[header]
+    data = bytearray(raw)
+    if version == 1:
+        struct.pack_into(">Q", data, header + 4 + v1_offset, duration)
+    else:
+        if duration > 0xFFFFFFFF:
+            raise Mp4Error("时长超出 32 位范围")
+        struct.pack_into(">I", data, header + 4 + v0_offset, duration)
+    return bytes(data)
+
+
+def _run_length(values: list) -> list:
+    runs = []
+    for value in values:
+        if runs and runs[-1][1] == value:
+            runs[-1][0] += 1
+        else:
+            runs.append([1, value])
+    return runs
+
+
+def _build_stbl(sample_entries, sizes, durations, cts_offsets, sync_samples, chunks, chunk_offsets, use_co64) -> bytes:
+    stsd = full_box(b"stsd", 0, 0, struct.pack(">I", len(sample_entries)) + b"".join(sample_entries))
+
+    stts_runs = _run_length(durations)
+    stts = full_box(b"stts", 0, 0, struct.pack(">I", len(stts_runs)) + b"".join(
+        struct.pack(">II", count, delta) for count, delta in stts_runs
+    ))
+
+    parts = [stsd, stts]
+    if sync_samples is not None:
+        parts.append(full_box(b"stss", 0, 0, struct.pack(">I", len(sync_samples)) + b"".join(
+            struct.pack(">I", index + 1) for index in sync_samples
+        )))
+    if cts_offsets is not None:
+        ctts_runs = _run_length(cts_offsets)
+        signed = any(offset < 0 for offset in cts_offsets)
+        parts.append(full_box(b"ctts", 1 if signed else 0, 0, struct.pack(">I", len(ctts_runs)) + b"".join(
+            struct.pack(">Ii" if signed else ">II", count, offset) for count, offset in ctts_runs
+        )))
+
+    stsc_rows = []
+    for index, (samples_per_chunk, description_index) in enumerate(chunks, start=1):
+        if not stsc_rows or stsc_rows[-1][1:] != (samples_per_chunk, description_index):
+            stsc_rows.append((index, samples_per_chunk, description_index))
+    parts.append(full_box(b"stsc", 0, 0, struct.pack(">I", len(stsc_rows)) + b"".join(
+        struct.pack(">III", *row) for row in stsc_rows
+    )))
+
+    if len(set(sizes)) == 1:
+        parts.append(full_box(b"stsz", 0, 0, struct.pack(">II", sizes[0], len(sizes))))
+    else:
+        parts.append(full_box(b"stsz", 0, 0, struct.pack(f">II{len(sizes)}I", 0, len(sizes), *sizes)))
+
+    if use_co64:
+        parts.append(full_box(b"co64", 0, 0, struct.pack(f">I{len(chunk_offsets)}Q", len(chunk_offsets), *chunk_offsets)))
+    else:
+        parts.append(full_box(b"stco", 0, 0, struct.pack(f">I{len(chunk_offsets)}I", len(chunk_offsets), *chunk_offsets)))
+    return box(b"stbl", b"".join(parts))
+
+
+def _rescale(value: int, source_timescale: int, target_timescale: int) -> int:
+    if source_timescale == target_timescale:
+        return value
+    return round(value * target_timescale / source_timescale)
+
+
+# ---------- 拼接 ----------
+
+def concat_mp4(paths: List[str], output_path: str) -> dict:
+    """
+    按顺序拼接多个 MP4（只复制样本数据，不重新编码），moov 写在文件开头
+
+    各段的编码参数不同时写入多个样本描述，由块的 sample_description_index 引用；
+    只保留所有输入都具备的视频/音频轨道；各段时间刻度不同时换算到第一段的刻度
+
+    Returns:
+        {"duration": 秒, "bytes": 输出大小}
+
+    Raises:
+        Mp4Error: 输入无法处理
+    """
+    if not paths:
+        raise Mp4Error("没有需要拼接的视频")
+    movies = [Movie(path) for path in paths]
+    handlers = [
+        handler for handler in (b"vide", b"soun")
+        if all(movie.track(handler) for movie in movies)
+    ]
+    if b"vide" not in handlers:
+        raise Mp4Error("输入缺少视频轨道")
+
+    first = movies[0]
+    movie_timescale = first.timescale
+    # 各段视频的播放时长（秒），音频按此对齐
+    video_lengths = [
+        movie.track(b"vide").presentation_duration / movie.track(b"vide").timescale for movie in movies
+    ]
+
+    # 每条输出轨道的样本表；块记录 (输入序号, 原始偏移, 字节数)
+    out_tracks = []
+    for handler in handlers:
+        base = first.track(handler)
+        timescale = base.timescale
+        entries = []
+        sizes, durations, sync_samples, chunks, sources = [], [], [], [], []
+        cts_offsets = [] if any(m.track(handler).cts_offsets is not None for m in movies) else None
+        has_sync_table = any(m.track(handler).sync_samples is not None for m in movies)
+        base_media_time = base.media_time
+
+        for movie_index, movie in enumerate(movies):
+            track = movie.track(handler)
+            # 样本描述去重，建立本段序号到输出序号的映射
+            entry_map = {}
+            for index, entry in enumerate(track.sample_entries, start=1):
+                if entry not in entries:
+                    entries.append(entry)
+                entry_map[index] = entries.index(entry) + 1
+
+            # 时长按累计时间换算，避免逐样本取整误差累积
+            segment_durations = []
+            elapsed = 0
+            for duration in track.durations:
+                start = _rescale(elapsed, track.timescale, timescale)
+                elapsed += duration
+                segment_durations.append(_rescale(elapsed, track.timescale, timescale) - start)
+
+            keep = len(segment_durations)
+            if handler != b"vide" and movie_index < len(movies) - 1:
+                # 音频按视频段长对齐：超出部分截掉，不足时拉长最后一个样本，避免音画逐段漂移
+                target = base_media_time + round(sum(video_lengths[:movie_index + 1]) * timescale) - sum(durations)
+                kept = 0
+                keep = 0
+                for duration in segment_durations:
+                    if kept + duration / 2 > target:
+                        break
+                    kept += duration
+                    keep += 1
+                keep = max(keep, 1)
+                segment_durations = segment_durations[:keep]
+                segment_durations[-1] = max(1, segment_durations[-1] + target - sum(segment_durations))
+
+            sample_base = len(sizes)
+            durations.extend(segment_durations)
+            sizes.extend(track.sizes[:keep])
+            if cts_offsets is not None:
+                # 按各段编辑列表对齐到第一段的起始偏移
+                shift = base_media_time - _rescale(track.media_time, track.timescale, timescale)
+                offsets = track.cts_offsets or [0] * len(track.sizes)
+                cts_offsets.extend(max(0, _rescale(o, track.timescale, timescale) + shift) for o in offsets[:keep])
+            if has_sync_table:
+                if track.sync_samples is None:
+                    sync_samples.extend(range(sample_base, sample_base + keep))
+                else:
+                    sync_samples.extend(sample_base + i for i in sorted(track.sync_samples) if i < keep)
+
+            sample_index = 0
+            for (samples_per_chunk, description_index), offset in zip(track.chunks, track.chunk_offsets):
+                count = min(samples_per_chunk, keep - sample_index)
+                if count <= 0:
+                    break
+                byte_length = sum(track.sizes[sample_index:sample_index + count])
+                sample_index += count
+                chunks.append((count, entry_map[description_index]))
+                sources.append((movie_index, offset, byte_length))
+
+        out_tracks.append({
+            "base": base,
+            "timescale": timescale,
+            "entries": entries,
+            "sizes": sizes,
+            "durations": durations,
+            "cts_offsets": cts_offsets,
+            "sync_samples": sync_samples if has_sync_table else None,
+            "chunks": chunks,
+            "sources": sources,
+            "media_time": base_media_time,
+        })
+
+    # mdat 中块的顺序：按输入顺序，同一输入内保持原文件中的交错顺序
+    layout = sorted(
+        ((source[0], source[1], track_index, chunk_index, source[2])
+         for track_index, track in enumerate(out_tracks)
+         for chunk_index, source in enumerate(track["sources"])),
+    )
+    data_size = sum(item[4] for item in layout)
+    # 偏移还要加上 ftyp/moov 的大小，留出余量
+    use_co64 = data_size > 0xFFFFFFFF - 64 * 1024 * 1024
+
+    def build_moov(chunk_offsets_by_track) -> tuple:
+        traks = []
+        movie_duration = 0
+        for track_id, (track, chunk_offsets) in enumerate(zip(out_tracks, chunk_offsets_by_track), start=1):
+            media_duration = sum(track["durations"])
+            presentation = _rescale(
+                composition_end(track["durations"], track["cts_offsets"]) - track["media_time"],
+                track["timescale"],
+                movie_timescale,
+            )
+            movie_duration = max(movie_duration, presentation)
+
+            tkhd = _set_duration(track["base"].raw_tkhd, presentation, 24, 16)
+            tkhd = bytearray(tkhd)
+            header = 16 if struct.unpack_from(">I", tkhd)[0] == 1 else 8
+            struct.pack_into(">I", tkhd, header + 4 + (16 if tkhd[header] == 1 else 8), track_id)
+
+            edts = b""
+            if track["media_time"]:
+                edts = box(b"edts", full_box(b"elst", 0, 0, struct.pack(
+                    ">IIiI", 1, presentation, track["media_time"], 0x00010000
+                )))
+            mdhd = _set_duration(track["base"].raw_mdhd, media_duration, 20, 12)
+            stbl = _build_stbl(
+                track["entries"], track["sizes"], track["durations"], track["cts_offsets"],
+                track["sync_samples"], track["chunks"], chunk_offsets, use_co64,
+            )
+            minf = box(b"minf", track["base"].raw_media_header + stbl)
+            mdia = box(b"mdia", mdhd + track["base"].raw_hdlr + minf)
+            traks.append(box(b"trak", bytes(tkhd) + edts + mdia))
+
+        mvhd = bytearray(_set_duration(first.raw_mvhd, movie_duration, 20, 12))
+        struct.pack_into(">I", mvhd, len(mvhd) - 4, len(out_tracks) + 1)  # next_track_ID
+        return box(b"moov", bytes(mvhd) + b"".join(traks)), movie_duration
+
+    # moov 大小与偏移取值无关，先用占位偏移算出 mdat 起始位置
+    placeholder = [[0] * len(track["chunks"]) for track in out_tracks]
+    moov, _ = build_moov(placeholder)
+    mdat_header = 16 if data_size + 8 > 0xFFFFFFFF else 8
+    position = len(first.raw_ftyp) + len(moov) + mdat_header
+    chunk_offsets = [[0] * len(track["chunks"]) for track in out_tracks]
+    for movie_index, _, track_index, chunk_index, byte_length in layout:
+        chunk_offsets[track_index][chunk_index] = position
+        position += byte_length
+    moov, movie_duration = build_moov(chunk_offsets)
+
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as out:
+            out.write(first.raw_ftyp)
+            out.write(moov)
+            if mdat_header == 16:
+                out.write(struct.pack(">I4sQ", 1, b"mdat", data_size + 16))
+            else:
+                out.write(struct.pack(">I4s", data_size + 8, b"mdat"))
+            handles = {}
+            try:
+                for movie_index, offset, _, _, byte_length in layout:
+                    f = handles.get(movie_index)
+                    if f is None:
+                        f = handles[movie_index] = open(movies[movie_index].path, "rb")
+                    f.seek(offset)
+                    _copy(f, out, byte_length)
+            finally:
+                for f in handles.values():
+                    f.close()
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return {"duration": movie_duration / movie_timescale, "bytes": os.path.getsize(output_path)}
+
+
+def _copy(source, target, length: int):
+    while length > 0:
+        chunk = source.read(min(_COPY_CHUNK_BYTES, length))
+        if not chunk:
+            raise Mp4Error("样本数据超出文件末尾")
+        target.write(chunk)
+        length -= len(chunk)
+
+
+# ---------- faststart ----------
+
+# 块偏移表所在的容器路径
+_OFFSET_CONTAINERS = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+
+
+def _relocate_chunk_offsets(data: bytes, start: int, end: int, relocate, force_co64: bool) -> bytes:
+    """
+    重建 box 树，块偏移表中的每个偏移经 relocate 映射到新位置
+
+    stco 放不下的偏移改写为 co64；force_co64 时全部写为 co64（用于让 moov 长度收敛）
+    """
+    out = []
+    for box_type, box_start, payload, box_end in parse_boxes(data, start, end):
+        if box_type in _OFFSET_CONTAINERS:
+            out.append(box(box_type, _relocate_chunk_offsets(data, payload, box_end, relocate, force_co64)))
+        elif box_type in (b"stco", b"co64"):
+            count = struct.unpack_from(">I", data, payload + 4)[0]
+            width = "I" if box_type == b"stco" else "Q"
+            offsets = [relocate(o) for o in struct.unpack_from(f">{count}{width}", data, payload + 8)]
+            if not force_co64 and box_type == b"stco" and max(offsets, default=0) <= 0xFFFFFFFF:
+                out.append(full_box(b"stco", 0, 0, struct.pack(f">I{count}I", count, *offsets)))
+            else:
+                out.append(full_box(b"co64", 0, 0, struct.pack(f">I{count}Q", count, *offsets)))
+        else:
+            out.append(data[box_start:box_end])
+    return b"".join(out)
+
+
+def _track_digest(f, track: Track) -> tuple:
+    """按块顺序对轨道的全部样本数据求哈希，返回 (样本数, 样本表摘要, 数据摘要)"""
+    import hashlib
+
+    digest = hashlib.sha256()
+    sample = 0
+    for (count, _), offset in zip(track.chunks, track.chunk_offsets):
+        length = sum(track.sizes[sample:sample + count])
+        sample += count
+        f.seek(offset)
+        while length > 0:
+            chunk = f.read(min(_COPY_CHUNK_BYTES, length))
+            if not chunk:
+                raise Mp4Error("样本数据超出文件末尾")
+            digest.update(chunk)
+            length -= len(chunk)
+    tables = hash((tuple(track.sizes), tuple(track.durations), tuple(track.chunks)))
+    return len(track.sizes), tables, digest.hexdigest()
+
+
+def _verify_same_samples(original: str, rewritten: str):
+    """校验改写后的文件与原文件轨道、样本表和样本数据逐字节一致"""
+    before, after = Movie(original), Movie(rewritten)
+    if len(before.tracks) != len(after.tracks):
+        raise Mp4Error("改写后轨道数不一致")
+    with open(original, "rb") as f, open(rewritten, "rb") as g:
+        for old, new in zip(before.tracks, after.tracks):
+            if _track_digest(f, old) != _track_digest(g, new):
+                raise Mp4Error(f"改写后 {old.handler.decode(errors='replace')} 轨道数据不一致")
+
+
+def faststart_mp4(path: str, output_path: Optional[str] = None) -> bool:
+    """
+    把 moov 移到所有 mdat 之前，浏览器无需下载完整文件即可开始播放
+
+    只读入 moov，其余 box 按块流式复制；写入临时文件并校验样本数据与原文件一致后才改名为结果文件
+
+    Args:
+        output_path: 结果写入的路径，为空时原地替换（只用于尚未对外提供的文件）
+
+    Returns:
+        是否改写（moov 已在开头、分片 MP4 时返回 False，不生成 output_path）
+
+    Raises:
+        Mp4Error: 文件结构无法处理或校验失败（原文件保持不变）
+    """
+    with open(path, "rb") as f:
+        top = read_top_level_boxes(f)
+        types = [b[0] for b in top]
+        if b"moov" not in types or b"mdat" not in types:
+            raise Mp4Error("缺少 moov 或 mdat")
+        if b"moof" in types or types.index(b"moov") < types.index(b"mdat"):
+            return False
+        if types.count(b"moov") > 1:
+            raise Mp4Error("存在多个 moov")
+        old_moov = next(b for b in top if b[0] == b"moov")
+        f.seek(old_moov[1])
+        moov = f.read(old_moov[3])
+
+    # 新布局：第一个 mdat 之前的 box（ftyp 等）→ moov → 其余 box 保持原顺序
+    insert_at = types.index(b"mdat")
+    others = [b for b in top if b[0] != b"moov"]
+    order = others[:insert_at] + [None] + others[insert_at:]
+
+    def build(moov_size: int, force_co64: bool) -> bytes:
+        new_offsets = {}
+        position = 0
+        for item in order:
+            if item is None:
+                position += moov_size
+                continue
+            new_offsets[item[1]] = position
+            position += item[3]
+
+        def relocate(offset: int) -> int:
+            for _, start, _, size in others:
+                if start <= offset < start + size:
+                    return offset - start + new_offsets[start]
+            raise Mp4Error(f"块偏移 {offset} 不在任何 box 内")
+
+        return _relocate_chunk_offsets(moov, 0, len(moov), relocate, force_co64)
+
+    # moov 的长度决定偏移，偏移溢出又会改变 moov 的长度：迭代到长度稳定
+    new_moov = build(len(moov), False)
+    if len(new_moov) != len(moov):
+        new_moov = build(len(build(0, True)), True)
+
+    output_path = output_path or path
+    tmp_path = f"{output_path}.faststart.tmp"
+    try:
+        with open(path, "rb") as source, open(tmp_path, "wb") as target:
+            for item in order:
+                if item is None:
+                    target.write(new_moov)
+                    continue
+                source.seek(item[1])
+                _copy(source, target, item[3])
+        _verify_same_samples(path, tmp_path)
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return True
@@ -0,0 +1,127 @@
+"""
+图床发布流水线
+上传接口落盘后立即返回本地URL，发布到图床在后台进行（失败重试）。
+图生视频时，只有服务商确实需要公网URL才等待发布完成；
+启用签名URL时由后端直接提供图片，无需等待图床
+"""
+import asyncio
+from typing import Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import PUBLISH_CONFIG
+from database import AsyncSessionLocal
+from models import MediaObject
+from services import image_host, url_signer
+from services.media_store import local_path_of
+from services.reference_image import prepare_reference_url
+
+# 本地URL -> 进行中的发布任务（同一内容只发布一次）
+_pending = {}
+# 进行中的参考图预处理任务（保留引用，避免任务被垃圾回收）
+_preparations = set()
+
+
+async def _save_public_url(local_url: str, public_url: str):
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(MediaObject).where(MediaObject.url == local_url))
+        media = result.scalars().first()
+        if media and media.public_url != public_url:
+            media.public_url = public_url
+            await db.commit()
+
+
+async def _publish_with_retries(local_url: str, filepath: str) -> Optional[str]:
+    filename = local_url.rsplit("/", 1)[-1]
+    delay = PUBLISH_CONFIG["retry_backoff_seconds"]
+    for attempt in range(1, PUBLISH_CONFIG["max_attempts"] + 1):
+        public_url = await run_in_threadpool(image_host.publish_image, filename, filepath)
+        if public_url:
+            await _save_public_url(local_url, public_url)
+            return public_url
+        if attempt < PUBLISH_CONFIG["max_attempts"]:
+            print(f"[图床发布] {filename} 第 {attempt} 次失败，{delay} 秒后重试")
+            await asyncio.sleep(delay)
+            delay *= 2
+    print(f"[图床发布] {filename} 发布失败")
+    return None
+
+
+def schedule_publication(local_url: str, filepath: str) -> asyncio.Task:
+    """
+    在后台发布本地图片到图床，返回可等待的任务（结果为公网URL，失败为 None）
+
+    同一图片已有进行中的发布时直接返回该任务
+    """
+    task = _pending.get(local_url)
+    if task and not task.done():
+        return task
+
+    task = asyncio.create_task(_publish_with_retries(local_url, filepath))
+    _pending[local_url] = task
+
+    def _cleanup(finished):
+        if _pending.get(local_url) is finished:
+            del _pending[local_url]
+
+    task.add_done_callback(_cleanup)
+    return task
+
+
+async def _prepare_and_publish(local_url: str, max_side: int):
+    try:
+        async with AsyncSessionLocal() as db:
+            reference_url = await prepare_reference_url(db, local_url, max_side)
+        if not url_signer.is_enabled() and image_host.is_configured():
+            schedule_publication(reference_url, local_path_of(reference_url))
+    except Exception as e:
+        print(f"[图床发布] {local_url} 预处理失败: {e}")
+
+
+def schedule_reference_preparation(local_url: str, max_side: int):
+    """
+    上传后在后台预处理参考图片（缩放、去除元数据），需要图床时接着发布预处理结果
+
+    图生视频提交时仍会调用 prepare_reference_url / resolve_public_url，
+    后台任务未完成时会复用进行中的预处理和发布
+    """
+    task = asyncio.create_task(_prepare_and_publish(local_url, max_side))
+    _preparations.add(task)
+    task.add_done_callback(_preparations.discard)
+
+
+async def resolve_public_url(db: AsyncSession, image_url: str) -> str:
+    """
+    把本地上传图片URL转换为服务商可拉取的公网URL
+
+    启用签名URL时直接返回签名URL；否则已发布的直接复用，正在发布的等待其完成，
+    尚未发布的（如由其他 worker 接收的上传）立即发布。非本地URL原样返回
+
+    Raises:
+        Exception: 发布失败或等待超时
+    """
+    filepath = local_path_of(image_url)
+    if not filepath:
+        return image_url
+    if url_signer.is_enabled():
+        return url_signer.sign_media_url(image_url)
+    if not image_host.is_configured():
+        print("[警告] 未配置 GITHUB_TOKEN，直接使用本地URL（服务商可能无法访问）")
+        return image_url
+
+    result = await db.execute(select(MediaObject).where(MediaObject.url == image_url))
+    media = result.scalars().first()
+    if media and media.public_url:
+        return media.public_url
+
+    task = schedule_publication(image_url, filepath)
+    try:
+        # shield：等待超时不取消发布本身，后续请求仍可复用结果
+        public_url = await asyncio.wait_for(asyncio.shield(task), PUBLISH_CONFIG["wait_timeout_seconds"])
+    except asyncio.TimeoutError:
+        raise Exception("等待图片发布到图床超时")
+    if not public_url:
+        raise Exception("图片发布到图床失败")
+    return public_url
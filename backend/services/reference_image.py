@@ -0,0 +1,314 @@
+"""
+参考图片预处理
+提交给服务商前把参考图片缩放到服务商可用的最大分辨率、去除 EXIF 等元数据并重新编码为 JPEG。
+结果以 <原图SHA-256>.ref<边长>q<质量>.jpg 命名存放在 uploads 目录，
+相同原图和参数只处理一次，并可直接签名或发布到图床。
+图生图使用的 base64 结果另有内存 LRU 缓存，远程图片按 ETag/Last-Modified 条件请求
+"""
+import asyncio
+import base64
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Optional, Union
+from urllib.parse import urlparse
+
+import httpx
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import REFERENCE_IMAGE_CONFIG, SERVER_CONFIG, UPLOAD_CONFIG
+from services.frame_extractor import FrameCache, get_frame_executor
+from services.media_store import content_hash, local_path_of, register_media, touch_media
+from services.tracing import span
+
+_SHA256_NAME = re.compile(r"^[0-9a-f]{64}$")
+_REFERENCE_NAME = re.compile(r"^([0-9a-f]{64})\.ref\d+q\d+\.jpg$")
+
+REFERENCE_MIME_TYPE = "image/jpeg"
+
+# 同一预处理结果的并发请求只处理一次
+_inflight = {}
+
+
+class ReferenceImageError(Exception):
+    """参考图片无法解码或下载失败"""
+
+
+def reference_file_name(source_sha256: str, max_side: int) -> str:
+    """预处理结果的文件名（由原图哈希和输出参数决定）"""
+    return f"{source_sha256}.ref{max_side}q{REFERENCE_IMAGE_CONFIG['jpeg_quality']}.jpg"
+
+
+def reference_source_of(filename: str) -> Optional[str]:
+    """预处理结果对应的原图哈希，其他文件返回 None"""
+    match = _REFERENCE_NAME.match(filename)
+    return match.group(1) if match else None
+
+
+def render_reference_image(source: Union[str, bytes], target_path: str, max_side: int, quality: int):
+    """
+    解码参考图片，缩放到最长边不超过 max_side，重新编码为 JPEG 写盘（在子进程中执行）
+
+    重新编码只保留像素数据，EXIF/ICC 等元数据和透明通道都会被丢弃
+
+    Args:
+        source: 图片文件路径或图片字节
+    """
+    import cv2
+    import numpy as np
+
+    if isinstance(source, bytes):
+        image = cv2.imdecode(np.frombuffer(source, np.uint8), cv2.IMREAD_COLOR)
+    else:
+        image = cv2.imread(source, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ReferenceImageError("参考图片无法解码")
+
+    height, width = image.shape[:2]
+    if max(height, width) > max_side:
+        scale = max_side / max(height, width)
+        image = cv2.resize(
+            image,
+            (max(1, round(width * scale)), max(1, round(height * scale))),
+            interpolation=cv2.INTER_AREA,
+        )
+
+    ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality, cv2.IMWRITE_JPEG_OPTIMIZE, 1])
+    if not ok:
+        raise ReferenceImageError("参考图片编码失败")
+    tmp_path = f"{target_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(buffer.tobytes())
+    os.replace(tmp_path, target_path)
+
+
+def _hash_file(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def _prepare(db: AsyncSession, source_sha256: str, source: Union[str, bytes], max_side: int) -> tuple:
+    filename = reference_file_name(source_sha256, max_side)
+    target_path = os.path.join(SERVER_CONFIG["uploads_dir"], filename)
+    url = f"/uploads/{filename}"
+    if os.path.isfile(target_path):
+        touch_media(target_path)
+        return url, target_path
+
+    future = _inflight.get(target_path)
+    if future is None:
+        os.makedirs(SERVER_CONFIG["uploads_dir"], exist_ok=True)
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            get_frame_executor(),
+            render_reference_image,
+            source,
+            target_path,
+            max_side,
+            REFERENCE_IMAGE_CONFIG["jpeg_quality"],
+        )
+        _inflight[target_path] = future
+        future.add_done_callback(lambda _: _inflight.pop(target_path, None))
+        await asyncio.shield(future)
+        # 登记后图床发布结果可被后续请求复用
+        sha256 = await run_in_threadpool(_hash_file, target_path)
+        await register_media(db, sha256, url)
+    else:
+        await asyncio.shield(future)
+    return url, target_path
+
+
+async def prepare_local_reference(db: AsyncSession, local_url: str, max_side: int) -> str:
+    """
+    预处理本地参考图片（/uploads/xxx、/downloads/xxx），返回预处理结果的本地URL
+
+    Raises:
+        FileNotFoundError: 本地文件不存在
+        ReferenceImageError: 图片无法解码
+    """
+    if reference_source_of(os.path.basename(local_url)):
+        return local_url
+    path = local_path_of(local_url)
+    if not path or not os.path.isfile(path):
+        raise FileNotFoundError(local_url)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    source_sha256 = stem if _SHA256_NAME.match(stem) else await run_in_threadpool(_hash_file, path)
+    url, _ = await _prepare(db, source_sha256, path, max_side)
+    return url
+
+
+async def prepare_reference_bytes(db: AsyncSession, data: bytes, max_side: int) -> bytes:
+    """
+    预处理参考图片字节（远程下载或 base64 传入的图片），返回 JPEG 字节
+
+    Raises:
+        ReferenceImageError: 图片无法解码
+    """
+    _, path = await _prepare(db, content_hash(data), data, max_side)
+    return await run_in_threadpool(_read_file, path)
+
+
+async def read_local_reference(db: AsyncSession, local_url: str, max_side: int) -> bytes:
+    """预处理本地参考图片并返回 JPEG 字节"""
+    url = await prepare_local_reference(db, local_url, max_side)
+    return await run_in_threadpool(_read_file, local_path_of(url))
+
+
+async def prepare_reference_url(db: AsyncSession, image_url: str, max_side: int) -> str:
+    """
+    图生视频用：本地参考图片替换为预处理结果的本地URL，远程URL原样返回；
+    图片无法解码时回退到原图，由服务商自行处理
+    """
+    if not local_path_of(image_url):
+        return image_url
+    try:
+        return await prepare_local_reference(db, image_url, max_side)
+    except ReferenceImageError as e:
+        print(f"[参考图片] {image_url} 预处理失败，使用原图: {e}")
+        return image_url
+
+
+# (原图标识, 最长边) -> 预处理后的 base64
+_encoded_cache = FrameCache(REFERENCE_IMAGE_CONFIG["cache_max_bytes"])
+# 远程URL -> (ETag, Last-Modified, 原图SHA-256)，按最近使用淘汰
+_remote_validators = OrderedDict()
+_remote_lock = threading.Lock()
+
+_http_client = None
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(timeout=REFERENCE_IMAGE_CONFIG["fetch_timeout"], follow_redirects=True)
+    return _http_client
+
+
+async def close_reference_client():
+    """关闭远程图片下载连接池"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def _get_validators(url: str) -> Optional[tuple]:
+    with _remote_lock:
+        entry = _remote_validators.get(url)
+        if entry is not None:
+            _remote_validators.move_to_end(url)
+        return entry
+
+
+def _put_validators(url: str, etag: Optional[str], last_modified: Optional[str], source_sha256: str):
+    with _remote_lock:
+        _remote_validators[url] = (etag, last_modified, source_sha256)
+        _remote_validators.move_to_end(url)
+        while len(_remote_validators) > REFERENCE_IMAGE_CONFIG["remote_cache_entries"]:
+            _remote_validators.popitem(last=False)
+
+
+async def _encode(db: AsyncSession, key: str, data: bytes, max_side: int) -> str:
+    encoded = base64.b64encode(await prepare_reference_bytes(db, data, max_side)).decode()
+    _encoded_cache.put(key, encoded)
+    return encoded
+
+
+def _url_without_query(url: str) -> str:
+    """只保留主机和路径：签名URL的查询参数不进入追踪记录"""
+    parsed = urlparse(url)
+    return f"{parsed.netloc}{parsed.path}"
+
+
+async def _load_remote(db: AsyncSession, url: str, max_side: int) -> str:
+    """
+    下载远程参考图片；已缓存且服务端支持校验时发送条件请求，304 直接复用缓存
+    """
+    headers = {}
+    validators = _get_validators(url)
+    if validators:
+        etag, last_modified, source_sha256 = validators
+        cached = _encoded_cache.get(f"{source_sha256}|{max_side}")
+        if cached is not None:
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+    try:
+        with span("fetch", _url_without_query(url)):
+            async with _get_http_client().stream("GET", url, headers=headers) as response:
+                if response.status_code == 304 and headers:
+                    return cached
+                response.raise_for_status()
+                chunks = []
+                size = 0
+                async for chunk in response.aiter_bytes():
+                    size += len(chunk)
+                    if size > UPLOAD_CONFIG["max_bytes"]:
+                        raise ReferenceImageError(f"参考图片超过 {UPLOAD_CONFIG['max_bytes'] // 1024 // 1024} MB")
+                    chunks.append(chunk)
+                etag = response.headers.get("etag")
+                last_modified = response.headers.get("last-modified")
+    except httpx.HTTPError as e:
+        raise ReferenceImageError(f"参考图片下载失败: {e}")
+
+    data = b"".join(chunks)
+    source_sha256 = content_hash(data)
+    if etag or last_modified:
+        _put_validators(url, etag, last_modified, source_sha256)
+    key = f"{source_sha256}|{max_side}"
+    cached = _encoded_cache.get(key)
+    if cached is not None:
+        return cached
+    return await _encode(db, key, data, max_side)
+
+
+async def _load_local(db: AsyncSession, local_url: str, max_side: int) -> str:
+    path = local_path_of(local_url)
+    if not path or not os.path.isfile(path):
+        raise FileNotFoundError(local_url)
+    stat = os.stat(path)
+    key = f"file:{path}:{stat.st_size}:{stat.st_mtime_ns}|{max_side}"
+    cached = _encoded_cache.get(key)
+    if cached is not None:
+        return cached
+    encoded = base64.b64encode(await read_local_reference(db, local_url, max_side)).decode()
+    _encoded_cache.put(key, encoded)
+    return encoded
+
+
+async def load_reference_image_base64(db: AsyncSession, reference_image: str, max_side: int) -> str:
+    """
+    加载参考图片（本地URL / 远程URL / data URL / base64）并预处理，返回 JPEG 的 base64
+
+    Raises:
+        FileNotFoundError: 本地文件不存在
+        ReferenceImageError: 图片无法下载或解码
+    """
+    if local_path_of(reference_image):
+        return await _load_local(db, reference_image, max_side)
+    if reference_image.startswith("http"):
+        return await _load_remote(db, reference_image, max_side)
+
+    b64 = reference_image.split(",", 1)[1] if reference_image.startswith("data:") else reference_image
+    try:
+        data = base64.b64decode(b64)
+    except ValueError as e:
+        raise ReferenceImageError(f"参考图片 base64 无效: {e}")
+    key = f"{content_hash(data)}|{max_side}"
+    cached = _encoded_cache.get(key)
+    if cached is not None:
+        return cached
+    return await _encode(db, key, data, max_side)
@@ -0,0 +1,88 @@
+"""
+会话列表摘要
+把消息数、未完成任务数、最近消息预览和最近媒体冗余到 sessions 表，
+会话列表一次查询即可返回，无需逐个会话查询消息
+"""
+from sqlalchemy import func, case
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session as DBSession
+from sqlalchemy.orm.attributes import flag_modified
+
+from models import Session, Message, MessageRole, MessageContentType, TaskStatus
+
+PREVIEW_LENGTH = 100
+
+UNFINISHED_STATUSES = [TaskStatus.PENDING, TaskStatus.QUEUED, TaskStatus.PROCESSING]
+
+
+def media_url_of(message: Message):
+    """消息对应的可访问媒体URL（优先本地文件）"""
+    if message.content_type == MessageContentType.VIDEO and message.local_path:
+        return f"/downloads/{message.local_path}"
+    # 图片消息的 video_url 本身就是 /downloads/ 下的本地URL
+    return message.video_url
+
+
+def _preview_of(message: Message):
+    text = message.content or message.prompt or message.error_message or ""
+    return text[:PREVIEW_LENGTH] or None
+
+
+def refresh_session_summary(db: DBSession, session_id: int):
+    """
+    重新计算单个会话的摘要列
+
+    在写入/删除消息后、commit 之前调用，和消息改动在同一事务内提交
+    """
+    session = db.query(Session).filter(Session.id == session_id).first()
+    if not session:
+        return
+    db.flush()
+
+    message_count, pending_count = db.query(
+        func.count(Message.id),
+        func.coalesce(func.sum(case((
+            (Message.role == MessageRole.ASSISTANT) & Message.status.in_(UNFINISHED_STATUSES), 1
+        ), else_=0)), 0),
+    ).filter(Message.session_id == session_id).one()
+
+    last_message = db.query(Message).filter(
+        Message.session_id == session_id
+    ).order_by(Message.created_at.desc(), Message.id.desc()).first()
+
+    last_media = db.query(Message).filter(
+        Message.session_id == session_id,
+        Message.content_type.in_([MessageContentType.VIDEO, MessageContentType.IMAGE]),
+        Message.role == MessageRole.ASSISTANT,
+        Message.status == TaskStatus.SUCCESS,
+    ).order_by(Message.created_at.desc(), Message.id.desc()).first()
+
+    summary = {
+        "message_count": message_count,
+        "pending_count": pending_count,
+        "last_message_preview": _preview_of(last_message) if last_message else None,
+        "last_message_at": last_message.created_at if last_message else None,
+        "last_media_url": media_url_of(last_media) if last_media else None,
+        "last_media_type": last_media.content_type if last_media else None,
+    }
+    changed = False
+    for key, value in summary.items():
+        if getattr(session, key) != value:
+            setattr(session, key, value)
+            changed = True
+    if changed:
+        # 摘要维护不算会话更新：显式写回原 updated_at，避免 onupdate 改变会话排序
+        flag_modified(session, "updated_at")
+
+
+def rebuild_all_session_summaries(db: DBSession):
+    """回填所有会话的摘要（新增摘要列后执行一次）"""
+    session_ids = [row.id for row in db.query(Session.id).all()]
+    for session_id in session_ids:
+        refresh_session_summary(db, session_id)
+    print(f"[会话摘要] 已回填 {len(session_ids)} 个会话")
+
+
+async def refresh_session_summary_async(db: AsyncSession, session_id: int):
+    """refresh_session_summary 的异步会话版本"""
+    await db.run_sync(refresh_session_summary, session_id)
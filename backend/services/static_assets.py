@@ -0,0 +1,141 @@
+"""
+前端构建产物服务（production.py）
+assets 下的文件名带内容哈希，按 immutable 长期缓存，并预先生成 gzip/brotli 版本按 Accept-Encoding 选择；
+index.html 缓存在内存中（含压缩版本），用 ETag 协商，文件被重新构建后自动重新加载
+"""
+import hashlib
+import mimetypes
+import os
+import threading
+
+from fastapi import Request, Response
+
+from services.compression import available_encodings, choose_encoding, compress
+from services.media_response import IMMUTABLE_CACHE_CONTROL, etag_matches, media_file_response
+
+# 值得压缩的文本类资源
+COMPRESSIBLE_EXTENSIONS = {".js", ".mjs", ".css", ".html", ".svg", ".json", ".map", ".txt", ".wasm"}
+# 太小的文件压缩收益不抵响应头开销
+MIN_COMPRESS_BYTES = 1024
+
+# 编码名 -> 预压缩文件后缀
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+def precompress_assets(directory: str) -> int:
+    """
+    为目录下的文本资源生成 .gz / .br（已是最新的跳过；压缩后不变小的不生成）
+
+    写临时文件后原子替换，多个 worker 同时启动时互不影响
+
+    Returns:
+        新生成的文件数
+    """
+    created = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if os.path.splitext(name)[1] not in COMPRESSIBLE_EXTENSIONS:
+                continue
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            if stat.st_size < MIN_COMPRESS_BYTES:
+                continue
+            data = None
+            for encoding in available_encodings():
+                target = path + ENCODING_SUFFIXES[encoding]
+                if os.path.exists(target) and os.stat(target).st_mtime_ns >= stat.st_mtime_ns:
+                    continue
+                if data is None:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                compressed = compress(data, encoding)
+                if len(compressed) >= len(data):
+                    continue
+                tmp_path = f"{target}.{os.getpid()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(compressed)
+                os.replace(tmp_path, target)
+                created += 1
+    return created
+
+
+def asset_response(request: Request, assets_dir: str, path: str) -> Response:
+    """
+    返回 assets 下的构建产物，客户端支持时返回预压缩版本
+
+    Raises:
+        FileNotFoundError: 文件不存在或路径越界
+    """
+    root = os.path.realpath(assets_dir)
+    full_path = os.path.realpath(os.path.join(root, path))
+    if not full_path.startswith(root + os.sep) or not os.path.isfile(full_path):
+        raise FileNotFoundError(path)
+
+    media_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+    headers = {"vary": "Accept-Encoding"}
+    if os.path.splitext(full_path)[1] in COMPRESSIBLE_EXTENSIONS:
+        variants = [
+            encoding for encoding in available_encodings()
+            if os.path.isfile(full_path + ENCODING_SUFFIXES[encoding])
+        ]
+        encoding = choose_encoding(request.headers.get("accept-encoding"), variants)
+        if encoding:
+            headers["content-encoding"] = encoding
+            full_path += ENCODING_SUFFIXES[encoding]
+    return media_file_response(
+        request, full_path, cache_control=IMMUTABLE_CACHE_CONTROL, media_type=media_type, headers=headers
+    )
+
+
+class IndexPage:
+    """
+    内存中的 index.html 及其压缩版本
+
+    每个请求只做一次 stat，文件被重新构建（修改时间或大小变化）时重新加载；
+    浏览器每次都协商（no-cache），未变化时返回 304
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._signature = None
+        self._bodies = {}
+        self._etag = None
+
+    def _load(self):
+        stat = os.stat(self.path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == self._signature:
+            return
+        with self._lock:
+            if signature == self._signature:
+                return
+            with open(self.path, "rb") as f:
+                data = f.read()
+            bodies = {None: data}
+            for encoding in available_encodings():
+                bodies[encoding] = compress(data, encoding)
+            self._bodies = bodies
+            self._etag = hashlib.sha256(data).hexdigest()[:32]
+            self._signature = signature
+
+    def response(self, request: Request) -> Response:
+        self._load()
+        encoding = choose_encoding(request.headers.get("accept-encoding"), [e for e in self._bodies if e])
+        # 不同编码是不同的表示，强 ETag 需要区分
+        etag = f'"{self._etag}-{encoding}"' if encoding else f'"{self._etag}"'
+        headers = {"cache-control": "no-cache", "etag": etag, "vary": "Accept-Encoding"}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+        if encoding:
+            headers["content-encoding"] = encoding
+        return Response(self._bodies[encoding], media_type="text/html", headers=headers)
+
+
+if __name__ == "__main__":
+    # 前端构建后执行（backend 目录下）：python -m services.static_assets ../frontend/dist
+    import sys
+
+    count = precompress_assets(sys.argv[1])
+    print(f"[前端] 预压缩 {count} 个文件（{' / '.join(available_encodings())}）")
@@ -0,0 +1,350 @@
+"""
+视频任务提交调度器
+批量生成时消息先落库为 PENDING，由调度器按令牌桶限速逐个提交给服务商，
+提交失败时整体暂停一段时间再重试（服务商限流时不会继续撞墙）。
+多个 worker 进程共享同一个令牌桶（状态在 rate_limits 表），领取任务时记录 worker 并定期续约；
+租约过期（领取的 worker 已退出）的任务：未调用提交接口的恢复为 PENDING，
+调用提交接口时中断、结果未知的标记为失败（不自动重试，避免服务商重复生成）
+"""
+import asyncio
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.dialects.sqlite import insert
+
+from config import VIDEO_BATCH_CONFIG
+from database import AsyncSessionLocal
+from models import Message, MessageRole, RateLimit, TaskStatus, VideoChain
+from services.provider_factory import get_provider
+from services.publisher import resolve_public_url
+from services.reference_image import prepare_reference_url
+from services.session_summary import refresh_session_summary_async
+from services.video_chain import ACTIVE_CHAIN_STATUSES, CHAIN_ID_PREFIX
+
+
+class TokenBucket:
+    """令牌桶限速，可整体暂停；状态存在数据库中，所有 worker 进程共享同一个桶"""
+
+    def __init__(self, name: str, rate_per_minute: float, burst: int):
+        self.name = name
+        self.interval = 60.0 / rate_per_minute
+        self.burst = burst
+        self._created = False
+
+    async def _ensure_row(self, db):
+        if not self._created:
+            await db.execute(
+                insert(RateLimit)
+                .values(name=self.name, tokens=float(self.burst), updated_at=time.time(), paused_until=0.0)
+                .on_conflict_do_nothing()
+            )
+            self._created = True
+
+    async def pause(self, seconds: float):
+        """暂停发放令牌（服务商返回错误时退避）"""
+        now = time.time()
+        async with AsyncSessionLocal() as db:
+            await self._ensure_row(db)
+            await db.execute(
+                update(RateLimit)
+                .where(RateLimit.name == self.name)
+                .values(paused_until=func.max(RateLimit.paused_until, now + seconds), tokens=0.0, updated_at=now)
+            )
+            await db.commit()
+
+    async def acquire(self):
+        while True:
+            now = time.time()
+            # 暂停期间不补充令牌：从 updated_at 与 paused_until 中较晚的时间开始计算
+            refilled = func.min(
+                self.burst,
+                RateLimit.tokens + (now - func.max(RateLimit.updated_at, RateLimit.paused_until)) / self.interval,
+            )
+            async with AsyncSessionLocal() as db:
+                await self._ensure_row(db)
+                # 条件更新保证多个 worker 同时取令牌时不会超发
+                result = await db.execute(
+                    update(RateLimit)
+                    .where(RateLimit.name == self.name, RateLimit.paused_until <= now, refilled >= 1)
+                    .values(tokens=refilled - 1, updated_at=now)
+                )
+                state = None
+                if result.rowcount == 0:
+                    state = await db.get(RateLimit, self.name)
+                await db.commit()
+            if state is None:
+                return
+            if state.paused_until > now:
+                wait = state.paused_until - now
+            else:
+                tokens = min(self.burst, state.tokens + (now - max(state.updated_at, state.paused_until)) / self.interval)
+                wait = (1 - tokens) * self.interval
+            await asyncio.sleep(max(wait, 0.05))
+
+
+# 区分同一数据库上的多个调度器进程（uvicorn workers）
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_queue: Optional[asyncio.Queue] = None
+_queued_ids: set = set()
+_worker: Optional[asyncio.Task] = None
+_maintenance: Optional[asyncio.Task] = None
+_bucket = TokenBucket("video_submit", VIDEO_BATCH_CONFIG["submits_per_minute"], VIDEO_BATCH_CONFIG["burst"])
+
+
+async def acquire_submit_slot():
+    """等待提交令牌（续写链等不经过调度队列的提交也共用同一个限速）"""
+    await _bucket.acquire()
+
+
+async def _claim(db, message_id: int) -> Optional[Message]:
+    """把 PENDING 消息标记为 QUEUED 并记录领取的 worker；已被其他 worker 领取时返回 None"""
+    result = await db.execute(
+        update(Message)
+        .where(Message.id == message_id, Message.status == TaskStatus.PENDING, Message.task_id.is_(None))
+        .values(status=TaskStatus.QUEUED, claimed_by=WORKER_ID, claimed_at=datetime.utcnow())
+    )
+    await db.commit()
+    if result.rowcount == 0:
+        return None
+    return await db.get(Message, message_id)
+
+
+async def _fail(db, message: Message, error: str):
+    message.submitting_since = None
+    message.status = TaskStatus.FAILED
+    message.error_message = error
+    await refresh_session_summary_async(db, message.session_id)
+    await db.commit()
+
+
+async def _submit(message_id: int):
+    async with AsyncSessionLocal() as db:
+        message = await _claim(db, message_id)
+        if message is None:
+            return
+
+        provider = get_provider()
+        try:
+            image_url = message.reference_image
+            if image_url:
+                image_url = await prepare_reference_url(db, image_url, provider.max_reference_image_side)
+                if provider.requires_public_image_url:
+                    image_url = await resolve_public_url(db, image_url)
+        except Exception as e:
+            await _fail(db, message, str(e))
+            return
+
+        task_id = None
+        delay = VIDEO_BATCH_CONFIG["retry_backoff_seconds"]
+        try:
+            for attempt in range(1, VIDEO_BATCH_CONFIG["max_attempts"] + 1):
+                await _bucket.acquire()
+                # 先落库"提交中"：调用期间被中断时，重启后据此判断结果未知
+                message.submitting_since = datetime.utcnow()
+                await db.commit()
+                try:
+                    task_id = await run_in_threadpool(
+                        provider.submit_task,
+                        prompt=message.prompt,
+                        image_url=image_url,
+                        aspect_ratio=message.aspect_ratio,
+                        duration=message.duration,
+                    )
+                    break
+                except Exception as e:
+                    if attempt == VIDEO_BATCH_CONFIG["max_attempts"]:
+                        print(f"[提交调度] 消息 {message_id} 提交失败: {e}")
+                        await _fail(db, message, str(e))
+                        return
+                    print(f"[提交调度] 消息 {message_id} 第 {attempt} 次提交失败，暂停 {delay} 秒: {e}")
+                    message.submitting_since = None
+                    await db.commit()
+                    await _bucket.pause(delay)
+                    delay *= 2
+        except asyncio.CancelledError:
+            # 还未调用提交接口：恢复为 PENDING，下次启动重新提交。
+            # 正在调用时线程不会随之停止，服务商可能已接受任务，保留"提交中"等租约过期后对账
+            if task_id is None and message.submitting_since is None:
+                message.status = TaskStatus.PENDING
+                message.claimed_by = None
+                message.claimed_at = None
+                await db.commit()
+            raise
+
+        message.task_id = task_id
+        message.submitting_since = None
+        await refresh_session_summary_async(db, message.session_id)
+        await db.commit()
+
+    # 提交成功后启动轮询线程（与图生视频相同的轮询逻辑）
+    from tasks.task_recovery import poll_single_task
+    threading.Thread(target=poll_single_task, args=(message_id, task_id), daemon=True).start()
+
+
+async def _worker_loop():
+    while True:
+        message_id = await _queue.get()
+        try:
+            await _submit(message_id)
+        except Exception as e:
+            print(f"[提交调度] 消息 {message_id} 处理出错: {e}")
+        finally:
+            _queued_ids.discard(message_id)
+            _queue.task_done()
+
+
+def enqueue_submissions(message_ids: Iterable[int]):
+    """把已落库的 PENDING 消息加入提交队列（已在本进程队列中的忽略）"""
+    for message_id in message_ids:
+        if message_id not in _queued_ids:
+            _queued_ids.add(message_id)
+            _queue.put_nowait(message_id)
+
+
+def queue_size() -> int:
+    """等待提交的任务数"""
+    return _queue.qsize() if _queue else 0
+
+
+async def _heartbeat(db):
+    """为本 worker 已领取、尚未拿到 task_id 的任务和正在推进的续写链续约"""
+    now = datetime.utcnow()
+    await db.execute(
+        update(Message)
+        .where(
+            Message.claimed_by == WORKER_ID,
+            Message.task_id.is_(None),
+            Message.status.in_([TaskStatus.PENDING, TaskStatus.QUEUED]),
+        )
+        .values(claimed_at=now)
+    )
+    await db.execute(
+        update(VideoChain)
+        .where(VideoChain.claimed_by == WORKER_ID, VideoChain.status.in_(ACTIVE_CHAIN_STATUSES))
+        .values(claimed_at=now)
+    )
+    await db.commit()
+
+
+async def _reconcile_interrupted(db):
+    """
+    对账领取租约已过期（领取的 worker 已退出）的批量任务：
+    未调用提交接口的恢复为 PENDING；调用提交接口时中断的标记为失败；
+    续写链由推进它的 worker 逐段提交，链标记为中断，未拿到 task_id 的段一律标记为失败。
+    其他 worker 可能同时对账，每条按读取时的状态和心跳条件更新，只有一个 worker 生效
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=VIDEO_BATCH_CONFIG["claim_lease_seconds"])
+    result = await db.execute(
+        select(Message).where(
+            Message.batch_id.isnot(None),
+            Message.role == MessageRole.ASSISTANT,
+            Message.status.in_([TaskStatus.PENDING, TaskStatus.QUEUED]),
+            Message.task_id.is_(None),
+            or_(Message.claimed_at.is_(None), Message.claimed_at < cutoff),
+        )
+    )
+    restored = failed = 0
+    changed_sessions = set()
+    for message in result.scalars().all():
+        if message.batch_id.startswith(CHAIN_ID_PREFIX):
+            values = {"status": TaskStatus.FAILED, "error_message": "续写链因服务重启中断"}
+        elif message.status == TaskStatus.PENDING:
+            continue
+        elif message.submitting_since is None:
+            values = {"status": TaskStatus.PENDING}
+        else:
+            values = {
+                "status": TaskStatus.FAILED,
+                "error_message": "服务重启时提交结果未知（服务商可能已接受任务），为避免重复生成未自动重试",
+            }
+        unchanged = (
+            Message.claimed_at.is_(None) if message.claimed_at is None else Message.claimed_at == message.claimed_at
+        )
+        update_result = await db.execute(
+            update(Message)
+            .where(Message.id == message.id, Message.status == message.status, Message.task_id.is_(None), unchanged)
+            .values(submitting_since=None, claimed_by=None, claimed_at=None, **values)
+            .execution_options(synchronize_session=False)
+        )
+        if update_result.rowcount == 0:
+            continue  # 其他 worker 已处理或领取的 worker 刚续约
+        changed_sessions.add(message.session_id)
+        if values["status"] == TaskStatus.FAILED:
+            failed += 1
+        else:
+            restored += 1
+    chains = await db.execute(
+        update(VideoChain)
+        .where(
+            VideoChain.status.in_(ACTIVE_CHAIN_STATUSES),
+            or_(VideoChain.claimed_at.is_(None), VideoChain.claimed_at < cutoff),
+        )
+        .values(status="interrupted", error="推进续写链的服务进程已退出")
+    )
+    await db.commit()
+    if chains.rowcount:
+        print(f"[提交调度] {chains.rowcount} 条续写链因服务重启中断")
+    for session_id in changed_sessions:
+        await refresh_session_summary_async(db, session_id)
+    await db.commit()
+    if restored or failed:
+        print(f"[提交调度] 对账中断的任务：恢复 {restored} 个，标记失败 {failed} 个")
+
+
+async def _maintenance_loop():
+    """定期续约、对账中断的任务，并把待提交的任务（包括已退出 worker 队列中的）加入本进程队列"""
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                await _heartbeat(db)
+                await _reconcile_interrupted(db)
+                result = await db.execute(
+                    select(Message.id).where(
+                        Message.batch_id.isnot(None),
+                        Message.batch_id.notlike(f"{CHAIN_ID_PREFIX}%"),
+                        Message.role == MessageRole.ASSISTANT,
+                        Message.status == TaskStatus.PENDING,
+                        Message.task_id.is_(None),
+                    ).order_by(Message.id)
+                )
+                message_ids = [message_id for message_id in result.scalars().all() if message_id not in _queued_ids]
+            if message_ids:
+                print(f"[提交调度] 恢复 {len(message_ids)} 个待提交任务")
+                enqueue_submissions(message_ids)
+        except Exception as e:
+            print(f"[提交调度] 续约/对账出错: {e}")
+        await asyncio.sleep(VIDEO_BATCH_CONFIG["heartbeat_seconds"])
+
+
+def start_submission_scheduler():
+    """启动提交调度器（需在事件循环线程中调用）"""
+    global _queue, _worker, _maintenance
+    loop = asyncio.get_running_loop()
+    _queue = asyncio.Queue()
+    _queued_ids.clear()
+    _worker = loop.create_task(_worker_loop())
+    _maintenance = loop.create_task(_maintenance_loop())
+    print(f"[提交调度] 调度器已启动（{WORKER_ID}）")
+
+
+async def stop_submission_scheduler():
+    """停止提交调度器（未提交的任务保持 PENDING，由本进程下次启动或其他 worker 接手；正在提交的任务等租约过期后对账）"""
+    global _worker, _maintenance
+    for task in (_worker, _maintenance):
+        if task is None:
+            continue
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    _worker = _maintenance = None
+    print("[提交调度] 调度器已停止")
@@ -0,0 +1,158 @@
+"""
+生成任务阶段时间与耗时分析
+Message 的 task_id / status / local_path 被赋值时记录对应的阶段时间（提交、首次生成中、
+中转商完成、下载完成、失败），所有提交路径和轮询线程都经过这些赋值，无需逐处修改。
+时间精度受轮询间隔限制：first_processing_at、provider_completed_at 是轮询"观察到"的时间
+"""
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import CURRENT_PROVIDER
+from models import Message, TaskStatus
+
+
+# ---------- 阶段时间记录 ----------
+
+def _on_task_id_set(message, value, oldvalue, initiator):
+    if value and message.submitted_at is None:
+        message.submitted_at = datetime.utcnow()
+        message.provider = message.provider or CURRENT_PROVIDER
+
+
+def _on_status_set(message, value, oldvalue, initiator):
+    if value == oldvalue or message.task_id is None:
+        return  # 图片生成等不经过中转商任务的消息
+    now = datetime.utcnow()
+    if value == TaskStatus.PROCESSING and message.first_processing_at is None:
+        message.first_processing_at = now
+    elif value == TaskStatus.SUCCESS and message.provider_completed_at is None:
+        message.provider_completed_at = now
+    elif value == TaskStatus.FAILED and message.failed_at is None:
+        message.failed_at = now
+
+
+def _on_local_path_set(message, value, oldvalue, initiator):
+    if value and message.task_id is not None and message.downloaded_at is None:
+        message.downloaded_at = datetime.utcnow()
+
+
+event.listen(Message.task_id, "set", _on_task_id_set)
+event.listen(Message.status, "set", _on_status_set, active_history=True)
+event.listen(Message.local_path, "set", _on_local_path_set)
+
+
+# ---------- 耗时分析 ----------
+
+# 阶段名 -> (开始时间列, 结束时间列)
+PHASES = {
+    "submit": ("created_at", "submitted_at"),  # 排队等待提交 + 参考图处理 + 提交请求
+    "queued": ("submitted_at", "first_processing_at"),  # 中转商排队
+    "processing": ("first_processing_at", "provider_completed_at"),  # 中转商生成
+    "generation": ("submitted_at", "provider_completed_at"),  # 中转商总耗时（未观察到生成中时也有值）
+    "download": ("provider_completed_at", "downloaded_at"),
+    "end_to_end": ("created_at", "downloaded_at"),
+    "until_failure": ("submitted_at", "failed_at"),
+}
+
+# 分组维度 -> 取值方式
+GROUP_DIMENSIONS = {
+    "provider": lambda row: row.provider,
+    "aspect_ratio": lambda row: row.aspect_ratio,
+    "duration": lambda row: row.duration,
+    "mode": lambda row: "image" if row.reference_image else "text",  # 图生视频 / 文生视频
+}
+
+_PERCENTILES = (50, 90, 99)
+
+
+def parse_group_by(group_by: Optional[str]) -> List[str]:
+    """
+    解析 group_by= 参数（逗号分隔），为空时按全部维度分组
+
+    Raises:
+        ValueError: 包含未知维度
+    """
+    if group_by is None:
+        return list(GROUP_DIMENSIONS)
+    requested = [name.strip() for name in group_by.split(",") if name.strip()]
+    unknown = [name for name in requested if name not in GROUP_DIMENSIONS]
+    if unknown:
+        raise ValueError(f"未知分组维度: {', '.join(unknown)}")
+    return list(dict.fromkeys(requested))
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """线性插值百分位数（sorted_values 已升序且非空）"""
+    rank = (len(sorted_values) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+def _phase_stats(rows: list) -> dict:
+    stats = {}
+    for phase, (start_col, end_col) in PHASES.items():
+        values = sorted(
+            (getattr(row, end_col) - getattr(row, start_col)).total_seconds()
+            for row in rows
+            if getattr(row, start_col) and getattr(row, end_col)
+        )
+        if not values:
+            continue
+        stats[phase] = {
+            "count": len(values),
+            **{f"p{p}": round(percentile(values, p), 2) for p in _PERCENTILES},
+            "max": round(values[-1], 2),
+        }
+    return stats
+
+
+def _summarize(rows: list) -> dict:
+    return {
+        "tasks": len(rows),
+        "succeeded": sum(1 for row in rows if row.provider_completed_at),
+        "failed": sum(1 for row in rows if row.failed_at),
+        "phases": _phase_stats(rows),
+    }
+
+
+async def task_latency_report(db: AsyncSession, hours: float, dimensions: List[str]) -> dict:
+    """
+    统计时间窗口内（按创建时间）已提交任务各阶段耗时的 p50/p90/p99（秒）
+
+    Args:
+        hours: 统计最近多少小时创建的任务
+        dimensions: 分组维度，见 GROUP_DIMENSIONS；空列表时只输出总体统计
+    """
+    since = datetime.utcnow() - timedelta(hours=hours)
+    result = await db.execute(
+        select(
+            Message.provider,
+            Message.aspect_ratio,
+            Message.duration,
+            Message.reference_image,
+            *(Message.__table__.c[name] for name in dict.fromkeys(col for cols in PHASES.values() for col in cols)),
+        ).where(
+            Message.created_at >= since,
+            Message.submitted_at.isnot(None),  # 阶段时间上线前的历史任务没有记录
+        )
+    )
+    rows = result.all()
+
+    groups = {}
+    for row in rows:
+        key = tuple(GROUP_DIMENSIONS[name](row) for name in dimensions)
+        groups.setdefault(key, []).append(row)
+
+    return {
+        "since": since.isoformat(),
+        "group_by": dimensions,
+        "overall": _summarize(rows),
+        "groups": [
+            {**dict(zip(dimensions, key)), **_summarize(group_rows)}
+            for key, group_rows in sorted(groups.items(), key=lambda item: -len(item[1]))
+        ] if dimensions else [],
+    }
@@ -0,0 +1,144 @@
+"""
+缩略图服务
+为上传的参考图和生成的图片提供固定宽度档位的 WebP/JPEG 缩略图，
+首次请求时在进程池中生成并缓存到磁盘，聊天列表只需加载原图的一小部分字节
+"""
+import asyncio
+import os
+from typing import Dict, Optional
+
+from config import SERVER_CONFIG, THUMBNAIL_CONFIG
+from services.frame_extractor import get_frame_executor
+from services.media_response import strong_etag_of
+from services.media_store import local_path_of, touch_media
+
+THUMBNAIL_URL_PREFIX = "/api/media/thumb"
+
+# 可生成缩略图的本地媒体目录
+THUMBNAIL_KINDS = ("uploads", "downloads")
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".bmp"}
+
+_THUMBNAIL_FORMATS = {
+    "webp": (".webp", "image/webp"),
+    "jpeg": (".jpg", "image/jpeg"),
+}
+
+# 同一缩略图的并发请求只生成一次
+_inflight = {}
+
+
+def thumbnail_media_type() -> str:
+    return _THUMBNAIL_FORMATS[THUMBNAIL_CONFIG["format"]][1]
+
+
+def thumbnail_urls(local_url: Optional[str]) -> Optional[Dict[str, str]]:
+    """
+    本地图片各宽度档位的缩略图URL
+
+    Returns:
+        {"256": url, "512": url, ...}；非本地图片返回 None
+    """
+    if not local_url or not any(local_url.startswith(f"/{kind}/") for kind in THUMBNAIL_KINDS):
+        return None
+    if os.path.splitext(local_url)[1].lower() not in IMAGE_EXTENSIONS:
+        return None
+    # local_url 形如 /uploads/xxx.png
+    return {str(width): f"{THUMBNAIL_URL_PREFIX}/{width}{local_url}" for width in THUMBNAIL_CONFIG["widths"]}
+
+
+def thumbnail_etag(filename: str, width: int) -> Optional[str]:
+    """原图内容寻址时，缩略图由原图哈希、宽度和输出参数唯一确定"""
+    stem = os.path.splitext(filename)[0]
+    if not strong_etag_of(filename):
+        return None
+    return f'"{stem}-w{width}-{THUMBNAIL_CONFIG["format"]}-q{THUMBNAIL_CONFIG["quality"]}"'
+
+
+def _thumbnail_path(kind: str, filename: str, width: int) -> str:
+    stem = os.path.splitext(filename)[0]
+    ext = _THUMBNAIL_FORMATS[THUMBNAIL_CONFIG["format"]][0]
+    return os.path.join(SERVER_CONFIG["thumbnails_dir"], f"{kind}-{stem}-w{width}{ext}")
+
+
+def render_thumbnail(source_path: str, target_path: str, width: int, fmt: str, quality: int):
+    """缩放图片到指定宽度（不放大）并编码写盘（在子进程中执行）"""
+    import cv2
+
+    image = cv2.imread(source_path, cv2.IMREAD_COLOR)
+    if image is None:
+        raise Exception("无法读取图片")
+    height, source_width = image.shape[:2]
+    if source_width > width:
+        image = cv2.resize(image, (width, max(1, round(height * width / source_width))), interpolation=cv2.INTER_AREA)
+
+    ext = _THUMBNAIL_FORMATS[fmt][0]
+    params = [cv2.IMWRITE_WEBP_QUALITY, quality] if fmt == "webp" else [cv2.IMWRITE_JPEG_QUALITY, quality]
+    ok, buffer = cv2.imencode(ext, image, params)
+    if not ok:
+        raise Exception("缩略图编码失败")
+    tmp_path = f"{target_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(buffer.tobytes())
+    os.replace(tmp_path, target_path)
+
+
+async def get_thumbnail(kind: str, filename: str, width: int) -> str:
+    """
+    获取缩略图文件路径，不存在时生成
+
+    Raises:
+        FileNotFoundError: 原图不存在
+    """
+    source_path = local_path_of(f"/{kind}/{filename}")
+    if not source_path or not os.path.isfile(source_path):
+        raise FileNotFoundError(filename)
+
+    target_path = _thumbnail_path(kind, filename, width)
+    if os.path.isfile(target_path):
+        touch_media(target_path)
+        return target_path
+
+    future = _inflight.get(target_path)
+    if future is None:
+        os.makedirs(SERVER_CONFIG["thumbnails_dir"], exist_ok=True)
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            get_frame_executor(),
+            render_thumbnail,
+            source_path,
+            target_path,
+            width,
+            THUMBNAIL_CONFIG["format"],
+            THUMBNAIL_CONFIG["quality"],
+        )
+        _inflight[target_path] = future
+        future.add_done_callback(lambda _: _inflight.pop(target_path, None))
+    await asyncio.shield(future)
+    return target_path
+
+
+def evict_thumbnail_cache() -> int:
+    """缩略图缓存超出容量时按最久未访问淘汰，返回回收的字节数"""
+    directory = SERVER_CONFIG["thumbnails_dir"]
+    if not os.path.isdir(directory):
+        return 0
+    entries = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.is_file():
+                stat = entry.stat()
+                entries.append((entry.path, stat.st_size, max(stat.st_atime, stat.st_mtime)))
+
+    total = sum(size for _, size, _ in entries)
+    reclaimed = 0
+    for path, size, _ in sorted(entries, key=lambda e: e[2]):
+        if total <= THUMBNAIL_CONFIG["cache_max_bytes"]:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        reclaimed += size
+    return reclaimed
@@ -0,0 +1,175 @@
+"""
+请求耗时追踪
+中间件为每个 HTTP 请求创建一条追踪，请求期间的数据库查询、服务商调用、图床上传、
+CDN 下载和参考图片抓取按类别记录分段耗时（线程池中执行的代码同样计入，contextvars 会随之传递）。
+响应带 Server-Timing 头；超过阈值的慢请求打印分段明细，并保存在环形缓冲区中供管理接口查看。
+耗时只计到响应头发出为止：NDJSON 进度流、大文件和分段下载的传输时间取决于客户端，不算慢请求
+"""
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+
+from config import TRACING_CONFIG
+from database import async_engine, engine
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+_slow_traces = deque(maxlen=TRACING_CONFIG["slow_trace_buffer"])
+_slow_lock = threading.Lock()
+
+
+class Trace:
+    """一个请求的分段耗时（线程池中的分段可能并发写入，需要加锁）"""
+
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.started_at = datetime.utcnow()
+        self.started = time.perf_counter()
+        self.duration_ms = None
+        self.status = None
+        self.totals = {}  # 类别 -> [总耗时(ms), 次数]
+        self.spans = []  # [(类别, 相对开始时间(ms), 耗时(ms), 说明), ...]
+        self._lock = threading.Lock()
+
+    def add(self, name: str, started: float, duration: float, detail: Optional[str] = None):
+        if self.duration_ms is not None:
+            return  # 请求已结束（例如响应后继续运行的后台任务）
+        duration_ms = duration * 1000
+        with self._lock:
+            total = self.totals.setdefault(name, [0.0, 0])
+            total[0] += duration_ms
+            total[1] += 1
+            if len(self.spans) < TRACING_CONFIG["max_spans_per_trace"]:
+                self.spans.append((name, (started - self.started) * 1000, duration_ms, detail))
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def server_timing(self) -> str:
+        """Server-Timing 头：各类别耗时 + 总耗时（到响应头发出时为止）"""
+        with self._lock:
+            parts = [
+                f'{name};dur={total:.1f};desc="x{count}"'
+                for name, (total, count) in self.totals.items()
+            ]
+        parts.append(f"total;dur={self.elapsed_ms():.1f}")
+        return ", ".join(parts)
+
+    def finish(self, status: Optional[int]):
+        self.status = status
+        self.duration_ms = self.elapsed_ms()
+
+    def to_dict(self) -> dict:
+        accounted = sum(total for total, _ in self.totals.values())
+        return {
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration_ms, 1),
+            "breakdown": {
+                **{name: {"ms": round(total, 1), "count": count} for name, (total, count) in self.totals.items()},
+                # 未被分段覆盖的时间：路由处理、序列化等
+                "app": {"ms": round(max(0.0, self.duration_ms - accounted), 1), "count": 1},
+            },
+            "spans": [
+                {"name": name, "offset_ms": round(offset, 1), "ms": round(duration, 1), "detail": detail}
+                for name, offset, duration, detail in self.spans
+            ],
+        }
+
+
+@contextmanager
+def span(name: str, detail: Optional[str] = None):
+    """记录一段耗时到当前请求的追踪（不在请求中时不做任何事）"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, started, time.perf_counter() - started, detail)
+
+
+# ---------- 数据库查询 ----------
+
+# 开始时间记在本次执行的上下文上：语句出错时不会触发 after_cursor_execute，随上下文一起丢弃
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._trace_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_trace_started", None)
+    trace = _current_trace.get()
+    if trace is not None and started is not None:
+        trace.add("db", started, time.perf_counter() - started, statement.split(None, 1)[0])
+
+
+for _engine in (engine, async_engine.sync_engine):
+    event.listen(_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# ---------- 中间件 ----------
+
+class TracingMiddleware:
+    """ASGI 中间件：创建请求追踪、添加 Server-Timing 头、记录慢请求"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(scope["method"], scope["path"])
+        token = _current_trace.set(trace)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", trace.server_timing())
+                headers.append("Timing-Allow-Origin", "*")
+                # 响应头发出即结束计时，之后流式发送响应体期间的分段不再记录
+                trace.finish(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_trace.reset(token)
+            if trace.duration_ms is None:
+                trace.finish(None)  # 未发出响应（异常由外层处理）
+            if trace.duration_ms >= TRACING_CONFIG["slow_request_ms"]:
+                _record_slow(trace)
+
+
+def _record_slow(trace: Trace):
+    record = trace.to_dict()
+    with _slow_lock:
+        _slow_traces.append(record)
+    breakdown = ", ".join(
+        f"{name} {item['ms']:.0f}ms" + (f"×{item['count']}" if item["count"] > 1 else "")
+        for name, item in sorted(record["breakdown"].items(), key=lambda kv: -kv[1]["ms"])
+    )
+    print(f"[慢请求] {trace.method} {trace.path} {trace.status} {record['duration_ms']:.0f}ms（{breakdown}）")
+
+
+def get_slow_traces(limit: Optional[int] = None) -> list:
+    """最近的慢请求（本 worker 内，新的在前）"""
+    with _slow_lock:
+        traces = list(reversed(_slow_traces))
+    return traces[:limit] if limit else traces
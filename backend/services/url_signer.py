@@ -0,0 +1,43 @@
+"""
+媒体签名URL
+由后端直接向服务商提供参考图片：URL 带 HMAC 签名和过期时间，
+上传完成即可使用，无需先发布到 GitHub 图床
+"""
+import hashlib
+import hmac
+import time
+from typing import Optional
+
+from config import SIGNED_URL_CONFIG
+
+SIGNED_PATH_PREFIX = "/api/media/signed"
+
+
+def is_enabled() -> bool:
+    """配置了对外地址和签名密钥时启用"""
+    return bool(SIGNED_URL_CONFIG.get("base_url") and SIGNED_URL_CONFIG.get("secret"))
+
+
+def _signature(local_url: str, expires: int) -> str:
+    message = f"{local_url}:{expires}".encode()
+    return hmac.new(SIGNED_URL_CONFIG["secret"].encode(), message, hashlib.sha256).hexdigest()
+
+
+def sign_media_url(local_url: str, expires_in: Optional[int] = None) -> str:
+    """
+    为本地媒体URL生成签名公网URL
+
+    Args:
+        local_url: 本地URL，如 /uploads/<sha256>.png
+        expires_in: 有效期（秒），默认取配置
+    """
+    expires = int(time.time()) + (expires_in or SIGNED_URL_CONFIG["expires_seconds"])
+    base_url = SIGNED_URL_CONFIG["base_url"].rstrip("/")
+    return f"{base_url}{SIGNED_PATH_PREFIX}{local_url}?expires={expires}&sig={_signature(local_url, expires)}"
+
+
+def verify_signature(local_url: str, expires: int, sig: str) -> bool:
+    """校验签名且未过期"""
+    if not is_enabled() or expires < time.time():
+        return False
+    return hmac.compare_digest(_signature(local_url, expires), sig)
@@ -0,0 +1,216 @@
+"""
+视频续写链
+服务端自动循环"取上一段尾帧 → 以尾帧提交下一段 → 等待完成并下载"，
+最后在进程池中把各段按容器级拼接为一个 MP4（不重新编码）。
+各段消息带同一个 batch_id（即链ID，以 CHAIN_ID_PREFIX 开头，与批量生成的批次区分），进度按段查询。
+链的状态存在 video_chains 表，由推进它的 worker 定期续约；该 worker 退出后租约过期，
+提交调度器把链标记为中断、未提交的段标记为失败，不会被当作批量任务重新提交
+"""
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import List
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import update
+
+from config import SERVER_CONFIG, VIDEO_BATCH_CONFIG
+from database import AsyncSessionLocal
+from models import Message, MessageRole, MessageContentType, TaskStatus, VideoChain
+from services.frame_extractor import extract_last_frame_png, get_frame_executor, resolve_local_video
+from services.media_processing import process_downloaded_video
+from services.media_store import content_hash, media_filename, register_media, write_media_file
+from services.mp4 import concat_mp4
+from services.provider_factory import get_provider
+from services.publisher import resolve_public_url
+from services.reference_image import prepare_reference_url
+from services.session_summary import refresh_session_summary_async
+
+CHAIN_ID_PREFIX = "chain-"
+
+# 由 worker 推进中的链状态，租约过期即视为中断
+ACTIVE_CHAIN_STATUSES = ("running", "stitching")
+
+# 进行中的链任务（持有引用，避免被回收）
+_chain_tasks = set()
+
+
+class ChainError(Exception):
+    """续写链中某一段失败"""
+
+
+def chain_status(chain: VideoChain) -> str:
+    """链的当前状态；推进它的 worker 已退出（租约过期）但调度器尚未对账时也返回 interrupted"""
+    if chain.status in ACTIVE_CHAIN_STATUSES:
+        cutoff = datetime.utcnow() - timedelta(seconds=VIDEO_BATCH_CONFIG["claim_lease_seconds"])
+        if chain.claimed_at is None or chain.claimed_at < cutoff:
+            return "interrupted"
+    return chain.status
+
+
+async def _update_chain(chain_id: str, **values):
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(VideoChain).where(VideoChain.id == chain_id).values(**values))
+        await db.commit()
+
+
+async def _save_frame(db, png: bytes) -> str:
+    """把尾帧存为上传图片，返回本地URL（作为下一段的参考图）"""
+    sha256 = content_hash(png)
+    filename = media_filename(sha256, ".png")
+    await run_in_threadpool(write_media_file, SERVER_CONFIG["uploads_dir"], filename, png)
+    url = f"/uploads/{filename}"
+    await register_media(db, sha256, url)
+    return url
+
+
+async def _run_segment(db, chain_id: str, session_id: int, index: int, prompt: str, previous_url: str,
+                       aspect_ratio: str, duration: str) -> Message:
+    """生成一段：提取上一段尾帧、提交、等待完成"""
+    from services.submission_scheduler import WORKER_ID, acquire_submit_slot
+
+    png = await extract_last_frame_png(db, previous_url)
+    frame_url = await _save_frame(db, png)
+
+    db.add(Message(
+        session_id=session_id,
+        role=MessageRole.USER,
+        content_type=MessageContentType.IMAGE,
+        content=prompt,
+        reference_image=frame_url,
+        batch_id=chain_id,
+    ))
+    message = Message(
+        session_id=session_id,
+        role=MessageRole.ASSISTANT,
+        content_type=MessageContentType.VIDEO,
+        prompt=prompt,
+        reference_image=frame_url,
+        aspect_ratio=aspect_ratio,
+        duration=duration,
+        status=TaskStatus.PENDING,
+        batch_id=chain_id,
+        claimed_by=WORKER_ID,  # 由调度器心跳续约，其他 worker 不会把它当作中断的段
+        claimed_at=datetime.utcnow(),
+    )
+    db.add(message)
+    await refresh_session_summary_async(db, session_id)
+    await db.commit()
+
+    try:
+        provider = get_provider()
+        image_url = await prepare_reference_url(db, frame_url, provider.max_reference_image_side)
+        if provider.requires_public_image_url:
+            image_url = await resolve_public_url(db, image_url)
+        await acquire_submit_slot()
+        task_id = await run_in_threadpool(
+            provider.submit_task,
+            prompt=prompt,
+            image_url=image_url,
+            aspect_ratio=aspect_ratio,
+            duration=duration,
+        )
+    except Exception as e:
+        message.status = TaskStatus.FAILED
+        message.error_message = str(e)
+        await refresh_session_summary_async(db, session_id)
+        await db.commit()
+        raise ChainError(f"第 {index} 段提交失败: {e}")
+
+    message.task_id = task_id
+    message.status = TaskStatus.QUEUED
+    await refresh_session_summary_async(db, session_id)
+    await db.commit()
+
+    # 复用轮询逻辑：完成后已下载并生成尾帧，下一段直接从本地读取
+    from tasks.task_recovery import poll_single_task
+    await asyncio.to_thread(poll_single_task, message.id, task_id)
+    await db.refresh(message)
+    if message.status != TaskStatus.SUCCESS:
+        raise ChainError(f"第 {index} 段生成失败: {message.error_message or message.status}")
+    return message
+
+
+async def _stitch(db, chain_id: str, session_id: int, video_paths: List[str], prompt: str,
+                  aspect_ratio: str) -> Message:
+    """在进程池中拼接各段，写入一条结果消息"""
+    filename = f"{chain_id}.mp4"
+    output_path = os.path.join(SERVER_CONFIG["downloads_dir"], filename)
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(get_frame_executor(), concat_mp4, video_paths, output_path)
+
+    message = Message(
+        session_id=session_id,
+        role=MessageRole.ASSISTANT,
+        content_type=MessageContentType.VIDEO,
+        content=f"已拼接 {len(video_paths)} 段视频",
+        prompt=prompt,
+        aspect_ratio=aspect_ratio,
+        duration=str(round(result["duration"])),
+        status=TaskStatus.SUCCESS,
+        video_url=f"/downloads/{filename}",
+        local_path=filename,
+        batch_id=chain_id,
+    )
+    db.add(message)
+    await refresh_session_summary_async(db, session_id)
+    await db.commit()
+    await asyncio.to_thread(process_downloaded_video, message.id)
+    return message
+
+
+async def _run_chain(chain_id: str, session_id: int, source_url: str, prompts: List[str],
+                     aspect_ratio: str, duration: str, include_source: bool):
+    try:
+        async with AsyncSessionLocal() as db:
+            video_paths = []
+            if include_source:
+                source_path = await resolve_local_video(db, source_url)
+                if not source_path:
+                    raise ChainError("起始视频未下载到本地，无法拼接")
+                video_paths.append(source_path)
+
+            previous_url = source_url
+            for index, prompt in enumerate(prompts, start=1):
+                await _update_chain(chain_id, current_segment=index)
+                message = await _run_segment(
+                    db, chain_id, session_id, index, prompt, previous_url, aspect_ratio, duration
+                )
+                path = await resolve_local_video(db, message.video_url)
+                if not path:
+                    raise ChainError(f"第 {index} 段视频下载失败")
+                video_paths.append(path)
+                previous_url = message.video_url
+                print(f"[续写链] {chain_id} 第 {index}/{len(prompts)} 段完成")
+
+            await _update_chain(chain_id, status="stitching")
+            output = await _stitch(db, chain_id, session_id, video_paths, prompts[-1], aspect_ratio)
+            await _update_chain(chain_id, status="completed", output_message_id=output.id)
+            print(f"[续写链] {chain_id} 拼接完成: {output.video_url}")
+    except Exception as e:
+        print(f"[续写链] {chain_id} 失败: {e}")
+        await _update_chain(chain_id, status="failed", error=str(e))
+
+
+async def start_chain(db, session_id: int, source_url: str, prompts: List[str], aspect_ratio: str,
+                      duration: str, include_source: bool) -> str:
+    """记录并启动续写链，返回链ID"""
+    from services.submission_scheduler import WORKER_ID
+
+    chain_id = f"{CHAIN_ID_PREFIX}{uuid.uuid4().hex[:26]}"  # 与批次ID同为 32 个字符
+    db.add(VideoChain(
+        id=chain_id,
+        session_id=session_id,
+        status="running",
+        total_segments=len(prompts),
+        claimed_by=WORKER_ID,
+        claimed_at=datetime.utcnow(),
+    ))
+    await db.commit()
+    task = asyncio.create_task(
+        _run_chain(chain_id, session_id, source_url, prompts, aspect_ratio, duration, include_source)
+    )
+    _chain_tasks.add(task)
+    task.add_done_callback(_chain_tasks.discard)
+    return chain_id
@@ -0,0 +1,59 @@
+"""
+生成结果下载
+把服务商返回的视频流式下载到 downloads 目录，
+改写为 faststart 后才改名到最终文件名，同一URL的内容从出现起就不再变化（可 immutable 缓存）
+"""
+import os
+import time
+
+import requests
+
+from config import SERVER_CONFIG
+from services.metrics import DOWNLOAD_SECONDS, observe_download
+from services.mp4 import Mp4Error, faststart_mp4
+from services.tracing import span
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def download_video(video_url: str, task_id: str) -> str:
+    """
+    下载视频到本地（已存在则跳过）
+
+    分块写入临时文件后原子重命名，不会留下半截的 .mp4
+
+    Returns:
+        本地文件名（存入 Message.local_path）
+    """
+    downloads_dir = SERVER_CONFIG["downloads_dir"]
+    os.makedirs(downloads_dir, exist_ok=True)
+    video_filename = f"{task_id}.mp4"
+    local_path = os.path.join(downloads_dir, video_filename)
+    if os.path.exists(local_path):
+        return video_filename
+
+    tmp_path = f"{local_path}.part"
+    started = time.monotonic()
+    size = 0
+    try:
+        try:
+            with span("download", video_filename):
+                with requests.get(video_url, timeout=120, stream=True) as response:
+                    response.raise_for_status()
+                    with open(tmp_path, "wb") as f:
+                        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                            f.write(chunk)
+                            size += len(chunk)
+        except Exception:
+            DOWNLOAD_SECONDS.labels(outcome="error").observe(time.monotonic() - started)
+            raise
+        observe_download(size, time.monotonic() - started)
+        try:
+            faststart_mp4(tmp_path)
+        except Mp4Error as e:
+            print(f"[下载] {video_filename} faststart 改写失败，保留原文件: {e}")
+        os.replace(tmp_path, local_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return video_filename
@@ -0,0 +1,233 @@
+"""
+媒体文件回收模块
+删除会话/消息只删数据库记录，uploads 和 downloads 里的文件会一直留在磁盘上。
+守护线程定期对账：删除不再被任何消息引用的文件，并在总容量超出配额时
+按最久未访问顺序淘汰有远程副本的旧视频
+"""
+import os
+import threading
+import time
+from datetime import datetime
+
+from database import SessionLocal
+from models import Message
+from config import MEDIA_GC_CONFIG, SERVER_CONFIG
+from services.session_summary import refresh_session_summary
+from services.media_store import file_name_of, reference_counts, forget_media_files
+from services.thumbnails import evict_thumbnail_cache
+from services.reference_image import reference_source_of
+
+# 全局停止标志
+_stop_flag = threading.Event()
+# 同一进程内避免定时回收和手动回收并发执行
+_gc_lock = threading.Lock()
+
+_last_report = None
+
+
+def _media_dirs():
+    return [SERVER_CONFIG["uploads_dir"], SERVER_CONFIG["downloads_dir"], SERVER_CONFIG["derived_dir"]]
+
+
+def _is_evictable_dir(path: str) -> bool:
+    """
+    配额淘汰只作用于 downloads：封面帧、尾帧（derived）体积小，且 URL 按 immutable 缓存，
+    淘汰后 poster_url/last_frame_url 会失效，只在不再被引用时作为孤儿删除
+    """
+    return os.path.dirname(os.path.abspath(path)) == os.path.abspath(SERVER_CONFIG["downloads_dir"])
+
+
+def collect_referenced_files(db) -> set:
+    """收集引用计数大于 0 的媒体文件名"""
+    return set(reference_counts(db))
+
+
+def collect_evictable_files(db) -> set:
+    """
+    可按配额淘汰的文件名：只被"已有远程 video_url 的消息的 local_path"引用的视频
+
+    淘汰后这些消息回退到远程 video_url 播放；生成的图片、上传的参考图、
+    拼接视频等没有远程副本的文件即使很久未访问也不淘汰
+    """
+    backed, pinned = set(), set()
+    rows = db.query(
+        Message.local_path,
+        Message.video_url,
+        Message.reference_image,
+        Message.poster_url,
+        Message.last_frame_url,
+    ).all()
+    for local_path, video_url, *others in rows:
+        has_remote = bool(video_url) and video_url.startswith(("http://", "https://"))
+        name = file_name_of(local_path)
+        if name:
+            (backed if has_remote else pinned).add(name)
+        if not has_remote:
+            others.append(video_url)
+        pinned.update(filter(None, map(file_name_of, others)))
+    return backed - pinned
+
+
+def _is_referenced(filename: str, referenced: set, referenced_stems: set) -> bool:
+    """参考图片预处理结果随原图保留"""
+    return filename in referenced or reference_source_of(filename) in referenced_stems
+
+
+def scan_media_files() -> list:
+    """
+    扫描媒体目录
+
+    Returns:
+        [(文件路径, 字节数, 最后使用时间戳), ...]
+    """
+    files = []
+    for directory in _media_dirs():
+        if not os.path.isdir(directory):
+            continue
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                # atime 可能因 noatime 挂载不更新，取 atime/mtime 中较新的作为最后使用时间
+                files.append((entry.path, stat.st_size, max(stat.st_atime, stat.st_mtime)))
+    return files
+
+
+def _delete_in_batches(paths: list) -> tuple:
+    """
+    分批删除文件，批次之间暂停以限制 I/O 速率
+
+    Returns:
+        (回收的字节数, 实际删除的文件路径)；收到停止信号时剩余的文件不删除
+    """
+    reclaimed = 0
+    deleted = []
+    batch_size = MEDIA_GC_CONFIG["batch_size"]
+    for start in range(0, len(paths), batch_size):
+        if _stop_flag.is_set():
+            break
+        for path in paths[start:start + batch_size]:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                reclaimed += size
+                deleted.append(path)
+            except FileNotFoundError:
+                pass  # 其他 worker 已删除
+            except OSError as e:
+                print(f"[GC] 删除 {path} 失败: {e}")
+        if start + batch_size < len(paths):
+            time.sleep(MEDIA_GC_CONFIG["batch_interval_seconds"])
+    return reclaimed, deleted
+
+
+def _detach_evicted_files(db, names: list):
+    """清空被淘汰视频的 local_path（这些消息都有远程 video_url，播放回退到远程）"""
+    session_ids = set()
+    for name in names:
+        messages = db.query(Message).filter(Message.local_path.like(f"%{name}")).all()
+        for message in messages:
+            if file_name_of(message.local_path) == name:
+                message.local_path = None
+                session_ids.add(message.session_id)
+    for session_id in session_ids:
+        refresh_session_summary(db, session_id)
+    db.commit()
+
+
+def run_media_gc() -> dict:
+    """
+    执行一次媒体回收
+
+    Returns:
+        回收报告：删除的孤儿文件数、淘汰的文件数、回收字节数、剩余总字节数
+    """
+    global _last_report
+    with _gc_lock:
+        started = time.time()
+        db = SessionLocal()
+        try:
+            referenced = collect_referenced_files(db)
+            referenced_stems = {os.path.splitext(name)[0] for name in referenced}
+            files = scan_media_files()
+            cutoff = time.time() - MEDIA_GC_CONFIG["grace_seconds"]
+
+            # 1. 孤儿文件：没有任何消息引用，且已过保护期
+            orphans = [
+                f for f in files
+                if not _is_referenced(os.path.basename(f[0]), referenced, referenced_stems) and f[2] < cutoff
+            ]
+            orphan_bytes, deleted_orphans = _delete_in_batches([f[0] for f in orphans])
+
+            # 2. 容量配额：按最后使用时间从旧到新淘汰有远程副本的视频，直到低于上限
+            orphan_paths = set(deleted_orphans)
+            remaining = [f for f in files if f[0] not in orphan_paths]
+            total_bytes = sum(f[1] for f in remaining)
+            evicted = []
+            max_total = MEDIA_GC_CONFIG.get("max_total_bytes")
+            if max_total is not None and total_bytes > max_total:
+                evictable = collect_evictable_files(db)
+                for path, size, last_used in sorted(remaining, key=lambda f: f[2]):
+                    if total_bytes <= max_total:
+                        break
+                    if last_used >= cutoff or not _is_evictable_dir(path) or os.path.basename(path) not in evictable:
+                        continue
+                    evicted.append(path)
+                    total_bytes -= size
+            evicted_bytes, deleted_evicted = _delete_in_batches(evicted)
+            total_bytes = sum(f[1] for f in remaining) - evicted_bytes
+            if deleted_evicted:
+                _detach_evicted_files(db, [os.path.basename(p) for p in deleted_evicted])
+            forget_media_files(db, [os.path.basename(p) for p in deleted_orphans + deleted_evicted])
+            thumbnail_bytes = evict_thumbnail_cache()
+        finally:
+            db.close()
+
+        _last_report = {
+            "finished_at": datetime.utcnow().isoformat(),
+            "orphans_deleted": len(deleted_orphans),
+            "evicted": len(deleted_evicted),
+            "reclaimed_bytes": orphan_bytes + evicted_bytes,
+            "total_bytes": total_bytes,
+            "thumbnail_bytes_evicted": thumbnail_bytes,
+            "elapsed_seconds": round(time.time() - started, 2),
+        }
+        if deleted_orphans or deleted_evicted:
+            print(
+                f"[GC] 删除孤儿文件 {len(deleted_orphans)} 个，淘汰旧媒体 {len(deleted_evicted)} 个，"
+                f"回收 {_last_report['reclaimed_bytes'] / 1024 / 1024:.1f} MB"
+            )
+        return _last_report
+
+
+def get_last_report():
+    """最近一次回收报告（本进程内）"""
+    return _last_report
+
+
+def start_media_gc_daemon():
+    """启动媒体回收守护线程"""
+    _stop_flag.clear()
+
+    def daemon_loop():
+        while not _stop_flag.is_set():
+            try:
+                run_media_gc()
+            except Exception as e:
+                print(f"[GC] 回收出错: {e}")
+            # 按周期等待，但每秒检查停止标志
+            for _ in range(int(MEDIA_GC_CONFIG["interval_seconds"])):
+                if _stop_flag.is_set():
+                    break
+                time.sleep(1)
+
+    thread = threading.Thread(target=daemon_loop, daemon=True)
+    thread.start()
+    print("[GC] 媒体回收守护线程已启动")
+
+
+def stop_media_gc_daemon():
+    """停止媒体回收守护线程"""
+    _stop_flag.set()
+    print("[GC] 媒体回收守护线程已停止")
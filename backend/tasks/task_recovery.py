@@ -8,9 +8,11 @@ from database import SessionLocal
 from models import Message, TaskStatus
 from services.provider_factory import get_provider
 from services.base_provider import TaskState
-from config import POLL_CONFIG, SERVER_CONFIG
-import requests
-import os
+from services.session_summary import refresh_session_summary
+from services.video_download import download_video
+from services.media_processing import process_downloaded_video
+from services.metrics import PollTracker, TASK_POLLS
+from config import POLL_CONFIG
 
 # 全局停止标志
 _stop_flag = threading.Event()
@@ -20,11 +22,13 @@ def poll_single_task(message_id: int, task_id: str):
     """轮询单个任务"""
     provider = get_provider()
     db = SessionLocal()
+    polling = PollTracker("recovery")
     
     try:
         for _ in range(POLL_CONFIG["max_attempts"]):
             time.sleep(POLL_CONFIG["interval_seconds"])
             
+            polling.poll()
             try:
                 result = provider.query_task(task_id)
             except Exception as e:
@@ -43,43 +47,45 @@ def poll_single_task(message_id: int, task_id: str):
                 # 下载视频
                 if result.video_url:
                     try:
-                        downloads_dir = SERVER_CONFIG["downloads_dir"]
-                        os.makedirs(downloads_dir, exist_ok=True)
-                        video_filename = f"{task_id}.mp4"
-                        local_path = os.path.join(downloads_dir, video_filename)
-                        
-                        response = requests.get(result.video_url, timeout=120)
-                        response.raise_for_status()
-                        with open(local_path, "wb") as f:
-                            f.write(response.content)
-                        message.local_path = video_filename
+                        message.local_path = download_video(result.video_url, task_id)
                     except Exception as e:
                         print(f"[Recovery] 下载视频失败: {e}")
                 
+                refresh_session_summary(db, message.session_id)
                 db.commit()
                 print(f"[Recovery] 任务 {task_id} 完成")
+                polling.outcome = "success"
+                # 下载完成后生成封面帧、尾帧和元数据
+                if message.local_path:
+                    process_downloaded_video(message_id)
                 break
                 
             elif result.state == TaskState.FAILED:
                 message.status = TaskStatus.FAILED
                 message.error_message = result.error_message
+                refresh_session_summary(db, message.session_id)
                 db.commit()
                 print(f"[Recovery] 任务 {task_id} 失败: {result.error_message}")
+                polling.outcome = "failed"
                 break
                 
             elif result.state == TaskState.PROCESSING:
                 if message.status != TaskStatus.PROCESSING:
                     message.status = TaskStatus.PROCESSING
+                    refresh_session_summary(db, message.session_id)
                     db.commit()
                     
     except Exception as e:
+        polling.outcome = "error"
         print(f"[Recovery] 轮询任务 {task_id} 出错: {e}")
         message = db.query(Message).filter(Message.id == message_id).first()
         if message:
             message.status = TaskStatus.FAILED
             message.error_message = f"轮询出错: {str(e)}"
+            refresh_session_summary(db, message.session_id)
             db.commit()
     finally:
+        polling.finish()
         db.close()
 
 
@@ -151,6 +157,7 @@ def poll_single_task_once(message_id: int, task_id: str):
     provider = get_provider()
     db = SessionLocal()
     try:
+        TASK_POLLS.labels(source="daemon").inc()
         result = provider.query_task(task_id)
         
         message = db.query(Message).filter(Message.id == message_id).first()
@@ -161,31 +168,27 @@ def poll_single_task_once(message_id: int, task_id: str):
             print(f"[Recovery] 任务 {task_id} 变更为成功")
             message.status = TaskStatus.SUCCESS
             message.video_url = result.video_url
-            # 下载视频逻辑...
+            # 下载视频（已下载过的文件不会重复下载）
             if result.video_url:
                 try:
-                    downloads_dir = SERVER_CONFIG["downloads_dir"]
-                    os.makedirs(downloads_dir, exist_ok=True)
-                    video_filename = f"{task_id}.mp4"
-                    local_path = os.path.join(downloads_dir, video_filename)
-                    if not os.path.exists(local_path): # 避免重复下载
-                        response = requests.get(result.video_url, timeout=120)
-                        response.raise_for_status()
-                        with open(local_path, "wb") as f:
-                            f.write(response.content)
-                        message.local_path = video_filename
+                    message.local_path = download_video(result.video_url, task_id)
                 except Exception as e:
                     print(f"[Recovery] 下载视频失败: {e}")
+            refresh_session_summary(db, message.session_id)
             db.commit()
+            if message.local_path:
+                process_downloaded_video(message_id)
             
         elif result.state == TaskState.FAILED and message.status != TaskStatus.FAILED:
             print(f"[Recovery] 任务 {task_id} 变更为失败")
             message.status = TaskStatus.FAILED
             message.error_message = result.error_message
+            refresh_session_summary(db, message.session_id)
             db.commit()
             
         elif result.state == TaskState.PROCESSING and message.status != TaskStatus.PROCESSING:
              message.status = TaskStatus.PROCESSING
+             refresh_session_summary(db, message.session_id)
              db.commit()
              
     except Exception as e:
@@ -21,8 +21,11 @@ export async function deleteSession(id: number): Promise<void> {
   await api.delete(`/sessions/${id}`)
 }
 
-export async function getSessionMessages(sessionId: number): Promise<Message[]> {
-  const { data } = await api.get(`/sessions/${sessionId}/messages`)
+// fields：只取部分字段（id 总是返回），如轮询时只取 ['status', 'video_url']
+export async function getSessionMessages(sessionId: number, fields?: (keyof Message)[]): Promise<Message[]> {
+  const { data } = await api.get(`/sessions/${sessionId}/messages`, {
+    params: fields ? { fields: fields.join(',') } : undefined,
+  })
   return data
 }
 
@@ -70,6 +73,97 @@ export async function imageToVideo(
   return data
 }
 
+// 批量生成视频（提示词 × 比例 × 时长）
+export interface VideoBatchResponse {
+  batch_id: string
+  total: number
+  message_ids: number[]
+}
+
+export interface VideoBatchProgress {
+  batch_id: string
+  total: number
+  pending: number
+  queued: number
+  processing: number
+  success: number
+  failed: number
+  done: boolean
+  items: {
+    message_id: number
+    status: string
+    prompt: string | null
+    aspect_ratio: string
+    duration: string
+    task_id: string | null
+    video_url: string | null
+    error_message: string | null
+  }[]
+}
+
+export async function createVideoBatch(
+  sessionId: number,
+  prompts: string[],
+  aspectRatios: string[] = ['9:16'],
+  durations: string[] = ['10'],
+  imageUrl?: string
+): Promise<VideoBatchResponse> {
+  const { data } = await api.post('/generate/batch', {
+    session_id: sessionId,
+    prompts,
+    aspect_ratios: aspectRatios,
+    durations,
+    image_url: imageUrl,
+  })
+  return data
+}
+
+export async function getVideoBatch(batchId: string): Promise<VideoBatchProgress> {
+  const { data } = await api.get(`/generate/batch/${batchId}`)
+  return data
+}
+
+// 从视频尾帧续写：逐段生成后拼接为一个视频
+export interface VideoChainResponse {
+  chain_id: string
+  segments: number
+}
+
+export interface VideoChainProgress {
+  chain_id: string
+  status: 'running' | 'stitching' | 'completed' | 'failed' | 'interrupted'
+  total_segments: number
+  current_segment: number
+  segments: VideoBatchProgress['items']
+  output_message_id: number | null
+  output_url: string | null
+  error: string | null
+}
+
+export async function createVideoChain(
+  sessionId: number,
+  sourceMessageId: number,
+  prompts: string[],
+  aspectRatio: string = '9:16',
+  duration: string = '10',
+  includeSource: boolean = true
+): Promise<VideoChainResponse> {
+  const { data } = await api.post('/generate/chain', {
+    session_id: sessionId,
+    source_message_id: sourceMessageId,
+    prompts,
+    aspect_ratio: aspectRatio,
+    duration,
+    include_source: includeSource,
+  })
+  return data
+}
+
+export async function getVideoChain(chainId: string): Promise<VideoChainProgress> {
+  const { data } = await api.get(`/generate/chain/${chainId}`)
+  return data
+}
+
 export interface TaskStatus {
   message_id: number
   status: string
@@ -82,7 +176,7 @@ export async function getTaskStatus(messageId: number): Promise<TaskStatus> {
   return data
 }
 
-export async function uploadImage(file: File): Promise<{ filename: string; url: string; public_url: string | null }> {
+export async function uploadImage(file: File): Promise<{ filename: string; url: string; public_url: string | null; publish_pending: boolean }> {
   const formData = new FormData()
   formData.append('file', file)
   const { data } = await api.post('/generate/upload-image', formData, {
@@ -120,3 +214,47 @@ export async function imageToImage(
   }, { timeout: 180000 })
   return data
 }
+
+// 批量生成图片：每完成一张推送一行 JSON（NDJSON）
+export type ImageBatchEvent =
+  | { type: 'batch'; count: number; user_message_ids: number[] }
+  | { type: 'result'; index: number; message_id: number; status: string; image_url?: string; error?: string }
+  | { type: 'error'; detail: string }
+  | { type: 'done'; succeeded: number; failed: number }
+
+export async function generateImageBatch(
+  sessionId: number,
+  options: { prompt?: string; prompts?: string[]; count?: number; referenceImage?: string },
+  onEvent: (event: ImageBatchEvent) => void
+): Promise<void> {
+  // axios 不支持逐块读取响应，这里使用 fetch
+  const response = await fetch('/api/image/batch', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({
+      session_id: sessionId,
+      prompt: options.prompt,
+      prompts: options.prompts,
+      count: options.count,
+      reference_image: options.referenceImage,
+    }),
+  })
+  if (!response.ok || !response.body) {
+    const data = await response.json().catch(() => ({}))
+    throw new Error(data.detail || `批量生成失败: ${response.status}`)
+  }
+
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  while (true) {
+    const { done, value } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+    const lines = buffer.split('\n')
+    buffer = lines.pop() || ''
+    for (const line of lines) {
+      if (line.trim()) onEvent(JSON.parse(line))
+    }
+  }
+}
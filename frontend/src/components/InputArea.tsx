@@ -75,8 +75,10 @@ export function InputArea({ featureType, onFeatureTypeChange, mode, onModeChange
     setUploading(true)
     try {
       const result = await api.uploadImage(file)
-      setImageUrl(result.public_url || result.url)
-      if (!result.public_url) {
+      // 始终传本地URL：提交图生视频时服务端再换成签名URL或图床URL（必要时等待后台发布完成），
+      // 消息里保存的也是不会过期的本地地址
+      setImageUrl(result.url)
+      if (!result.public_url && !result.publish_pending) {
         console.warn('图床上传失败，使用本地URL（可能导致API调用失败）')
       }
     } catch (e) {
@@ -39,25 +39,15 @@ export function MessageBubble({ message, onEdit }: MessageBubbleProps) {
     setExtracting(true)
     setCopySuccess(false)
     try {
-      // 调用后端 API 提取尾帧
-      const response = await fetch(`/api/generate/extract-frame?video_url=${encodeURIComponent(message.video_url)}`)
+      // 调用后端 API 提取尾帧（直接返回 PNG 二进制，剪贴板只支持 PNG）
+      const response = await fetch(`/api/generate/extract-frame/image?format=png&video_url=${encodeURIComponent(message.video_url)}`)
       
       if (!response.ok) {
         const err = await response.json()
         throw new Error(err.detail || '提取失败')
       }
       
-      const data = await response.json()
-      
-      // 将 base64 转换为 blob
-      const base64Data = data.image.split(',')[1]
-      const byteCharacters = atob(base64Data)
-      const byteNumbers = new Array(byteCharacters.length)
-      for (let i = 0; i < byteCharacters.length; i++) {
-        byteNumbers[i] = byteCharacters.charCodeAt(i)
-      }
-      const byteArray = new Uint8Array(byteNumbers)
-      const blob = new Blob([byteArray], { type: 'image/png' })
+      const blob = await response.blob()
       
       // 复制到剪贴板
       try {
@@ -120,7 +110,7 @@ export function MessageBubble({ message, onEdit }: MessageBubbleProps) {
               {/* 参考图片（小图） */}
               {message.reference_image && (
                 <img
-                  src={message.reference_image}
+                  src={message.reference_image_variants?.['256'] || message.reference_image}
                   alt="参考图片"
                   className="w-10 h-10 rounded-lg object-cover border border-border"
                 />
@@ -165,7 +155,11 @@ export function MessageBubble({ message, onEdit }: MessageBubbleProps) {
             {message.status === 'success' && message.content_type === 'image' && message.video_url && (
               <div className="space-y-3">
                 <img
-                  src={message.video_url}
+                  src={message.image_variants?.['512'] || message.video_url}
+                  srcSet={message.image_variants
+                    ? Object.entries(message.image_variants).map(([width, url]) => `${url} ${width}w`).join(', ')
+                    : undefined}
+                  sizes="448px"
                   alt="生成的图片"
                   className="w-full rounded-lg cursor-pointer hover:opacity-90 transition-opacity"
                   style={{ maxHeight: '400px', objectFit: 'contain' }}
@@ -233,6 +227,7 @@ export function MessageBubble({ message, onEdit }: MessageBubbleProps) {
                   <video
                     id={`video-${message.id}`}
                     src={message.video_url}
+                    poster={message.poster_url || undefined}
                     controls={isPlaying}
                     className="w-full rounded-lg"
                     style={{ maxHeight: '400px' }}
@@ -4,6 +4,12 @@ export interface Session {
   title: string
   created_at: string
   updated_at: string
+  message_count: number
+  pending_count: number
+  last_message_preview: string | null
+  last_message_at: string | null
+  last_media_url: string | null
+  last_media_type: 'image' | 'video' | null
 }
 
 // 消息类型
@@ -23,6 +29,16 @@ export interface Message {
   aspect_ratio: string
   duration: string
   created_at: string
+  poster_url?: string | null
+  last_frame_url?: string | null
+  video_duration?: number | null
+  video_fps?: number | null
+  video_width?: number | null
+  video_height?: number | null
+  video_bytes?: number | null
+  image_variants?: Record<string, string> | null  // 生成图片的缩略图，键为宽度
+  reference_image_variants?: Record<string, string> | null  // 参考图片的缩略图
+  batch_id?: string | null  // 批量生成的批次ID
 }
 
 // 生成模式